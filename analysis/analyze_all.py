@@ -0,0 +1,200 @@
+import os
+import argparse
+from kpt_analyzer import KPTAnalyzer
+from negative_analyzer import NegativeAnalyzer
+from negative_list_generator import NegativeListGenerator
+from negative_summary import NegativeSummaryGenerator
+from positive_list_generator import PositiveListGenerator
+from pattern_matcher import CombinedMatcher
+from slack_export_reader import add_filter_arguments, open_messages
+from checkpoint import Checkpoint
+from tokenizer import NounTokenizer, add_mecab_arguments, apply_mecab_arguments, clean_text
+from token_cache import DEFAULT_MAX_BYTES
+from topk_counter import DEFAULT_CAPACITY
+from profiler import NULL_PROFILER, add_profile_arguments, create_profiler, write_profile
+from report_stream import RecordStream, add_record_arguments, open_records
+from near_duplicates import add_near_duplicate_arguments, create_near_duplicate_filter
+import wordcloud_generator
+
+# 各レポートの出力ファイル名
+REPORT_FILES = {
+    'kpt': 'kpt_report.md',
+    'negative': 'negative_report.md',
+    'negative_list': 'negative_list.md',
+    'negative_summary': 'negative_summary.md',
+    'positive_list': 'positive_list.md',
+    'wordcloud': 'wordcloud.png'
+}
+
+# ほぼ同じ内容のメッセージをまとめた場合の集約結果の出力ファイル名
+NEAR_DUPLICATES_FILE = 'near_duplicates.md'
+
+
+class UnifiedAnalyzer:
+    """エクスポートを1回だけ読み込み、全分析をまとめて実行する
+
+    メッセージの読み出し・形態素解析・キーワードパターンの走査を1回ずつ行い、
+    その結果を各分析の集計に振り分ける。
+    """
+
+    def __init__(self, token_cache=None, token_cache_max_bytes=DEFAULT_MAX_BYTES, workers=1, merge_contexts=True,
+                 keyword_capacity=DEFAULT_CAPACITY):
+        self.tokenizer = NounTokenizer(token_cache, token_cache_max_bytes, workers=workers)
+        self.kpt = KPTAnalyzer(keyword_capacity=keyword_capacity)
+        self.analyzers = {
+            'kpt': self.kpt,
+            'negative': NegativeAnalyzer(),
+            'negative_list': NegativeListGenerator(merge_contexts=merge_contexts),
+            'negative_summary': NegativeSummaryGenerator(merge_contexts=merge_contexts),
+            'positive_list': PositiveListGenerator(merge_contexts=merge_contexts)
+        }
+        # 全分析のパターンを1つのマッチャーにまとめる
+        self.matcher = CombinedMatcher({name: analyzer.matcher for name, analyzer in self.analyzers.items()})
+
+    def analyze(self, messages, checkpoint=None, profiler=NULL_PROFILER, records=None):
+        """メッセージを1回走査して全分析の集計結果を返す
+
+        records を指定すると、走査しながら各分析のヒットと集計をレコードとして書き出す
+        （チェックポイント利用時は今回処理したメッセージの分のみ）。
+        """
+        states = {name: analyzer.create_state() for name, analyzer in self.analyzers.items()}
+        if checkpoint is not None:
+            # 前回までの集計を引き継ぎ、新しいメッセージだけを処理する
+            for name, analyzer in self.analyzers.items():
+                states[name] = checkpoint.restore(name, analyzer.state_from_dict, states[name])
+            messages = profiler.iterate('checkpoint', checkpoint.new_messages(messages))
+
+        # 形態素解析はワードクラウドと同じ前処理済みの本文に対して1回だけ行う
+        scan = profiler.wrap('scan', self.matcher.scan)
+        updates = {name: profiler.wrap(f'aggregate:{name}', analyzer.update_state)
+                   for name, analyzer in self.analyzers.items()}
+        streamed = ('negative', 'negative_list', 'negative_summary', 'positive_list')
+        streams = {name: RecordStream(name, records=records) for name in streamed} if records is not None else None
+        tokenized = self.tokenizer.tokenize_messages(messages, preprocess=clean_text)
+        for message, nouns in profiler.iterate('tokenize', tokenized):
+            hits = scan(message.text)
+            updates['kpt'](states['kpt'], message, hits['kpt'], nouns)
+            for name in streamed:
+                added = updates[name](states[name], message, hits[name])
+                if streams is not None:
+                    streams[name].write_entries(added)
+        with profiler.stage('tokenize'):
+            self.tokenizer.flush()
+        if streams is not None:
+            for stream in streams.values():
+                stream.close()
+
+        if checkpoint is not None:
+            with profiler.stage('checkpoint'):
+                for name, analyzer in self.analyzers.items():
+                    checkpoint.store(name, analyzer.state_to_dict(states[name]))
+                checkpoint.save()
+        return states
+
+    def recount_keywords(self, states, messages):
+        """キーワードの推定回数に誤差がある場合は、上位の候補だけを正確に数え直す
+
+        messages には集計時と同じメッセージをもう一度渡す。
+        """
+        tokenized = self.tokenizer.tokenize_messages(messages, preprocess=clean_text)
+        self.kpt.recount_keywords(states['kpt'], (nouns for _, nouns in tokenized))
+
+    def merge_states(self, states, other):
+        """別の集計結果（他のチャンネルなど）を states に加える"""
+        for name, analyzer in self.analyzers.items():
+            analyzer.merge_state(states[name], other[name])
+
+    def write_reports(self, states, output_dir, profiler=NULL_PROFILER):
+        """集計結果から全レポートを書き出す"""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {name: os.path.join(output_dir, filename) for name, filename in REPORT_FILES.items()}
+
+        with profiler.stage('write'):
+            self.analyzers['kpt'].write_report(states['kpt'], paths['kpt'])
+            self.analyzers['negative'].write_report(states['negative'], paths['negative'])
+            self.analyzers['negative_list'].write_list(states['negative_list'], paths['negative_list'])
+            self.analyzers['negative_summary'].write_summary(states['negative_summary'], paths['negative_summary'])
+            self.analyzers['positive_list'].write_list(states['positive_list'], paths['positive_list'])
+        # ワードクラウドはKPTと共通の名詞の出現回数（上位の推定回数）から生成する
+        keyword_counts = states['kpt']['keyword_counts'].counts
+        wordcloud_generator.generate_wordcloud_from_frequencies(keyword_counts, paths['wordcloud'], profiler=profiler)
+        return paths
+
+    def run(self, markdown_file, output_dir, checkpoint=None, since=None, until=None, users=None,
+            profiler=NULL_PROFILER, records=None, near_duplicates=None):
+        """エクスポート（またはメッセージストアの期間・ユーザーの範囲）を分析して全レポートを出力
+
+        near_duplicates（NearDuplicateFilter）を指定すると、ほぼ同じ内容のメッセージは代表の1件だけを分析し、
+        まとめた件数を near_duplicates.md に出力する。
+        """
+        messages = profiler.iterate('read', open_messages(markdown_file, since, until, users))
+        if near_duplicates is not None:
+            messages = profiler.iterate('near_duplicates', near_duplicates.filter(messages))
+        states = self.analyze(messages, checkpoint, profiler, records)
+        if checkpoint is None:
+            # キーワードの推定回数に誤差がある場合は、上位の候補だけを正確に数え直す
+            with profiler.stage('recount'):
+                messages = open_messages(markdown_file, since, until, users)
+                if near_duplicates is not None:
+                    # 同じ設定のフィルターは同じ代表を選ぶため、集計時と同じメッセージになる
+                    messages = near_duplicates.empty_copy().filter(messages)
+                self.recount_keywords(states, messages)
+        paths = self.write_reports(states, output_dir, profiler)
+        if near_duplicates is not None:
+            paths['near_duplicates'] = os.path.join(output_dir, NEAR_DUPLICATES_FILE)
+            near_duplicates.write_report(paths['near_duplicates'])
+        return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Slack履歴に対して全分析を1回の読み込みでまとめて実行')
+    parser.add_argument('input_file', help='入力マークダウンファイル・メッセージストア・Slack のエクスポートの ZIP のパス')
+    parser.add_argument('--output-dir', '-o', default='reports', help='レポートの出力ディレクトリ')
+    parser.add_argument('--token-cache', help='形態素解析結果のキャッシュファイルのパス')
+    parser.add_argument('--token-cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='キャッシュの上限サイズ（MB）')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析を並列実行するプロセス数')
+    parser.add_argument('--no-merge', action='store_true', help='重なり合う文脈をまとめず、同一の文脈のみを除外する')
+    parser.add_argument('--keyword-capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='キーワードの集計で追跡する語の数（超えた分は上位の推定に切り替わる）')
+    parser.add_argument('--checkpoint', help='集計状態を保存するチェックポイントファイルのパス（前回以降のメッセージのみ処理）')
+    add_filter_arguments(parser)
+    parser.add_argument('--max-memory', type=int,
+                        help='メモリ使用量の目安の上限（MB）。指定すると入力をチャンクに分けて集計し、結果をまとめて出力する')
+    add_profile_arguments(parser)
+    add_mecab_arguments(parser)
+    add_record_arguments(parser)
+    add_near_duplicate_arguments(parser)
+    args = parser.parse_args()
+    apply_mecab_arguments(args)
+    if args.max_memory is not None and args.checkpoint:
+        parser.error('--max-memory と --checkpoint は同時に指定できません')
+
+    analyzer = UnifiedAnalyzer(args.token_cache, args.token_cache_size * 1024 * 1024,
+                               workers=args.workers, merge_contexts=not args.no_merge,
+                               keyword_capacity=args.keyword_capacity)
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    profiler = create_profiler(args)
+    records = open_records(args)
+    near_duplicates = create_near_duplicate_filter(args)
+    if args.max_memory is not None:
+        # 分割実行は analyze_all の REPORT_FILES を使うため、ここで読み込む
+        from chunked_analysis import ChunkedAnalyzer
+        chunked = ChunkedAnalyzer(analyzer, args.max_memory * 1024 * 1024)
+        paths = chunked.run(args.input_file, args.output_dir, args.since, args.until, args.users,
+                            profiler, records, near_duplicates)
+        print(f'{chunked.chunks}個のチャンクに分けて集計しました')
+    else:
+        paths = analyzer.run(args.input_file, args.output_dir, checkpoint, args.since, args.until, args.users,
+                             profiler, records, near_duplicates)
+    for path in paths.values():
+        print(f'レポートを生成しました: {path}')
+    if near_duplicates is not None:
+        print(near_duplicates.summary())
+    if records is not None:
+        records.close()
+        print(f'レコードを保存しました: {args.records}')
+    write_profile(profiler, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from analyze_all import UnifiedAnalyzer
+from message_store import channel_from_filename, is_message_store
+from slack_archive_reader import SlackArchive, is_slack_archive
+from slack_export_reader import add_filter_arguments, open_messages
+from topk_counter import DEFAULT_CAPACITY, SpaceSavingCounter
+from tokenizer import add_mecab_arguments, apply_mecab_arguments, configure_mecab, mecab_paths
+from trend_aggregator import TrendCounter
+
+# チャンネル横断のサマリーの出力ファイル名
+SUMMARY_FILE = 'summary.md'
+
+# サマリーに載せるネガティブ表現の多いチャンネル数
+DEFAULT_TOP_CHANNELS = 20
+
+# サマリーにカテゴリ別件数を載せる、文脈を重複なくリストにする分析
+SUMMARY_LISTS = ('negative_list', 'positive_list')
+
+# ワーカープロセスごとの分析器（プロセスの起動時に1回だけ生成する）
+_worker_analyzer = None
+
+
+def archive_channels(path):
+    """Slack の公式エクスポートの ZIP 内のチャンネルを {チャンネル: `ZIP/チャンネル`} で返す"""
+    archive = SlackArchive(path)
+    try:
+        return {channel: os.path.join(path, channel) for channel in archive.channels}
+    finally:
+        archive.close()
+
+
+def find_exports(directory):
+    """ディレクトリ内のエクスポート（.md・ZIP）とメッセージストアを、チャンネルごとのパスのリストにまとめる
+
+    同じチャンネルの期間違いのエクスポートは、ファイル名順に1つのチャンネルとして扱う。
+    Slack の公式エクスポートの ZIP はフォルダごとに1チャンネルとし、ディレクトリの代わりに
+    ZIP を1つ指定することもできる。
+    """
+    if os.path.isfile(directory) and is_slack_archive(directory):
+        return {channel: [path] for channel, path in sorted(archive_channels(directory).items())}
+
+    channels = defaultdict(list)
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if is_message_store(path):
+            channels[name].append(path)
+        elif name.endswith('.md') and os.path.isfile(path):
+            channels[channel_from_filename(path)].append(path)
+        elif is_slack_archive(path):
+            for channel, channel_path in archive_channels(path).items():
+                channels[channel].append(channel_path)
+    return dict(sorted(channels.items()))
+
+
+def read_channel(paths, since=None, until=None, users=None):
+    """チャンネルの全エクスポートのメッセージを順に読み出す"""
+    return chain.from_iterable(open_messages(path, since, until, users) for path in paths)
+
+
+def analyze_channel(analyzer, channel, paths, output_dir, filters, keep_contexts=False):
+    """1チャンネルを分析してレポートを書き出し、(メッセージ数, 集計の辞書) を返す
+
+    keep_contexts が True の場合は文脈を含む集計状態の辞書を、False の場合は
+    サマリー用の集計（summary_aggregates）の辞書だけを返す。
+    """
+    message_count = 0
+
+    def counted(messages):
+        nonlocal message_count
+        for message in messages:
+            message_count += 1
+            yield message
+
+    states = analyzer.analyze(counted(read_channel(paths, *filters)))
+    analyzer.recount_keywords(states, read_channel(paths, *filters))
+    analyzer.write_reports(states, os.path.join(output_dir, channel))
+    # 親プロセスに返すため、チェックポイントと同じ辞書形式に変換する
+    if keep_contexts:
+        return message_count, {name: analyzer.analyzers[name].state_to_dict(state) for name, state in states.items()}
+    return message_count, aggregates_to_dict(summary_aggregates(states))
+
+
+def summary_aggregates(states):
+    """集計状態からサマリーに必要な集計だけを取り出す
+
+    文脈は含めず、文脈の重複を除いたカテゴリ別件数はダイジェストの集合で求める。
+    """
+    return {
+        'negative_trends': states['negative']['trends'],
+        'kpt_trends': states['kpt']['trends'],
+        'keyword_counts': states['kpt']['keyword_counts'],
+        'digests': {name: states[name].digests() for name in SUMMARY_LISTS}
+    }
+
+
+def merge_aggregates(aggregates, other):
+    """別のチャンネルのサマリー用の集計を aggregates に加える（文脈はダイジェストの和集合で重複を除く）"""
+    aggregates['negative_trends'].merge(other['negative_trends'])
+    aggregates['kpt_trends'].merge(other['kpt_trends'])
+    aggregates['keyword_counts'].merge(other['keyword_counts'])
+    for name, digests in other['digests'].items():
+        for category, keys in digests.items():
+            aggregates['digests'][name].setdefault(category, set()).update(keys)
+
+
+def aggregates_to_dict(aggregates):
+    """サマリー用の集計をプロセス間で受け渡す辞書に変換"""
+    return {
+        'negative_trends': aggregates['negative_trends'].to_dict(),
+        'kpt_trends': aggregates['kpt_trends'].to_dict(),
+        'keyword_counts': aggregates['keyword_counts'].to_dict(),
+        'digests': aggregates['digests']
+    }
+
+
+def aggregates_from_dict(data):
+    """aggregates_to_dict の辞書から復元"""
+    return {
+        'negative_trends': TrendCounter.from_dict(data['negative_trends']),
+        'kpt_trends': TrendCounter.from_dict(data['kpt_trends']),
+        'keyword_counts': SpaceSavingCounter.from_dict(data['keyword_counts']),
+        'digests': data['digests']
+    }
+
+
+def category_totals(trends):
+    """TrendCounter のキーごとのヒット件数を辞書で返す"""
+    return dict(zip(trends.labels, trends.totals().tolist()))
+
+
+def _init_worker(options, mecab):
+    global _worker_analyzer
+    # 親プロセスで指定された辞書・設定ファイルを使う（fork 以外の起動方式でも引き継ぐ）
+    configure_mecab(*mecab)
+    _worker_analyzer = UnifiedAnalyzer(**options)
+
+
+def _analyze_channel(channel, paths, output_dir, filters, keep_contexts):
+    return analyze_channel(_worker_analyzer, channel, paths, output_dir, filters, keep_contexts)
+
+
+class BatchAnalyzer:
+    """ディレクトリ内のチャンネルごとのエクスポートを並列に分析し、チャンネル横断の集計をまとめる
+
+    各チャンネルはワーカープロセスで UnifiedAnalyzer により分析してレポートを書き出し、
+    サマリー用の集計（推移・キーワードのカウンターと文脈のダイジェスト）だけを親プロセスに返す。
+    チャンネル横断の集計は、返された集計をまとめて求める（エクスポートを読み直さない）。
+    全チャンネルをまとめたレポートを出力する場合のみ、文脈を含む集計状態を返して merge_state でまとめる。
+    同時に処理中のチャンネルはワーカー数の2倍までとし、結果はチャンネル名順に
+    まとめるため、完了順によらず同じサマリーになる。
+    """
+
+    def __init__(self, workers=1, merge_contexts=True, keyword_capacity=DEFAULT_CAPACITY):
+        self.workers = workers
+        # ワーカーごとの分析器の設定（形態素解析のキャッシュはプロセス間で共有できないため使わない）
+        self.options = {'merge_contexts': merge_contexts, 'keyword_capacity': keyword_capacity}
+        self.analyzer = UnifiedAnalyzer(**self.options)
+
+    def iter_results(self, channels, output_dir, filters, keep_contexts=False):
+        """チャンネルごとの (チャンネル名, メッセージ数, 集計の辞書) をチャンネル名順に返す"""
+        if self.workers <= 1:
+            for channel, paths in channels.items():
+                yield (channel, *analyze_channel(self.analyzer, channel, paths, output_dir, filters, keep_contexts))
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.options, mecab_paths())) as executor:
+            pending = deque()
+            for channel, paths in channels.items():
+                pending.append((channel, executor.submit(_analyze_channel, channel, paths, output_dir, filters,
+                                                         keep_contexts)))
+                if len(pending) >= self.workers * 2:
+                    channel, future = pending.popleft()
+                    yield (channel, *future.result())
+            while pending:
+                channel, future = pending.popleft()
+                yield (channel, *future.result())
+
+    def channel_stats(self, channel, message_count, negative_trends, kpt_trends):
+        """サマリー用のチャンネルごとの件数"""
+        return {
+            'channel': channel,
+            'messages': message_count,
+            'negative': int(negative_trends.totals().sum()),
+            'problem': category_totals(kpt_trends).get('problem', 0)
+        }
+
+    def run(self, directory, output_dir, since=None, until=None, users=None, merged_dir=None,
+            top_channels=DEFAULT_TOP_CHANNELS):
+        """ディレクトリ内の全チャンネルを分析し、サマリーのパスを返す"""
+        channels = find_exports(directory)
+        if not channels:
+            raise ValueError(f'エクスポートが見つかりません: {directory}')
+
+        analyzers = self.analyzer.analyzers
+        # まとめたレポートを出力する場合のみ、文脈を含む集計状態を受け取ってまとめる
+        keep_contexts = bool(merged_dir)
+        merged = None
+        stats = []
+        for channel, message_count, data in self.iter_results(channels, output_dir, (since, until, users), keep_contexts):
+            if keep_contexts:
+                states = {name: analyzers[name].state_from_dict(state) for name, state in data.items()}
+                stats.append(self.channel_stats(channel, message_count, states['negative']['trends'], states['kpt']['trends']))
+                if merged is None:
+                    merged = states
+                else:
+                    self.analyzer.merge_states(merged, states)
+            else:
+                aggregates = aggregates_from_dict(data)
+                stats.append(self.channel_stats(channel, message_count, aggregates['negative_trends'], aggregates['kpt_trends']))
+                if merged is None:
+                    merged = aggregates
+                else:
+                    merge_aggregates(merged, aggregates)
+            print(f'{channel}: {message_count}件を分析しました')
+
+        os.makedirs(output_dir, exist_ok=True)
+        summary_path = os.path.join(output_dir, SUMMARY_FILE)
+        if keep_contexts:
+            self.write_summary(summary_aggregates(merged), stats, summary_path, top_channels)
+            self.analyzer.write_reports(merged, merged_dir)
+        else:
+            self.write_summary(merged, stats, summary_path, top_channels)
+        return summary_path
+
+    def write_summary(self, aggregates, stats, output_file, top_channels=DEFAULT_TOP_CHANNELS):
+        """全チャンネルをまとめたサマリー用の集計（summary_aggregates）とチャンネルごとの件数からサマリーを書き出す"""
+        analyzers = self.analyzer.analyzers
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write('# チャンネル横断サマリー\n\n')
+
+            f.write('## 全体の概要\n')
+            f.write(f'- チャンネル数: {len(stats)}\n')
+            f.write(f'- メッセージ数: {sum(stat["messages"] for stat in stats)}件\n')
+            negative_totals = category_totals(aggregates['negative_trends'])
+            f.write(f'- ネガティブ表現: {sum(negative_totals.values())}件\n\n')
+
+            f.write('## KPTのカテゴリ別件数\n')
+            for category, count in category_totals(aggregates['kpt_trends']).items():
+                f.write(f'- {category.upper()}: {count}件\n')
+            f.write('\n')
+
+            # 文脈の重複を除いたカテゴリ別の発言数
+            for title, name, patterns in [
+                ('ネガティブ発言のカテゴリ別件数', 'negative_list', analyzers['negative_list'].negative_patterns),
+                ('ポジティブ発言のカテゴリ別件数', 'positive_list', analyzers['positive_list'].positive_patterns)
+            ]:
+                f.write(f'## {title}\n')
+                digests = aggregates['digests'][name]
+                for category in patterns:
+                    f.write(f'- {category}: {len(digests.get(category, ()))}件\n')
+                f.write('\n')
+
+            f.write('## ネガティブ表現の傾向\n')
+            # 同じ件数のパターンは辞書の定義順に並べる
+            trends = sorted(((pattern, count) for pattern, count in negative_totals.items() if count),
+                            key=lambda item: item[1], reverse=True)
+            for pattern, count in trends[:10]:
+                f.write(f'- {pattern}: {count}回\n')
+            f.write('\n')
+
+            f.write('## ネガティブ表現の多いチャンネル\n')
+            ranked = sorted(stats, key=lambda stat: stat['negative'], reverse=True)[:top_channels]
+            f.write('| チャンネル | メッセージ数 | ネガティブ表現 | 100件あたり | PROBLEM |\n')
+            f.write('|---|---:|---:|---:|---:|\n')
+            for stat in ranked:
+                rate = stat['negative'] * 100 / stat['messages'] if stat['messages'] else 0
+                f.write(f'| {stat["channel"]} | {stat["messages"]} | {stat["negative"]} | {rate:.1f} | {stat["problem"]} |\n')
+            f.write('\n')
+
+            f.write('## 主要キーワード\n')
+            for word, count, error in self.analyzer.kpt.report_keywords({'keyword_counts': aggregates['keyword_counts']}):
+                if error:
+                    f.write(f'- {word}: {count - error}〜{count}回\n')
+                else:
+                    f.write(f'- {word}: {count}回\n')
+            f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ディレクトリ内のチャンネルごとのエクスポートを並列に分析し、チャンネル横断のサマリーを作成')
+    parser.add_argument('input_dir', help='エクスポート（.md・Slack のエクスポートの ZIP）またはメッセージストアを置いたディレクトリ（ZIP 1つも可）')
+    parser.add_argument('--output-dir', '-o', default='reports', help='レポートの出力ディレクトリ（チャンネルごとのサブディレクトリに出力）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='同時に分析するチャンネル数（プロセス数）')
+    parser.add_argument('--no-merge', action='store_true', help='重なり合う文脈をまとめず、同一の文脈のみを除外する')
+    parser.add_argument('--keyword-capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='キーワードの集計で追跡する語の数（超えた分は上位の推定に切り替わる）')
+    parser.add_argument('--top-channels', type=int, default=DEFAULT_TOP_CHANNELS,
+                        help='サマリーに載せるネガティブ表現の多いチャンネル数')
+    parser.add_argument('--merged-dir', help='全チャンネルをまとめたレポートの出力ディレクトリ（指定した場合のみ出力）')
+    add_filter_arguments(parser)
+    add_mecab_arguments(parser)
+    args = parser.parse_args()
+    apply_mecab_arguments(args)
+
+    analyzer = BatchAnalyzer(args.workers, merge_contexts=not args.no_merge, keyword_capacity=args.keyword_capacity)
+    summary_path = analyzer.run(args.input_dir, args.output_dir, args.since, args.until, args.users,
+                                args.merged_dir, args.top_channels)
+    print(f'サマリーを生成しました: {summary_path}')
+
+if __name__ == '__main__':
+    main()
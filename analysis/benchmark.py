@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from synthetic_export import write_export
+
+BENCHMARK_VERSION = 1
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+# 起動時間を計測する slack-analyze のサブコマンド
+STARTUP_COMMANDS = ['all', 'kpt', 'negative', 'negative-list', 'negative-summary', 'positive-list', 'wordcloud']
+STARTUP_REPEAT = 5
+
+
+def peak_rss_mb():
+    """現在のプロセスの最大常駐メモリ（MB）"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト単位、Linux はキロバイト単位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# 各ターゲットの準備（モジュールの読み込み・初期化）を行い、計測対象の処理を返す
+def _prepare_kpt(input_file, output_dir):
+    from kpt_analyzer import KPTAnalyzer
+    analyzer = KPTAnalyzer()
+    return lambda: analyzer.generate_report(input_file, os.path.join(output_dir, 'kpt_report.md'))
+
+
+def _prepare_negative(input_file, output_dir):
+    from negative_analyzer import NegativeAnalyzer
+    analyzer = NegativeAnalyzer()
+    return lambda: analyzer.generate_report(input_file, os.path.join(output_dir, 'negative_report.md'))
+
+
+def _prepare_negative_list(input_file, output_dir):
+    from negative_list_generator import NegativeListGenerator
+    generator = NegativeListGenerator()
+    return lambda: generator.generate_list(input_file, os.path.join(output_dir, 'negative_list.md'))
+
+
+def _prepare_negative_summary(input_file, output_dir):
+    from negative_summary import NegativeSummaryGenerator
+    generator = NegativeSummaryGenerator()
+    return lambda: generator.generate_summary(input_file, os.path.join(output_dir, 'negative_summary.md'))
+
+
+def _prepare_positive_list(input_file, output_dir):
+    from positive_list_generator import PositiveListGenerator
+    generator = PositiveListGenerator()
+    return lambda: generator.generate_list(input_file, os.path.join(output_dir, 'positive_list.md'))
+
+
+def _prepare_wordcloud(input_file, output_dir):
+    import wordcloud_generator
+    from tokenizer import NounTokenizer
+    tokenizer = NounTokenizer()
+
+    def run():
+        frequencies = wordcloud_generator.build_tables(input_file, None, tokenizer)['all']
+        wordcloud_generator.generate_wordcloud_from_frequencies(frequencies, os.path.join(output_dir, 'wordcloud.png'))
+    return run
+
+
+def _prepare_analyze_all(input_file, output_dir):
+    from analyze_all import UnifiedAnalyzer
+    analyzer = UnifiedAnalyzer()
+    return lambda: analyzer.run(input_file, output_dir)
+
+
+TARGETS = {
+    'kpt': _prepare_kpt,
+    'negative': _prepare_negative,
+    'negative_list': _prepare_negative_list,
+    'negative_summary': _prepare_negative_summary,
+    'positive_list': _prepare_positive_list,
+    'wordcloud': _prepare_wordcloud,
+    'analyze_all': _prepare_analyze_all
+}
+
+
+def run_target(name, input_file, output_dir):
+    """ターゲットを現在のプロセスで実行し、準備時間・実行時間・最大メモリを返す"""
+    started = time.perf_counter()
+    task = TARGETS[name](input_file, output_dir)
+    prepared = time.perf_counter()
+    task()
+    finished = time.perf_counter()
+    return {
+        'startup_seconds': prepared - started,
+        'wall_seconds': finished - prepared,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def measure(name, input_file, messages):
+    """ターゲットを別プロセスで実行して計測（メモリを他のターゲットと分けて測るため）"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--run-target', name, '--input', input_file, '--output-dir', output_dir]
+        completed = subprocess.run(command, capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    result = {'target': name, 'messages': messages}
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        result['error'] = lines[-1] if lines else f'終了コード {completed.returncode}'
+        return result
+    result.update(json.loads(completed.stdout.strip().splitlines()[-1]))
+    result['messages_per_second'] = messages / result['wall_seconds'] if result['wall_seconds'] else None
+    return result
+
+
+def measure_startup(command, repeat=STARTUP_REPEAT):
+    """slack-analyze <サブコマンド> --help の実行時間（インタープリタの起動とモジュールの読み込み）を計測
+
+    ばらつきを抑えるため repeat 回のうち最短の時間を返す。
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slack_analyze.py')
+    elapsed = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, script, command, '--help'], capture_output=True, check=True)
+        elapsed.append(time.perf_counter() - started)
+    return {'command': command, 'startup_seconds': min(elapsed)}
+
+
+def prepare_inputs(sizes, seed, data_dir):
+    """件数ごとの合成エクスポートを用意（既にあれば再利用）"""
+    os.makedirs(data_dir, exist_ok=True)
+    inputs = {}
+    for size in sizes:
+        path = os.path.join(data_dir, f'synthetic_{size}_seed{seed}.md')
+        if not os.path.exists(path):
+            print(f'合成エクスポートを生成しています: {path}')
+            write_export(path, size, seed)
+        inputs[size] = os.path.abspath(path)
+    return inputs
+
+
+def compare(results, baseline, tolerance):
+    """前回の結果と比べ、処理速度・メモリが tolerance を超えて悪化したものを返す"""
+    previous = {(result['target'], result['messages']): result
+                for result in baseline['results'] if 'error' not in result}
+    regressions = []
+    for result in results:
+        before = previous.get((result['target'], result['messages']))
+        if before is None or 'error' in result:
+            continue
+        if result['messages_per_second'] < before['messages_per_second'] * (1 - tolerance):
+            regressions.append((result, before, '処理速度'))
+        if result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append((result, before, '最大メモリ'))
+    return regressions
+
+
+def compare_startup(startup, baseline, tolerance):
+    """前回の結果と比べ、起動時間が tolerance を超えて悪化したサブコマンドを返す"""
+    previous = {result['command']: result for result in baseline.get('startup', [])}
+    return [(result, previous[result['command']]) for result in startup
+            if result['command'] in previous
+            and result['startup_seconds'] > previous[result['command']]['startup_seconds'] * (1 + tolerance)]
+
+
+def run_benchmarks(targets, sizes, seed, data_dir, startup=True):
+    """各サブコマンドの起動時間と、全ターゲット × 全件数の処理を計測し、結果の辞書を返す"""
+    startup_results = []
+    if startup:
+        for command in STARTUP_COMMANDS:
+            result = measure_startup(command)
+            startup_results.append(result)
+            print(f'起動時間 {command}: {result["startup_seconds"]:.3f}秒')
+
+    inputs = prepare_inputs(sizes, seed, data_dir)
+    results = []
+    for size in sizes:
+        for name in targets:
+            result = measure(name, inputs[size], size)
+            results.append(result)
+            if 'error' in result:
+                print(f'{name} ({size}件): 失敗 - {result["error"]}')
+            else:
+                print(f'{name} ({size}件): {result["wall_seconds"]:.2f}秒, '
+                      f'{result["messages_per_second"]:.0f}件/秒, {result["peak_rss_mb"]:.1f}MB')
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'startup': startup_results,
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成エクスポートで各分析の処理速度とメモリ使用量を計測')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='計測するメッセージ数')
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS),
+                        help='計測する分析')
+    parser.add_argument('--seed', type=int, default=0, help='合成エクスポートの乱数シード')
+    parser.add_argument('--data-dir', default='benchmark_data', help='合成エクスポートの保存先')
+    parser.add_argument('--output', '-o', default='benchmark_results.json', help='計測結果（JSON）の出力先')
+    parser.add_argument('--baseline', help='比較する前回の計測結果（JSON）')
+    parser.add_argument('--no-startup', action='store_true', help='起動時間の計測を省略する')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='悪化とみなす割合（0.2 = 20%%）')
+    # 子プロセスで1つのターゲットを実行するための内部オプション
+    parser.add_argument('--run-target', choices=list(TARGETS), help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_target:
+        print(json.dumps(run_target(args.run_target, args.input, args.output_dir)))
+        return
+
+    report = run_benchmarks(args.targets, args.sizes, args.seed, args.data_dir, startup=not args.no_startup)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'計測結果を保存しました: {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.tolerance)
+        for result, before, metric in regressions:
+            print(f'悪化: {result["target"]} ({result["messages"]}件) の{metric} - '
+                  f'{before["messages_per_second"]:.0f} → {result["messages_per_second"]:.0f}件/秒, '
+                  f'{before["peak_rss_mb"]:.1f} → {result["peak_rss_mb"]:.1f}MB')
+        startup_regressions = compare_startup(report['startup'], baseline, args.tolerance)
+        for result, before in startup_regressions:
+            print(f'悪化: {result["command"]} の起動時間 - '
+                  f'{before["startup_seconds"]:.3f} → {result["startup_seconds"]:.3f}秒')
+        if regressions or startup_regressions:
+            sys.exit(1)
+        print('前回の計測結果からの悪化はありません')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+CHECKPOINT_VERSION = 4
+
+# 最後に処理した時刻より前でも、遅れて届いたメッセージとして受け付ける時間幅
+# （この幅の処理済みメッセージだけを記録し、それより古いものは保存時に捨てる）
+DEFAULT_OVERLAP = timedelta(hours=1)
+
+# 処理中に記録したメッセージの件数がこの値を超えるたびに、時間幅より古いものを捨てる
+PRUNE_INTERVAL = 10000
+
+
+def message_key(message):
+    """同一時刻のメッセージを区別するためのキー"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update((message.user or '').encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(message.text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """分析の集計状態と最後に処理したメッセージの時刻を保存するチェックポイント
+
+    1つのチェックポイントファイルは、同じ組み合わせの分析で使い続けることを前提とする。
+    時刻のないメッセージは、2回目以降の実行では処理対象にならない。
+    last_ts より overlap 以内に前の未処理のメッセージ（遅れて届いたもの）も処理するため、
+    その時間幅の処理済みメッセージの (時刻, キー) だけを記録する（記録は履歴の長さによらず一定）。
+    """
+
+    def __init__(self, path, overlap=DEFAULT_OVERLAP):
+        self.path = path
+        self.overlap = overlap
+        self.last_ts = None
+        # last_ts - overlap 以降に処理済みのメッセージの (時刻, キー)
+        self.boundary = set()
+        self.states = {}
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CHECKPOINT_VERSION:
+                raise ValueError(f'未対応のチェックポイント形式です: {path}')
+            if data['last_ts']:
+                self.last_ts = datetime.fromisoformat(data['last_ts'])
+            self.boundary = {(datetime.fromisoformat(ts), key) for ts, key in data['boundary']}
+            self.states = data['states']
+
+    def new_messages(self, messages):
+        """前回の実行より新しいメッセージだけを返し、処理済みの位置を進める"""
+        last_ts = self.last_ts
+        boundary = self.boundary
+        cutoff = last_ts - self.overlap if last_ts is not None else None
+        latest_ts = last_ts
+        recent = set(boundary)
+        prune_size = len(recent) + PRUNE_INTERVAL
+
+        for message in messages:
+            if message.ts is None:
+                if last_ts is None:
+                    yield message
+                continue
+            if cutoff is not None and message.ts < cutoff:
+                continue
+            identity = (message.ts, message_key(message))
+            if identity in boundary:
+                continue
+
+            if latest_ts is None or message.ts > latest_ts:
+                latest_ts = message.ts
+            recent.add(identity)
+            if len(recent) >= prune_size:
+                recent = self._prune(recent, latest_ts)
+                prune_size = len(recent) + PRUNE_INTERVAL
+            yield message
+
+        self.last_ts = latest_ts
+        self.boundary = self._prune(recent, latest_ts)
+
+    def _prune(self, identities, latest_ts):
+        """latest_ts - overlap より前のメッセージの記録を捨てる"""
+        if latest_ts is None:
+            return identities
+        cutoff = latest_ts - self.overlap
+        return {identity for identity in identities if identity[0] >= cutoff}
+
+    def restore(self, name, state_from_dict, default_state):
+        """保存済みの集計状態を復元（未保存の場合は default_state を返す）"""
+        if name in self.states:
+            return state_from_dict(self.states[name])
+        if self.last_ts is not None:
+            raise ValueError(f'チェックポイントに {name} の集計状態がありません: {self.path}')
+        return default_state
+
+    def store(self, name, state_dict):
+        """集計状態を登録"""
+        self.states[name] = state_dict
+
+    def save(self):
+        """チェックポイントをファイルに書き出す（一時ファイル経由で置き換え）"""
+        data = {
+            'version': CHECKPOINT_VERSION,
+            'last_ts': self.last_ts.isoformat(sep=' ') if self.last_ts else None,
+            'boundary': sorted([ts.isoformat(sep=' '), key] for ts, key in self.boundary),
+            'states': self.states
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temporary_path, self.path)
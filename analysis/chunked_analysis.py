@@ -0,0 +1,144 @@
+import os
+import sys
+from collections import defaultdict
+from analyze_all import NEAR_DUPLICATES_FILE, REPORT_FILES
+from profiler import NULL_PROFILER
+from report_stream import SpooledSections
+from slack_export_reader import open_messages
+import wordcloud_generator
+
+# 1チャンクに含める本文の量の下限（バイト）
+MIN_CHUNK_BYTES = 1024 * 1024
+
+# 本文1バイトあたりの、1チャンク分の集計状態（文脈・ヒット・名詞のリストなど）のメモリの目安
+CHUNK_EXPANSION = 60
+
+# 文脈を重複なくリストにする分析（チャンクをまたいだ既出の文脈はまとめる時に除く）
+CONTEXT_LISTS = ('negative_list', 'negative_summary', 'positive_list')
+
+
+def current_memory():
+    """現在のプロセスのメモリ使用量（バイト）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # /proc のない環境（macOS など）では最大使用量で代用する
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def chunk_bytes_for(max_memory, baseline=None):
+    """メモリの上限（バイト）と現在の使用量から、次のチャンクに含める本文の量（バイト）を求める"""
+    if baseline is None:
+        baseline = current_memory()
+    return max(MIN_CHUNK_BYTES, (max_memory - baseline) // CHUNK_EXPANSION)
+
+
+def iter_chunks(messages, chunk_bytes):
+    """メッセージを、本文の量が chunk_bytes() 程度になるようメッセージ単位で区切ったリストにして返す
+
+    chunk_bytes はチャンクを始めるたびに呼び出す（まとめた集計が増えた分だけチャンクを小さくする）。
+    """
+    chunk = []
+    size = 0
+    limit = chunk_bytes()
+    for message in messages:
+        chunk.append(message)
+        # 日本語は1文字3バイト程度のため、文字数の3倍で見積もる
+        size += len(message.text) * 3
+        if size >= limit:
+            yield chunk
+            chunk = []
+            size = 0
+            limit = chunk_bytes()
+    if chunk:
+        yield chunk
+
+
+class ChunkedAnalyzer:
+    """入力をメッセージ単位のチャンクに分けて集計し、チャンクごとの集計結果をまとめて全レポートを出力する
+
+    各チャンクは UnifiedAnalyzer.analyze で通常どおり集計する（map）。まとめる段階（reduce）では、
+    件数・上位語・推移などの小さい集計は merge_state で足し合わせ、文脈はチャンクをまたいだ
+    既出の判定（ダイジェスト）をしてからレポートの書き出し（一時ファイル）に流し、チャンクの集計状態ごと捨てる。
+    メモリには1チャンク分の集計状態とまとめた集計だけを保持するため、チャンクの大きさで使用量を抑えられる。
+    出力は UnifiedAnalyzer.run と同じレポートになる。
+    """
+
+    def __init__(self, analyzer, max_memory):
+        self.analyzer = analyzer
+        self.max_memory = max_memory
+        self.chunks = 0
+
+    def run(self, markdown_file, output_dir, since=None, until=None, users=None,
+            profiler=NULL_PROFILER, records=None, near_duplicates=None):
+        """エクスポートをチャンクごとに分析して全レポートを出力"""
+        analyzers = self.analyzer.analyzers
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {name: os.path.join(output_dir, filename) for name, filename in REPORT_FILES.items()}
+        if current_memory() >= self.max_memory:
+            raise ValueError(f'メモリの上限（{self.max_memory // (1024 * 1024)}MB）が現在の使用量より小さいため分割実行できません')
+
+        # まとめた集計（文脈を除く）と、文脈の書き出し先
+        reduced = {'kpt': analyzers['kpt'].create_state(), 'negative': analyzers['negative'].create_state(keep_comments=False)}
+        streams = {'negative': analyzers['negative'].open_stream(reduced['negative'], paths['negative'], records)}
+        seen = {}
+        for name in CONTEXT_LISTS:
+            streams[name] = analyzers[name].open_stream(paths[name], records)
+            seen[name] = analyzers[name].create_state(keep_entries=False)
+        kpt_sections = SpooledSections()
+
+        messages = profiler.iterate('read', open_messages(markdown_file, since, until, users))
+        if near_duplicates is not None:
+            messages = profiler.iterate('near_duplicates', near_duplicates.filter(messages))
+        for chunk in iter_chunks(messages, lambda: chunk_bytes_for(self.max_memory)):
+            self.process(chunk, reduced, streams, seen, kpt_sections, profiler)
+            # 次のチャンクを読む間に前のチャンクのメッセージを残さない
+            chunk.clear()
+
+        # キーワードの推定回数に誤差がある場合は、上位の候補だけを正確に数え直す
+        with profiler.stage('recount'):
+            messages = open_messages(markdown_file, since, until, users)
+            if near_duplicates is not None:
+                messages = near_duplicates.empty_copy().filter(messages)
+            self.analyzer.recount_keywords(reduced, messages)
+
+        with profiler.stage('write'):
+            analyzers['kpt'].write_report(reduced['kpt'], paths['kpt'], kpt_sections)
+            kpt_sections.close()
+            for stream in streams.values():
+                stream.close()
+        keyword_counts = reduced['kpt']['keyword_counts'].counts
+        wordcloud_generator.generate_wordcloud_from_frequencies(keyword_counts, paths['wordcloud'], profiler=profiler)
+        if near_duplicates is not None:
+            paths['near_duplicates'] = os.path.join(output_dir, NEAR_DUPLICATES_FILE)
+            near_duplicates.write_report(paths['near_duplicates'])
+        return paths
+
+    def process(self, chunk, reduced, streams, seen, kpt_sections, profiler=NULL_PROFILER):
+        """1チャンクを集計してまとめた集計に加える（チャンクの集計状態は戻る時に捨てる）"""
+        states = self.analyzer.analyze(chunk, profiler=profiler)
+        with profiler.stage('reduce'):
+            self.reduce(reduced, states, streams, seen, kpt_sections)
+        self.chunks += 1
+
+    def reduce(self, reduced, states, streams, seen, kpt_sections):
+        """1チャンク分の集計状態をまとめた集計に加え、文脈を書き出し先に流す"""
+        analyzers = self.analyzer.analyzers
+
+        negative = states['negative']
+        streams['negative'].write_entries(negative['negative_comments'])
+        negative['negative_comments'] = []
+        analyzers['negative'].merge_state(reduced['negative'], negative)
+
+        for name in CONTEXT_LISTS:
+            streams[name].write_entries(seen[name].extend(states[name]))
+
+        kpt = states['kpt']
+        for category, contexts in kpt['kpt_results'].items():
+            for context in contexts:
+                kpt_sections.write(category, f'- {context}\n')
+        kpt['kpt_results'] = defaultdict(list)
+        analyzers['kpt'].merge_state(reduced['kpt'], kpt)
@@ -0,0 +1,147 @@
+import hashlib
+from collections import defaultdict
+
+
+def merge_context_windows(text, hits, window=100, max_length=None):
+    """カテゴリごとに、重なり合う前後の文脈ウィンドウを1つの範囲にまとめる
+
+    hits は出現位置順に並んでいる必要がある（LexiconMatcher.scan の戻り値）。
+    各カテゴリの直近の範囲とだけ比較するため、ヒット数に対して線形時間で動作する。
+    まとめた範囲が max_length（既定はウィンドウ幅の4倍）を超える場合は新しい範囲を始める。
+    """
+    if max_length is None:
+        max_length = window * 4
+    merged = defaultdict(list)
+    for hit in hits:
+        start = max(0, hit.start - window)
+        end = min(len(text), hit.end + window)
+        entries = merged[hit.category]
+        if entries and start <= entries[-1]['end'] and end - entries[-1]['start'] <= max_length:
+            # 直前の範囲と重なるので範囲を広げてパターンを追加
+            entry = entries[-1]
+            entry['end'] = max(entry['end'], end)
+            if hit.pattern not in entry['patterns']:
+                entry['patterns'].append(hit.pattern)
+        else:
+            # 上限で区切った場合も、直前の範囲と文脈が重複しないようにする
+            if entries:
+                start = max(start, entries[-1]['end'])
+            entries.append({'start': start, 'end': end, 'patterns': [hit.pattern]})
+
+    for entries in merged.values():
+        for entry in entries:
+            entry['pattern'] = entry['patterns'][0]
+            entry['context'] = text[entry['start']:entry['end']].strip()
+    return merged
+
+
+def unique_contexts(text, hits, window=100):
+    """カテゴリごとに、同一の文脈をハッシュで判定して重複を除外する"""
+    unique = defaultdict(dict)
+    for hit in hits:
+        start = max(0, hit.start - window)
+        end = min(len(text), hit.end + window)
+        context = text[start:end].strip()
+        entries = unique[hit.category]
+        entry = entries.get(context)
+        if entry is None:
+            entries[context] = {
+                'start': start,
+                'end': end,
+                'pattern': hit.pattern,
+                'patterns': [hit.pattern],
+                'context': context
+            }
+        elif hit.pattern not in entry['patterns']:
+            entry['patterns'].append(hit.pattern)
+    return defaultdict(list, {category: list(entries.values()) for category, entries in unique.items()})
+
+
+def dedupe_contexts(text, hits, window=100, merge=True):
+    """マッチ結果から重複のない文脈エントリをカテゴリごとに生成"""
+    if merge:
+        return merge_context_windows(text, hits, window)
+    # 従来どおり辞書の定義順（カテゴリ→パターン→出現位置）で並べる
+    return unique_contexts(text, sorted(hits, key=lambda hit: (hit.index, hit.start)), window)
+
+
+def context_digest(context):
+    """文脈の既出の判定に使う16バイトのダイジェスト"""
+    return hashlib.blake2b(context.encode('utf-8'), digest_size=16).digest()
+
+
+class ContextDeduplicator:
+    """メッセージごとの文脈エントリを、カテゴリ単位で重複なく蓄積する
+
+    keep_entries が False の場合はエントリを保持せず（add の戻り値をそのまま書き出す用途）、
+    既出の判定には文脈のダイジェストだけを保持する。
+    """
+
+    def __init__(self, window=100, merge=True, keep_entries=True):
+        self.window = window
+        self.merge = merge
+        self.keep_entries = keep_entries
+        self.entries = defaultdict(list)
+        # カテゴリごとの既出文脈（集合で判定するため件数に対して線形時間）
+        self._seen = defaultdict(set)
+
+    def _seen_key(self, context):
+        """既出の判定に使うキー（エントリを保持しない場合は16バイトのダイジェスト）"""
+        if self.keep_entries:
+            return context
+        return context_digest(context)
+
+    def add(self, text, hits):
+        """1メッセージ分のマッチ結果を追加し、新たに追加されたエントリを返す"""
+        added = []
+        for category, entries in dedupe_contexts(text, hits, self.window, self.merge).items():
+            seen = self._seen[category]
+            for entry in entries:
+                key = self._seen_key(entry['context'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                entry['category'] = category
+                if self.keep_entries:
+                    self.entries[category].append(entry)
+                added.append(entry)
+        return added
+
+    def extend(self, other):
+        """別の集計結果のエントリを、既出の文脈を除いて後ろに加え、加えたエントリを返す"""
+        added = []
+        for category, entries in other.entries.items():
+            seen = self._seen[category]
+            for entry in entries:
+                key = self._seen_key(entry['context'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                if self.keep_entries:
+                    self.entries[category].append(entry)
+                added.append(entry)
+        return added
+
+    def digests(self):
+        """カテゴリごとの既出文脈のダイジェストの集合を返す（文脈を渡さずに重複を除いた件数をまとめる用途）"""
+        if self.keep_entries:
+            return {category: {context_digest(entry['context']) for entry in entries}
+                    for category, entries in self.entries.items()}
+        return {category: set(seen) for category, seen in self._seen.items()}
+
+    def to_dict(self):
+        """チェックポイント保存用の辞書に変換"""
+        return {
+            'window': self.window,
+            'merge': self.merge,
+            'entries': {category: entries for category, entries in self.entries.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict で変換した辞書から復元"""
+        deduplicator = cls(window=data['window'], merge=data['merge'])
+        for category, entries in data['entries'].items():
+            deduplicator.entries[category] = entries
+            deduplicator._seen[category] = {entry['context'] for entry in entries}
+        return deduplicator
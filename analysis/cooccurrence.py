@@ -0,0 +1,276 @@
+import argparse
+import csv
+import os
+from array import array
+from xml.sax.saxutils import quoteattr
+from slack_export_reader import add_filter_arguments, open_messages
+from tokenizer import NounTokenizer, add_mecab_arguments, apply_mecab_arguments, clean_text
+from token_cache import DEFAULT_MAX_BYTES
+from profiler import NULL_PROFILER, add_profile_arguments, create_profiler, write_profile
+
+# 共起を数える対象にする語の最小の出現文書数と、辺にする組の最小の共起回数
+DEFAULT_MIN_COUNT = 5
+DEFAULT_MIN_PAIR_COUNT = 3
+
+# グラフに残す辺の数と、語ごとに残す共起の強い相手の数
+DEFAULT_TOP_EDGES = 200
+DEFAULT_NEIGHBORS = 10
+
+GRAPH_FORMATS = ['graphml', 'csv']
+
+
+class CooccurrenceMatrix:
+    """文書（メッセージまたは連続するメッセージのまとまり）× 名詞の出現の有無を疎行列（CSR）として蓄積し、
+    名詞 × 名詞の共起回数と PMI を求める
+
+    名詞には出現順に列番号を振り、各文書の異なり名詞を1行として indptr / indices の array に追記する。
+    共起回数は出現文書数が min_count 以上の語の列だけを残した行列 X から X^T X の上三角として求め、
+    PMI は非ゼロの要素だけをベクトル演算で計算する（密な語 × 語の行列は作らない）。
+    """
+
+    def __init__(self):
+        self.terms = []
+        self.term_ids = {}
+        # CSR の配列（indptr は文書数 + 1 個）
+        self.indptr = array('Q', [0])
+        self.indices = array('I')
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def add(self, nouns):
+        """1文書分の名詞のリストを1行として追加（同じ語は1回と数える）"""
+        term_ids = self.term_ids
+        row = set()
+        for noun in nouns:
+            term = term_ids.get(noun)
+            if term is None:
+                term = term_ids[noun] = len(self.terms)
+                self.terms.append(noun)
+            row.add(term)
+        self.indices.extend(sorted(row))
+        self.indptr.append(len(self.indices))
+
+    def document_counts(self):
+        """語ごとの出現文書数"""
+        import numpy as np
+        return np.bincount(np.frombuffer(self.indices, dtype=np.uint32), minlength=len(self.terms))
+
+    def pairs(self, min_count=DEFAULT_MIN_COUNT, min_pair_count=DEFAULT_MIN_PAIR_COUNT):
+        """共起回数が min_pair_count 以上の語の組の (語の番号, 語の番号, 共起回数, PMI) の配列を返す
+
+        語の番号は self.terms の添字で、各組は1回だけ（番号の小さい語が先）返す。
+        PMI は log(共起回数 × 文書数 / (出現文書数 × 出現文書数)) で求める。
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix, triu
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                 np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+        document_counts = self.document_counts()
+        kept = np.flatnonzero(document_counts >= min_count)
+        if not len(self) or len(kept) < 2:
+            return empty
+
+        # 出現文書数の少ない語の列を除き、残った語に詰めた列番号を振り直す
+        columns = np.full(len(self.terms), -1, dtype=np.int64)
+        columns[kept] = np.arange(len(kept))
+        indices = columns[np.frombuffer(self.indices, dtype=np.uint32)]
+        rows = np.repeat(np.arange(len(self), dtype=np.int64),
+                         np.diff(np.frombuffer(self.indptr, dtype=np.uint64).astype(np.int64)))
+        selected = indices >= 0
+        matrix = csr_matrix((np.ones(np.count_nonzero(selected), dtype=np.int32), (rows[selected], indices[selected])),
+                            shape=(len(self), len(kept)))
+
+        cooccurrence = triu(matrix.T.tocsr() @ matrix, k=1).tocoo()
+        frequent = cooccurrence.data >= min_pair_count
+        rows = cooccurrence.row[frequent].astype(np.int64)
+        cols = cooccurrence.col[frequent].astype(np.int64)
+        counts = cooccurrence.data[frequent].astype(np.int64)
+        if not len(counts):
+            return empty
+
+        kept_counts = document_counts[kept].astype(np.float64)
+        pmi = np.log(counts * float(len(self)) / (kept_counts[rows] * kept_counts[cols]))
+        return kept[rows], kept[cols], counts, pmi
+
+
+def prune_edges(sources, targets, counts, pmi, top_edges=DEFAULT_TOP_EDGES, neighbors=DEFAULT_NEIGHBORS):
+    """PMI が正の組のうち、どちらかの語にとって PMI の上位 neighbors 件に入るものを残し、
+    その中から PMI の高い順に top_edges 件を選んだ添字を返す（PMI が同じ場合は共起回数の多い順）"""
+    import numpy as np
+    candidates = np.flatnonzero(pmi > 0)
+    if not len(candidates):
+        return candidates
+
+    # 各組を両方の語の側から並べ、語ごとに PMI の高い順の順位を付ける
+    nodes = np.concatenate((sources[candidates], targets[candidates]))
+    edges = np.concatenate((candidates, candidates))
+    order = np.lexsort((-counts[edges], -pmi[edges], nodes))
+    nodes = nodes[order]
+    starts = np.flatnonzero(np.concatenate(([True], nodes[1:] != nodes[:-1])))
+    ranks = np.arange(len(nodes)) - np.repeat(starts, np.diff(np.concatenate((starts, [len(nodes)]))))
+    kept = np.unique(edges[order][ranks < neighbors])
+
+    order = np.lexsort((-counts[kept], -pmi[kept]))
+    return kept[order][:top_edges]
+
+
+def term_neighbors(term_id, sources, targets, counts, pmi, limit=DEFAULT_NEIGHBORS):
+    """語と共起する語の (相手の語の番号, 共起回数, PMI) を PMI の高い順に返す"""
+    import numpy as np
+    selected = np.flatnonzero((sources == term_id) | (targets == term_id))
+    order = np.lexsort((-counts[selected], -pmi[selected]))
+    selected = selected[order][:limit]
+    others = np.where(sources[selected] == term_id, targets[selected], sources[selected])
+    return list(zip(others.tolist(), counts[selected].tolist(), pmi[selected].tolist()))
+
+
+class CooccurrenceAnalyzer:
+    """メッセージの名詞から共起グラフを作り、レポートとグラフのファイルを書き出す"""
+
+    def __init__(self, token_cache=None, token_cache_max_bytes=DEFAULT_MAX_BYTES, workers=1, window=1,
+                 min_count=DEFAULT_MIN_COUNT, min_pair_count=DEFAULT_MIN_PAIR_COUNT):
+        self.tokenizer = NounTokenizer(token_cache, token_cache_max_bytes, workers=workers)
+        self.window = window
+        self.min_count = min_count
+        self.min_pair_count = min_pair_count
+
+    def build(self, messages, profiler=NULL_PROFILER):
+        """メッセージの名詞から文書 × 名詞の行列を作る（window 件の連続するメッセージを1文書とする）"""
+        matrix = CooccurrenceMatrix()
+        document = []
+        in_document = 0
+        tokenized = self.tokenizer.tokenize_messages(messages, preprocess=clean_text)
+        for _, nouns in profiler.iterate('tokenize', tokenized):
+            document.extend(nouns)
+            in_document += 1
+            if in_document >= self.window:
+                matrix.add(document)
+                document = []
+                in_document = 0
+        if in_document:
+            matrix.add(document)
+        with profiler.stage('tokenize'):
+            self.tokenizer.flush()
+        return matrix
+
+    def write_report(self, matrix, edges, pruned, output_file, terms=(), limit=DEFAULT_NEIGHBORS):
+        """共起の強い組（pruned の添字の辺）と、指定した語と共起する語の一覧をマークダウンで書き出す"""
+        sources, targets, counts, pmi = edges
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write('# 名詞の共起分析\n\n')
+            f.write('## 概要\n')
+            unit = 'メッセージ' if self.window == 1 else f'連続する{self.window}件のメッセージ'
+            f.write(f'- 文書数: {len(matrix)}（{unit}を1文書とする）\n')
+            f.write(f'- 名詞の種類: {len(matrix.terms)}\n')
+            f.write(f'- 共起を数えた組: {len(counts)}（出現文書数 {self.min_count} 以上の語、'
+                    f'共起回数 {self.min_pair_count} 以上の組）\n\n')
+
+            f.write('## 共起の強い組み合わせ\n')
+            self._write_table(f, [(matrix.terms[sources[i]], matrix.terms[targets[i]], counts[i], pmi[i])
+                                  for i in pruned.tolist()])
+
+            for term in terms:
+                f.write(f'## 「{term}」と共起する名詞\n')
+                term_id = matrix.term_ids.get(term)
+                rows = term_neighbors(term_id, sources, targets, counts, pmi, limit) if term_id is not None else []
+                self._write_table(f, [(term, matrix.terms[other], count, value) for other, count, value in rows])
+
+    def _write_table(self, f, rows):
+        if not rows:
+            f.write('該当なし\n\n')
+            return
+        f.write('| 名詞 | 名詞 | 共起回数 | PMI |\n')
+        f.write('|---|---|---:|---:|\n')
+        for source, target, count, value in rows:
+            f.write(f'| {source} | {target} | {count} | {value:.2f} |\n')
+        f.write('\n')
+
+    def write_graph(self, matrix, edges, pruned, output_file, format=None):
+        """pruned の添字の辺に絞った共起グラフを書き出す（形式の指定がなければ拡張子から判定し、既定は GraphML）"""
+        if format is None:
+            format = 'csv' if os.path.splitext(output_file)[1].lower() == '.csv' else 'graphml'
+        sources, targets, counts, pmi = edges
+        pruned = pruned.tolist()
+        if format == 'csv':
+            with open(output_file, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['source', 'target', 'count', 'pmi'])
+                for i in pruned:
+                    writer.writerow([matrix.terms[sources[i]], matrix.terms[targets[i]], counts[i], f'{pmi[i]:.4f}'])
+            return
+
+        # 辺に現れる語だけを節点にし、出現文書数を属性として持たせる
+        document_counts = matrix.document_counts()
+        nodes = sorted({int(sources[i]) for i in pruned} | {int(targets[i]) for i in pruned})
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+            f.write('  <key id="documents" for="node" attr.name="documents" attr.type="int"/>\n')
+            f.write('  <key id="count" for="edge" attr.name="count" attr.type="int"/>\n')
+            f.write('  <key id="pmi" for="edge" attr.name="pmi" attr.type="double"/>\n')
+            f.write('  <graph edgedefault="undirected">\n')
+            for node in nodes:
+                f.write(f'    <node id={quoteattr(matrix.terms[node])}>'
+                        f'<data key="documents">{document_counts[node]}</data></node>\n')
+            for i in pruned:
+                f.write(f'    <edge source={quoteattr(matrix.terms[sources[i]])} '
+                        f'target={quoteattr(matrix.terms[targets[i]])}>'
+                        f'<data key="count">{counts[i]}</data><data key="pmi">{pmi[i]:.4f}</data></edge>\n')
+            f.write('  </graph>\n</graphml>\n')
+
+    def run(self, markdown_file, output_file, graph_file=None, graph_format=None, terms=(),
+            top_edges=DEFAULT_TOP_EDGES, neighbors=DEFAULT_NEIGHBORS, since=None, until=None, users=None,
+            profiler=NULL_PROFILER):
+        """エクスポートを読み込み、共起分析のレポート（と graph_file にグラフ）を出力"""
+        messages = profiler.iterate('read', open_messages(markdown_file, since, until, users))
+        matrix = self.build(messages, profiler)
+        with profiler.stage('cooccurrence'):
+            edges = matrix.pairs(self.min_count, self.min_pair_count)
+            pruned = prune_edges(*edges, top_edges, neighbors)
+        with profiler.stage('write'):
+            self.write_report(matrix, edges, pruned, output_file, terms, neighbors)
+            if graph_file:
+                self.write_graph(matrix, edges, pruned, graph_file, graph_format)
+        return matrix, edges
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Slack履歴の名詞の共起グラフを作成')
+    parser.add_argument('input_file', help='入力マークダウンファイル・メッセージストア・Slack のエクスポートの ZIP のパス')
+    parser.add_argument('--output', '-o', default='cooccurrence_report.md', help='レポートの出力ファイルのパス')
+    parser.add_argument('--graph', help='共起グラフの出力ファイルのパス（.csv は辺の一覧、それ以外は GraphML）')
+    parser.add_argument('--graph-format', choices=GRAPH_FORMATS, help='共起グラフの形式（省略時は拡張子から判定）')
+    parser.add_argument('--term', action='append', dest='terms', default=[],
+                        help='共起する名詞を一覧にする語（複数指定可。例: --term エラー --term 遅延）')
+    parser.add_argument('--window', type=int, default=1,
+                        help='連続する何件のメッセージを1つの文書として共起を数えるか（既定はメッセージ単位）')
+    parser.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT, help='対象にする語の最小の出現文書数')
+    parser.add_argument('--min-pair-count', type=int, default=DEFAULT_MIN_PAIR_COUNT, help='辺にする組の最小の共起回数')
+    parser.add_argument('--top-edges', type=int, default=DEFAULT_TOP_EDGES, help='グラフに残す辺の数')
+    parser.add_argument('--neighbors', type=int, default=DEFAULT_NEIGHBORS, help='語ごとに残す共起の強い相手の数')
+    parser.add_argument('--token-cache', help='形態素解析結果のキャッシュファイルのパス')
+    parser.add_argument('--token-cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='キャッシュの上限サイズ（MB）')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析を並列実行するプロセス数')
+    add_filter_arguments(parser)
+    add_profile_arguments(parser)
+    add_mecab_arguments(parser)
+    args = parser.parse_args()
+    apply_mecab_arguments(args)
+    if args.window < 1:
+        parser.error('--window には1以上を指定してください')
+
+    analyzer = CooccurrenceAnalyzer(args.token_cache, args.token_cache_size * 1024 * 1024, workers=args.workers,
+                                    window=args.window, min_count=args.min_count, min_pair_count=args.min_pair_count)
+    profiler = create_profiler(args)
+    analyzer.run(args.input_file, args.output, args.graph, args.graph_format, args.terms, args.top_edges,
+                 args.neighbors, args.since, args.until, args.users, profiler)
+    analyzer.tokenizer.close()
+    print(f'共起分析レポートを生成しました: {args.output}')
+    if args.graph:
+        print(f'共起グラフを保存しました: {args.graph}')
+    write_profile(profiler, args)
+
+if __name__ == '__main__':
+    main()
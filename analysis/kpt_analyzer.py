@@ -1,15 +1,25 @@
-import re
-import MeCab
+import heapq
 from collections import defaultdict
-import japanize_matplotlib
-import matplotlib.pyplot as plt
-from datetime import datetime
 import argparse
+from pattern_matcher import LexiconMatcher
+from slack_export_reader import add_filter_arguments, open_messages
+from checkpoint import Checkpoint
+from profiler import NULL_PROFILER, add_profile_arguments, create_profiler, write_profile
+from tokenizer import NounTokenizer, add_mecab_arguments, apply_mecab_arguments, clean_text
+from token_cache import DEFAULT_MAX_BYTES
+from trend_aggregator import TrendCounter
+from topk_counter import SpaceSavingCounter, DEFAULT_CAPACITY, recount
+from sentiment_matrix import SentimentMatrix
 
 class KPTAnalyzer:
-    def __init__(self):
-        # MeCabの初期化
-        self.mecab = MeCab.Tagger('-d /opt/homebrew/lib/mecab/dic/ipadic -r /opt/homebrew/etc/mecabrc')
+    def __init__(self, token_cache=None, token_cache_max_bytes=DEFAULT_MAX_BYTES, workers=1,
+                 keyword_capacity=DEFAULT_CAPACITY):
+        # MeCabの初期化（token_cache を指定すると解析結果をキャッシュし、
+        # workers を2以上にすると形態素解析を並列実行する）
+        self.tokenizer = NounTokenizer(token_cache, token_cache_max_bytes, workers=workers)
+        # キーワードの集計で追跡する語の数（メモリ使用量の上限）
+        self.keyword_capacity = keyword_capacity
+        self.keyword_limit = 20
         
         # キーワードパターンの定義
         self.patterns = {
@@ -26,107 +36,244 @@ class KPTAnalyzer:
                 r'改善案', r'新しい', r'変更', r'最適化'
             ]
         }
+        self.matcher = LexiconMatcher(self.patterns)
         
         # 感情分析用の辞書
         self.sentiment_dict = {
             'ポジティブ': ['良い', '便利', '助かった', '成功', '改善'],
             'ネガティブ': ['悪い', '不便', '問題', '失敗', '課題']
         }
-
-    def extract_text_from_markdown(self, markdown_file):
-        """マークダウンファイルからテキストを抽出"""
-        with open(markdown_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # コードブロック内のテキストを抽出
-        text_blocks = re.findall(r'```\n(.*?)\n```', content, re.DOTALL)
-        return '\n'.join(text_blocks)
+        # 感情スコアの重み（感情語1回あたり）
+        self.sentiment_weights = {'ポジティブ': 1, 'ネガティブ': -1}
+        # 感情語は1回の走査でまとめて数える（語ごとの重なりのない出現回数）
+        self.sentiment_matcher = LexiconMatcher(self.sentiment_dict)
 
     def analyze_sentiment(self, text):
         """感情分析を実行"""
-        sentiment_scores = defaultdict(int)
+        sentiment_scores = defaultdict(int, dict.fromkeys(self.sentiment_dict, 0))
         
-        for sentiment, words in self.sentiment_dict.items():
-            for word in words:
-                sentiment_scores[sentiment] += len(re.findall(word, text))
+        for hit in self.sentiment_matcher.scan(text):
+            sentiment_scores[hit.category] += 1
         
         return sentiment_scores
 
+    def count_nouns(self, text, keywords=None):
+        """名詞の出現回数を数える"""
+        if keywords is None:
+            keywords = defaultdict(int)
+        for word in self.tokenizer.nouns(clean_text(text)):
+            keywords[word] += 1
+        
+        return keywords
+
+    def top_keywords(self, keywords, limit=20):
+        """出現回数の多い順にキーワードを取り出す"""
+        return dict(heapq.nlargest(limit, keywords.items(), key=lambda x: x[1]))
+
+    def report_keywords(self, state):
+        """レポートに載せる上位キーワードを (語, 回数, 誤差の上限) のリストで返す
+
+        数え直し済みの場合は正確な回数を、そうでなければカウンターの推定回数を返す。
+        """
+        if 'exact_keywords' in state:
+            return [(word, count, 0) for word, count in state['exact_keywords'].items()]
+        return state['keyword_counts'].top(self.keyword_limit)
+
+    def recount_keywords(self, state, token_lists):
+        """上位になり得るキーワードだけを正確に数え直す（推定回数に誤差がある場合のみ）
+
+        置き換えられた語が上位に入り得る場合は、すべての語を数え直す。
+        token_lists には集計時と同じメッセージの名詞のリストを順に渡す。
+        """
+        counter = state['keyword_counts']
+        if counter.is_exact():
+            return False
+        candidates = counter.candidates(self.keyword_limit)
+        counts = recount(candidates, token_lists)
+        state['exact_keywords'] = self.top_keywords(counts, self.keyword_limit)
+        return True
+
     def extract_keywords(self, text):
         """キーワードを抽出"""
-        node = self.mecab.parseToNode(text)
-        keywords = defaultdict(int)
-        
-        while node:
-            if node.feature.split(',')[0] == '名詞':
-                keywords[node.surface] += 1
-            node = node.next
-        
-        return dict(sorted(keywords.items(), key=lambda x: x[1], reverse=True)[:20])
+        return self.top_keywords(self.count_nouns(text))
 
     def classify_kpt(self, text):
         """KPTに分類"""
+        return self.classify_hits(text, self.matcher.scan(text))
+
+    def classify_hits(self, text, hits):
+        """マッチ結果をKPTに分類"""
         kpt_results = defaultdict(list)
         
-        for category, patterns in self.patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, text)
-                for match in matches:
-                    # マッチした部分の前後の文脈を取得
-                    start = max(0, match.start() - 50)
-                    end = min(len(text), match.end() + 50)
-                    context = text[start:end]
-                    kpt_results[category].append(context)
+        for match in sorted(hits, key=lambda hit: (hit.index, hit.start)):
+            # マッチした部分の前後の文脈を取得
+            start = max(0, match.start - 50)
+            end = min(len(text), match.end + 50)
+            context = text[start:end]
+            kpt_results[match.category].append(context)
         
         return kpt_results
 
-    def generate_report(self, markdown_file, output_file):
-        """分析レポートを生成"""
-        # テキストの抽出
-        text = self.extract_text_from_markdown(markdown_file)
+    def create_state(self):
+        """集計用の状態を生成"""
+        return {
+            'sentiment': SentimentMatrix(self.sentiment_dict, self.sentiment_weights),
+            'keyword_counts': SpaceSavingCounter(self.keyword_capacity),
+            'kpt_results': defaultdict(list),
+            'trends': TrendCounter(self.patterns)
+        }
+
+    def update_state(self, state, message, hits, nouns):
+        """1メッセージ分のマッチ結果と名詞を集計に加える"""
+        text = message.text
         
-        # 感情分析
-        sentiment_scores = self.analyze_sentiment(text)
+        # 感情分析（メッセージ × 感情語の出現回数の行を追加）
+        state['sentiment'].add(message, self.sentiment_matcher.scan(text))
         
-        # キーワード抽出
-        keywords = self.extract_keywords(text)
+        # キーワード抽出（一定のメモリで上位の語を数える）
+        state['keyword_counts'].update(nouns)
         
         # KPT分類
-        kpt_results = self.classify_kpt(text)
+        for category, contexts in self.classify_hits(text, hits).items():
+            state['kpt_results'][category].extend(contexts)
+        state['trends'].add(message, [match.category for match in hits])
+
+    def merge_state(self, state, other):
+        """別の集計状態（他のチャンネルなど）を state に加える
+
+        数え直した正確なキーワードの回数はチャンネルをまたいで足し合わせられないため、
+        まとめた後はカウンターの推定回数を使う。
+        """
+        state['sentiment'].merge(other['sentiment'])
+        state['keyword_counts'].merge(other['keyword_counts'])
+        state.pop('exact_keywords', None)
+        for category, contexts in other['kpt_results'].items():
+            state['kpt_results'][category].extend(contexts)
+        state['trends'].merge(other['trends'])
+
+    def state_to_dict(self, state):
+        """集計状態をチェックポイント保存用の辞書に変換"""
+        return {
+            'sentiment': state['sentiment'].to_dict(),
+            'keyword_counts': state['keyword_counts'].to_dict(),
+            'kpt_results': dict(state['kpt_results']),
+            'trends': state['trends'].to_dict()
+        }
+
+    def state_from_dict(self, data):
+        """チェックポイントの辞書から集計状態を復元"""
+        return {
+            'sentiment': SentimentMatrix.from_dict(data['sentiment']),
+            'keyword_counts': SpaceSavingCounter.from_dict(data['keyword_counts']),
+            'kpt_results': defaultdict(list, data['kpt_results']),
+            'trends': TrendCounter.from_dict(data['trends'])
+        }
+
+    def generate_report(self, markdown_file, output_file, checkpoint=None, profiler=NULL_PROFILER,
+                        since=None, until=None, users=None):
+        """分析レポートを生成"""
+        state = self.create_state()
+        messages = profiler.iterate('read', open_messages(markdown_file, since, until, users))
+        if checkpoint is not None:
+            # 前回までの集計を引き継ぎ、新しいメッセージだけを処理する
+            state = checkpoint.restore('kpt', self.state_from_dict, state)
+            messages = profiler.iterate('checkpoint', checkpoint.new_messages(messages))
+        
+        # メッセージを1件ずつ読み出して集計（形態素解析は並列実行可能）
+        # キーワードはメンション・URL・絵文字を除いた本文から抽出する
+        scan = profiler.wrap('scan', self.matcher.scan, count=len)
+        update_state = profiler.wrap('aggregate', self.update_state)
+        tokenized = self.tokenizer.tokenize_messages(messages, preprocess=clean_text)
+        for message, nouns in profiler.iterate('tokenize', tokenized):
+            update_state(state, message, scan(message.text), nouns)
+        with profiler.stage('tokenize'):
+            self.tokenizer.flush()
+        if checkpoint is not None:
+            with profiler.stage('checkpoint'):
+                checkpoint.store('kpt', self.state_to_dict(state))
+                checkpoint.save()
+        else:
+            # 追跡する語数を超えた場合は、上位の候補だけをもう一度読み込んで正確に数える
+            # （チェックポイント利用時は過去のメッセージを読み直せないため推定回数のまま）
+            with profiler.stage('recount'):
+                messages = open_messages(markdown_file, since, until, users)
+                tokenized = self.tokenizer.tokenize_messages(messages, preprocess=clean_text)
+                self.recount_keywords(state, (nouns for _, nouns in tokenized))
+        
+        with profiler.stage('write'):
+            self.write_report(state, output_file)
+
+    def write_report(self, state, output_file, sections=None):
+        """集計結果からレポートを書き出す
+
+        sections（SpooledSections）を指定した場合は、KPTの文脈の行をカテゴリごとにそこから書き写す
+        （分割実行で文脈をメモリに残さない場合）。
+        """
+        keywords = self.report_keywords(state)
+        kpt_results = state['kpt_results']
         
         # レポートの生成
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write('# Slack履歴分析レポート\n\n')
             
-            # 感情分析結果
+            # 感情分析結果（全体の出現回数と、日別・週別・ユーザー別のスコア）
+            sentiment = state['sentiment']
             f.write('## 感情分析\n')
-            for sentiment, score in sentiment_scores.items():
-                f.write(f'- {sentiment}: {score}\n')
+            for name, score in sentiment.totals().items():
+                f.write(f'- {name}: {score}\n')
             f.write('\n')
+            if len(sentiment):
+                sentiment.write_tables(f)
             
             # キーワード
             f.write('## 主要キーワード\n')
-            for word, count in keywords.items():
-                f.write(f'- {word}: {count}回\n')
+            for word, count, error in keywords:
+                if error:
+                    f.write(f'- {word}: {count - error}〜{count}回\n')
+                else:
+                    f.write(f'- {word}: {count}回\n')
             f.write('\n')
             
             # KPT分析
             f.write('## KPT分析\n')
             for category in ['keep', 'problem', 'try']:
                 f.write(f'### {category.upper()}\n')
-                for context in kpt_results[category]:
-                    f.write(f'- {context}\n')
+                if sections is not None:
+                    sections.copy_to(category, f)
+                else:
+                    for context in kpt_results[category]:
+                        f.write(f'- {context}\n')
                 f.write('\n')
+            
+            # 日別・週別・ユーザー別の推移
+            f.write('## KPTの推移\n')
+            state['trends'].write_tables(f)
 
 def main():
     parser = argparse.ArgumentParser(description='Slack履歴からKPT分析を実行')
     parser.add_argument('input_file', help='入力マークダウンファイルのパス')
     parser.add_argument('--output', '-o', default='kpt_report.md', help='出力ファイルのパス')
+    parser.add_argument('--token-cache', help='形態素解析結果のキャッシュファイルのパス')
+    parser.add_argument('--token-cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='キャッシュの上限サイズ（MB）')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析を並列実行するプロセス数')
+    parser.add_argument('--keyword-capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='キーワードの集計で追跡する語の数（超えた分は上位の推定に切り替わる）')
+    parser.add_argument('--checkpoint', help='集計状態を保存するチェックポイントファイルのパス（前回以降のメッセージのみ処理）')
+    add_filter_arguments(parser)
+    add_profile_arguments(parser)
+    add_mecab_arguments(parser)
     args = parser.parse_args()
+    apply_mecab_arguments(args)
     
-    analyzer = KPTAnalyzer()
-    analyzer.generate_report(args.input_file, args.output)
+    analyzer = KPTAnalyzer(args.token_cache, args.token_cache_size * 1024 * 1024, workers=args.workers,
+                           keyword_capacity=args.keyword_capacity)
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    profiler = create_profiler(args)
+    analyzer.generate_report(args.input_file, args.output, checkpoint, profiler,
+                             since=args.since, until=args.until, users=args.users)
     print(f'KPT分析レポートを生成しました: {args.output}')
+    write_profile(profiler, args)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,388 @@
+import argparse
+import os
+import pathlib
+import sqlite3
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+from checkpoint import message_key
+from message_store import MessageStore, channel_from_filename, is_message_store
+from slack_archive_reader import SlackArchive, split_archive_path
+from pattern_matcher import LexiconMatcher
+from slack_export_reader import iter_messages
+from token_cache import DEFAULT_MAX_BYTES
+from tokenizer import NounTokenizer, add_mecab_arguments, apply_mecab_arguments, clean_text, dictionary_identity
+
+INDEX_VERSION = 3
+
+# 時刻のないメッセージの ts（NULL は UNIQUE 制約で互いに別の値とみなされ、同じメッセージが重複するため）
+NO_TIME = ''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime_ns INTEGER, messages INTEGER
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY, channel TEXT, ts TEXT, user TEXT, key TEXT, text TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_identity ON messages (channel, ts, key);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+CREATE TABLE IF NOT EXISTS message_sources (
+    message_id INTEGER, source_id INTEGER, PRIMARY KEY (message_id, source_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS message_sources_source ON message_sources (source_id);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER, message_id INTEGER, PRIMARY KEY (term_id, message_id)
+) WITHOUT ROWID;
+'''
+
+# 検索結果に表示する、語の前後の文字数
+CONTEXT_WINDOW = 50
+
+# 検索結果の既定の表示件数
+DEFAULT_LIMIT = 100
+
+# 1件の検索結果（文脈は最初に見つかった検索語の前後）
+QueryResult = namedtuple('QueryResult', ['ts', 'user', 'channel', 'text', 'context'])
+
+
+def lexicon_terms():
+    """各分析のキーワードパターン（重複を除き定義順）"""
+    from analyze_all import UnifiedAnalyzer
+    analyzer = UnifiedAnalyzer()
+    return list(dict.fromkeys(pattern for name in analyzer.analyzers
+                              for _, pattern in analyzer.analyzers[name].matcher.entries))
+
+
+def iter_source_messages(path, start=0):
+    """エクスポートまたはメッセージストアから (チャンネル, メッセージ) を順に読み出す
+
+    メッセージストアは start 番目以降のメッセージだけを読み出す（追記分の索引付け用）。
+    Slack の公式エクスポートの ZIP はフォルダ名をチャンネルとする。
+    """
+    archive = split_archive_path(path)
+    if archive is not None:
+        archive_path, channel = archive
+        slack_archive = SlackArchive(archive_path)
+        try:
+            yield from slack_archive.iter_channel_messages([channel] if channel else None)
+        finally:
+            slack_archive.close()
+        return
+    if is_message_store(path):
+        store = MessageStore(path)
+        try:
+            channel_column = store.columns['channel']
+            for index in range(start, len(store)):
+                yield store.channels[channel_column[index]], store.message(index)
+        finally:
+            store.close()
+        return
+    channel = channel_from_filename(path)
+    for message in iter_messages(path):
+        yield channel, message
+
+
+def find_context(text, terms, window=CONTEXT_WINDOW):
+    """最初に現れる検索語の前後の文脈（語が見つからない場合は本文の先頭）"""
+    positions = [(position, term) for term in terms for position in [text.find(term)] if position >= 0]
+    if not positions:
+        return text[:window * 2]
+    position, term = min(positions)
+    return text[max(0, position - window):position + len(term) + window]
+
+
+class MessageIndex:
+    """MeCabの名詞と各分析のキーワードパターンの転置索引（SQLite）
+
+    postings は (語, メッセージ) を主キーとする WITHOUT ROWID 表で、語ごとに
+    メッセージ番号が連続して格納されるため、語の検索はメッセージ数によらず高速に行える。
+    本文も保存し、検索結果の文脈は索引から直接作る（エクスポートは読み直さない）。
+    同じチャンネル・時刻・本文のメッセージは、期間の重なるエクスポートからも1件として扱い、
+    どのエクスポートに含まれるかを message_sources に記録する（どこからも参照されなくなった時点で削除する）。
+    update は変更のないエクスポートを読み飛ばし、メッセージストアは追記分だけを索引に加える。
+    キーワードパターンが追加された場合は、保存済みの本文を走査して新しいパターンだけを加える。
+    """
+
+    def __init__(self, path, tokenizer=None, read_only=False):
+        """read_only を指定した場合は既存の索引を読み取り専用で開く（索引がなければ FileNotFoundError）"""
+        self.path = path
+        self.tokenizer = tokenizer if tokenizer is not None else NounTokenizer()
+        if read_only:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'索引ファイルがありません: {path}')
+            self.connection = sqlite3.connect(f'{pathlib.Path(path).absolute().as_uri()}?mode=ro', uri=True)
+        else:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+        self.meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+        if self.meta.setdefault('version', str(INDEX_VERSION)) != str(INDEX_VERSION):
+            raise ValueError(f'未対応の索引形式です。build --rebuild で作り直してください: {path}')
+        self._term_ids = None
+
+    def close(self):
+        self.connection.close()
+
+    def _save_meta(self):
+        self.connection.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', self.meta.items())
+
+    def term_ids(self):
+        """{語: 語の番号}（初回に索引から読み込む）"""
+        if self._term_ids is None:
+            self._term_ids = dict(self.connection.execute('SELECT term, id FROM terms'))
+        return self._term_ids
+
+    def _term_id(self, term):
+        """語の番号（未登録なら登録する）"""
+        term_ids = self.term_ids()
+        term_id = term_ids.get(term)
+        if term_id is None:
+            term_id = term_ids[term] = self.connection.execute(
+                'INSERT INTO terms (term) VALUES (?)', (term,)).lastrowid
+        return term_id
+
+    def _check_dictionary(self):
+        """索引を作成した辞書と現在の辞書が同じか確認する（初回は記録する）"""
+        identity = dictionary_identity(self.tokenizer.mecab)
+        recorded = self.meta.setdefault('dictionary', identity)
+        if recorded != identity:
+            raise ValueError(f'索引の作成時と MeCab の辞書が異なります。--rebuild で作り直してください: {self.path}')
+
+    def _backfill_lexicon(self, lexicon):
+        """前回の索引付け以降に追加されたキーワードパターンを、保存済みの本文から索引に加える"""
+        indexed = set(self.meta.get('lexicon', '').split('\n')) - {''}
+        added = [term for term in lexicon if term not in indexed]
+        if added and indexed:
+            matcher = LexiconMatcher(added)
+            postings = []
+            for message_id, text in self.connection.execute('SELECT id, text FROM messages'):
+                for term in {hit.pattern for hit in matcher.scan(text)}:
+                    postings.append((self._term_id(term), message_id))
+            self.connection.executemany('INSERT OR IGNORE INTO postings (term_id, message_id) VALUES (?, ?)', postings)
+        self.meta['lexicon'] = '\n'.join(sorted(indexed.union(lexicon)))
+
+    def _add_messages(self, source_id, channel_messages, matcher):
+        """メッセージと、その名詞・キーワードパターンの postings を追加し、追加した件数を返す"""
+        connection = self.connection
+        message_ids = deque()
+
+        def inserted():
+            # 重複（同じチャンネル・時刻・本文）を除いたメッセージだけを形態素解析に渡す
+            # （既出のメッセージも、このエクスポートに含まれることは記録する）
+            for channel, message in channel_messages:
+                ts = message.ts.isoformat(sep=' ') if message.ts else NO_TIME
+                key = message_key(message)
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO messages (channel, ts, user, key, text) VALUES (?, ?, ?, ?, ?)',
+                    (channel, ts, message.user, key, message.text))
+                if cursor.rowcount:
+                    message_id = cursor.lastrowid
+                else:
+                    message_id = connection.execute('SELECT id FROM messages WHERE channel = ? AND ts = ? AND key = ?',
+                                                    (channel, ts, key)).fetchone()[0]
+                connection.execute('INSERT OR IGNORE INTO message_sources (message_id, source_id) VALUES (?, ?)',
+                                   (message_id, source_id))
+                if cursor.rowcount:
+                    message_ids.append(message_id)
+                    yield message
+
+        added = 0
+        postings = []
+        for message, nouns in self.tokenizer.tokenize_messages(inserted(), preprocess=clean_text):
+            message_id = message_ids.popleft()
+            terms = set(nouns)
+            terms.update(hit.pattern for hit in matcher.scan(message.text))
+            postings.extend((self._term_id(term), message_id) for term in terms)
+            added += 1
+            if len(postings) >= 100000:
+                connection.executemany('INSERT OR IGNORE INTO postings (term_id, message_id) VALUES (?, ?)', postings)
+                postings = []
+        connection.executemany('INSERT OR IGNORE INTO postings (term_id, message_id) VALUES (?, ?)', postings)
+        self.tokenizer.flush()
+        return added
+
+    def _remove_source(self, source_id):
+        """エクスポートとメッセージの対応を削除し、他のエクスポートから参照されないメッセージと postings を削除する"""
+        connection = self.connection
+        connection.execute('''CREATE TEMP TABLE removed AS
+                              SELECT message_id FROM message_sources WHERE source_id = ?''', (source_id,))
+        connection.execute('DELETE FROM message_sources WHERE source_id = ?', (source_id,))
+        connection.execute('''DELETE FROM removed WHERE message_id IN
+                              (SELECT message_id FROM message_sources WHERE message_id IN (SELECT message_id FROM removed))''')
+        connection.execute('DELETE FROM postings WHERE message_id IN (SELECT message_id FROM removed)')
+        connection.execute('DELETE FROM messages WHERE id IN (SELECT message_id FROM removed)')
+        connection.execute('DROP TABLE removed')
+
+    def update(self, paths):
+        """エクスポート・メッセージストアを索引に加え、{パス: 追加したメッセージ数} を返す
+
+        変更のないエクスポートは読み飛ばし、変更されたエクスポートは索引し直す。
+        メッセージストアは追記された分だけを加える。
+        """
+        self._check_dictionary()
+        lexicon = lexicon_terms()
+        matcher = LexiconMatcher(lexicon)
+        connection = self.connection
+        results = {}
+        with connection:
+            self._backfill_lexicon(lexicon)
+            for path in paths:
+                path = os.path.abspath(path)
+                store = is_message_store(path)
+                archive = split_archive_path(path)
+                if store:
+                    stat = os.stat(os.path.join(path, 'meta.json'))
+                else:
+                    # ZIP 内のチャンネルは ZIP ファイルの更新で判定する
+                    stat = os.stat(archive[0] if archive is not None else path)
+                row = connection.execute('SELECT id, size, mtime_ns, messages FROM sources WHERE path = ?',
+                                         (path,)).fetchone()
+                if row is not None and (row[1], row[2]) == (stat.st_size, stat.st_mtime_ns):
+                    results[path] = 0
+                    continue
+
+                start = 0
+                count = None
+                if store:
+                    with MessageStore(path) as opened:
+                        count = len(opened)
+                if row is None:
+                    source_id = connection.execute('INSERT INTO sources (path) VALUES (?)', (path,)).lastrowid
+                else:
+                    source_id = row[0]
+                    if store and row[3] <= count:
+                        # ストアは追記のみのため、前回の件数以降を読み出す
+                        start = row[3]
+                    else:
+                        self._remove_source(source_id)
+                results[path] = self._add_messages(source_id, iter_source_messages(path, start), matcher)
+                connection.execute('UPDATE sources SET size = ?, mtime_ns = ?, messages = ? WHERE id = ?',
+                                   (stat.st_size, stat.st_mtime_ns, count, source_id))
+            self._save_meta()
+        return results
+
+    def _term_condition(self, term):
+        """検索語1つ分の WHERE 条件とパラメーター
+
+        索引にある語は postings で引く。索引にない語は、名詞に分けて各名詞の postings で
+        候補を絞ってから本文を照合し、名詞に分けられない場合は本文を照合する。
+        """
+        term_ids = self.term_ids()
+        if term in term_ids:
+            return 'm.id IN (SELECT message_id FROM postings WHERE term_id = ?)', [term_ids[term]]
+        nouns = list(dict.fromkeys(self.tokenizer.nouns(term)))
+        if nouns and all(noun in term_ids for noun in nouns):
+            candidates = ' INTERSECT '.join(['SELECT message_id FROM postings WHERE term_id = ?'] * len(nouns))
+            return f'(m.id IN ({candidates}) AND instr(m.text, ?) > 0)', [term_ids[noun] for noun in nouns] + [term]
+        if nouns:
+            # 索引にない名詞を含む語は、どのメッセージにも現れない
+            return '0', []
+        return 'instr(m.text, ?) > 0', [term]
+
+    def query(self, terms, match_all=True, since=None, until=None, users=None, channels=None,
+              limit=DEFAULT_LIMIT):
+        """検索語を含むメッセージを時刻順に返す（match_all が False の場合はいずれかを含むもの）"""
+        conditions = []
+        parameters = []
+        for term in terms:
+            condition, values = self._term_condition(term)
+            conditions.append(condition)
+            parameters.extend(values)
+        where = [f'({(" AND " if match_all else " OR ").join(conditions)})']
+
+        if since is not None:
+            where.append('m.ts >= ?')
+            parameters.append(since.isoformat(sep=' '))
+        if until is not None:
+            where.append('m.ts < ?')
+            parameters.append(until.isoformat(sep=' '))
+        for column, values in (('user', users), ('channel', channels)):
+            if values:
+                where.append(f'm.{column} IN ({", ".join("?" * len(values))})')
+                parameters.extend(values)
+        sql = (f'SELECT m.ts, m.user, m.channel, m.text FROM messages m WHERE {" AND ".join(where)} '
+               'ORDER BY m.ts, m.id LIMIT ?')
+        parameters.append(limit)
+
+        return [QueryResult(datetime.fromisoformat(ts) if ts else None, user, channel, text, find_context(text, terms))
+                for ts, user, channel, text in self.connection.execute(sql, parameters)]
+
+    def stats(self):
+        """索引の件数（エクスポート・メッセージ・語・postings）"""
+        return {table: self.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('sources', 'messages', 'terms', 'postings')}
+
+
+def open_index(parser, path):
+    """検索・件数の表示用に既存の索引を読み取り専用で開く（開けない場合はエラーを表示して終了）"""
+    try:
+        return MessageIndex(path, read_only=True)
+    except (FileNotFoundError, ValueError) as e:
+        parser.error(str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='メッセージの転置索引の作成・更新と検索')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='エクスポート・メッセージストアを索引に加える（変更のないものは読み飛ばす）')
+    build.add_argument('index', help='索引ファイルのパス')
+    build.add_argument('inputs', nargs='+', help='マークダウンのエクスポートまたはメッセージストアのパス')
+    build.add_argument('--rebuild', action='store_true', help='既存の索引を削除して作り直す')
+    build.add_argument('--token-cache', help='形態素解析結果のキャッシュファイルのパス')
+    build.add_argument('--token-cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                       help='キャッシュの上限サイズ（MB）')
+    build.add_argument('--workers', type=int, default=1, help='形態素解析を並列実行するプロセス数')
+    add_mecab_arguments(build)
+
+    query = subparsers.add_parser('query', help='語を含むメッセージを検索')
+    query.add_argument('index', help='索引ファイルのパス')
+    query.add_argument('terms', nargs='+', help='検索語（名詞・キーワードパターン・任意の文字列）')
+    query.add_argument('--any', action='store_true', help='いずれかの語を含むメッセージを検索（既定はすべてを含む）')
+    query.add_argument('--since', type=datetime.fromisoformat, help='この日時以降のメッセージのみ検索（例: 2024-01-01）')
+    query.add_argument('--until', type=datetime.fromisoformat, help='この日時より前のメッセージのみ検索')
+    query.add_argument('--user', action='append', dest='users', help='指定したユーザーのメッセージのみ検索（複数指定可）')
+    query.add_argument('--channel', action='append', dest='channels', help='指定したチャンネルのメッセージのみ検索（複数指定可）')
+    query.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='表示する件数の上限')
+    add_mecab_arguments(query)
+
+    stats = subparsers.add_parser('stats', help='索引の件数を表示')
+    stats.add_argument('index', help='索引ファイルのパス')
+    args = parser.parse_args()
+
+    if args.command in ('build', 'query'):
+        # 検索語の形態素解析にも、索引の作成時と同じ辞書を使う
+        apply_mecab_arguments(args)
+    if args.command == 'build':
+        if args.rebuild:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(args.index + suffix):
+                    os.remove(args.index + suffix)
+        tokenizer = NounTokenizer(args.token_cache, args.token_cache_size * 1024 * 1024, workers=args.workers)
+        index = MessageIndex(args.index, tokenizer)
+        for path, count in index.update(args.inputs).items():
+            print(f'{path}: {count}件を索引に追加しました')
+        tokenizer.close()
+    elif args.command == 'query':
+        index = open_index(parser, args.index)
+        started = time.perf_counter()
+        results = index.query(args.terms, not args.any, args.since, args.until, args.users, args.channels, args.limit)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            timestamp = result.ts.strftime('%Y-%m-%d %H:%M:%S') if result.ts else '時刻なし'
+            print(f'### {timestamp} - {result.user or "不明"} ({result.channel})')
+            print(result.context.replace('\n', ' '))
+            print()
+        print(f'{len(results)}件（{elapsed * 1000:.1f}ミリ秒）')
+    else:
+        index = open_index(parser, args.index)
+        for table, count in index.stats().items():
+            print(f'{table}: {count}')
+    index.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from slack_archive_reader import SlackArchive, split_archive_path
+from slack_export_reader import SlackMessage, iter_messages as iter_markdown_messages
+
+STORE_VERSION = 2
+
+# 列ファイルと array の型コード
+COLUMNS = {
+    'ts': 'd',                 # 1970-01-01 00:00 からの経過秒（壁時計の時刻のまま。時刻のないメッセージは NaN）
+    'user': 'I',               # users 一覧の添字
+    'channel': 'I',            # channels 一覧の添字
+    'thread': 'B',             # スレッド返信の有無
+    'offsets': 'Q',            # text.bin 内の各メッセージの開始位置（件数 + 1 個）
+    'reaction_offsets': 'Q',   # reactions.bin 内の開始位置（件数 + 1 個）
+    'ts_order': 'I'            # 時刻順に並べたメッセージ番号
+}
+TEXT_FILE = 'text.bin'
+REACTIONS_FILE = 'reactions.bin'
+META_FILE = 'meta.json'
+
+# 書き込み時にまとめて追記する件数
+WRITE_BATCH = 10000
+
+# fetcher の出力ファイル名からチャンネルIDを取り出す
+CHANNEL_FROM_FILENAME = re.compile(r'slack_history_(.+?)_\d{4}-\d{2}-\d{2}_')
+
+
+# 時刻の列の基準（タイムゾーンによらず同じ値になるよう、時刻はタイムゾーンなしのまま変換する）
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_seconds(ts):
+    """タイムゾーンなしの時刻を EPOCH からの経過秒に変換"""
+    return (ts - EPOCH).total_seconds()
+
+
+def from_seconds(seconds):
+    """to_seconds で変換した経過秒を時刻に戻す"""
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def channel_from_filename(path):
+    """slack_history_<channel>_<開始日>_<終了日>_<時刻>.md からチャンネルIDを推定"""
+    match = CHANNEL_FROM_FILENAME.search(os.path.basename(path))
+    return match.group(1) if match else os.path.splitext(os.path.basename(path))[0]
+
+
+def encode_reactions(reactions):
+    """リアクションを `名前:件数` の `;` 区切りに変換"""
+    return ';'.join(f'{name}:{count}' for name, count in reactions).encode('utf-8')
+
+
+def decode_reactions(data):
+    """encode_reactions で変換したバイト列をリアクションのタプルに戻す"""
+    if not data:
+        return ()
+    reactions = []
+    for item in bytes(data).decode('utf-8').split(';'):
+        name, _, count = item.rpartition(':')
+        reactions.append((name, int(count)))
+    return tuple(reactions)
+
+
+class MessageStoreWriter:
+    """fetcher のエクスポートを列指向のメッセージストアに取り込む
+
+    既存のストアを指定した場合は末尾に追記する。列はバッチ単位で追記するため、
+    取り込み時のメモリ使用量はユーザー・チャンネル一覧の大きさ程度に収まる。
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        meta_path = os.path.join(store_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'version': STORE_VERSION, 'count': 0, 'users': [], 'channels': []}
+        if self.meta['version'] != STORE_VERSION:
+            raise ValueError(f'未対応のストア形式です: {store_dir}')
+
+        self.user_ids = {name: i for i, name in enumerate(self.meta['users'])}
+        self.channel_ids = {name: i for i, name in enumerate(self.meta['channels'])}
+        self.text_size = self._file_size(TEXT_FILE)
+        self.reactions_size = self._file_size(REACTIONS_FILE)
+        self._reset_batch()
+
+        # 新規作成時は列ファイルを初期化する（開始位置の列は先頭に 0 を1つ持つ）
+        if self.meta['count'] == 0:
+            for name, code in COLUMNS.items():
+                with open(self._path(name), 'wb') as f:
+                    if name in ('offsets', 'reaction_offsets'):
+                        array(code, [0]).tofile(f)
+            for filename in (TEXT_FILE, REACTIONS_FILE):
+                open(os.path.join(store_dir, filename), 'wb').close()
+            self.text_size = self.reactions_size = 0
+
+    def _path(self, name):
+        """列ファイルのパス"""
+        return os.path.join(self.store_dir, f'{name}.bin')
+
+    def _file_size(self, filename):
+        """ファイルサイズ（存在しない場合は 0）"""
+        path = os.path.join(self.store_dir, filename)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _reset_batch(self):
+        """追記待ちのバッチを空にする"""
+        self.batch = {name: array(COLUMNS[name]) for name in COLUMNS if name != 'ts_order'}
+        self.text_batch = []
+        self.reactions_batch = []
+
+    def _intern(self, table, names, name):
+        """名前を一覧に登録して添字を返す"""
+        index = table.get(name)
+        if index is None:
+            index = table[name] = len(names)
+            names.append(name)
+        return index
+
+    def add(self, message, channel=''):
+        """メッセージを1件追加"""
+        text = message.text.encode('utf-8')
+        reactions = encode_reactions(message.reactions)
+        self.text_size += len(text)
+        self.reactions_size += len(reactions)
+
+        batch = self.batch
+        batch['ts'].append(to_seconds(message.ts) if message.ts else math.nan)
+        batch['user'].append(self._intern(self.user_ids, self.meta['users'], message.user or ''))
+        batch['channel'].append(self._intern(self.channel_ids, self.meta['channels'], channel))
+        batch['thread'].append(1 if message.is_thread else 0)
+        batch['offsets'].append(self.text_size)
+        batch['reaction_offsets'].append(self.reactions_size)
+        self.text_batch.append(text)
+        self.reactions_batch.append(reactions)
+        self.meta['count'] += 1
+
+        if len(self.text_batch) >= WRITE_BATCH:
+            self._write_batch()
+
+    def add_messages(self, messages, channel=''):
+        """メッセージを順に追加し、追加件数を返す"""
+        count = 0
+        for message in messages:
+            self.add(message, channel)
+            count += 1
+        return count
+
+    def _write_batch(self):
+        """バッチを各列ファイルに追記"""
+        for name, values in self.batch.items():
+            with open(self._path(name), 'ab') as f:
+                values.tofile(f)
+        with open(os.path.join(self.store_dir, TEXT_FILE), 'ab') as f:
+            f.write(b''.join(self.text_batch))
+        with open(os.path.join(self.store_dir, REACTIONS_FILE), 'ab') as f:
+            f.write(b''.join(self.reactions_batch))
+        self._reset_batch()
+
+    def close(self):
+        """残りを書き出し、時刻順の索引とメタ情報を保存"""
+        self._write_batch()
+
+        # 時刻順の索引（時刻のないメッセージは末尾）。時刻の列はメモリマップのまま NumPy で並べ替える
+        import numpy as np
+        count = self.meta['count']
+        if count:
+            ts = np.memmap(self._path('ts'), dtype=np.float64, mode='r', shape=(count,))
+            # 安定ソートのため、同じ時刻・時刻のない（NaN は末尾）メッセージは追加順のまま
+            np.argsort(ts, kind='stable').astype(np.uint32).tofile(self._path('ts_order'))
+            self.meta['timed_count'] = count - int(np.count_nonzero(np.isnan(ts)))
+            del ts
+        else:
+            open(self._path('ts_order'), 'wb').close()
+            self.meta['timed_count'] = 0
+
+        with open(os.path.join(self.store_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+
+
+class MessageStore:
+    """列指向のメッセージストアをメモリマップで読み出す
+
+    各列は mmap 上の memoryview としてコピーせずに参照する。
+    本文は SlackMessage を生成する時点で初めてデコードする。
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != STORE_VERSION:
+            raise ValueError(f'未対応のストア形式です: {store_dir}')
+
+        self.users = self.meta['users']
+        self.channels = self.meta['channels']
+        self._maps = []
+        self.columns = {name: self._map(f'{name}.bin').cast(code) for name, code in COLUMNS.items()}
+        self.text = self._map(TEXT_FILE)
+        self.reactions = self._map(REACTIONS_FILE)
+
+    def _map(self, filename):
+        """ファイルを読み取り専用でメモリマップする"""
+        path = os.path.join(self.store_dir, filename)
+        if os.path.getsize(path) == 0:
+            return memoryview(b'')
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)
+
+    def __len__(self):
+        return self.meta['count']
+
+    def text_bytes(self, index):
+        """本文のバイト列をコピーせずに返す"""
+        offsets = self.columns['offsets']
+        return self.text[offsets[index]:offsets[index + 1]]
+
+    def message(self, index):
+        """指定した番号のメッセージを SlackMessage として返す"""
+        ts = self.columns['ts'][index]
+        reaction_offsets = self.columns['reaction_offsets']
+        return SlackMessage(
+            ts=None if math.isnan(ts) else from_seconds(ts),
+            user=self.users[self.columns['user'][index]] or None,
+            text=str(self.text_bytes(index), 'utf-8'),
+            reactions=decode_reactions(self.reactions[reaction_offsets[index]:reaction_offsets[index + 1]]),
+            is_thread=bool(self.columns['thread'][index])
+        )
+
+    def select(self, since=None, until=None, users=None, channels=None):
+        """期間・ユーザー・チャンネルで絞り込んだメッセージ番号の一覧を返す
+
+        期間を指定した場合は時刻順の索引を二分探索し、該当範囲を時刻順で返す。
+        until は含まない（since <= ts < until）。
+        """
+        if since is None and until is None:
+            indices = range(len(self))
+        else:
+            ts = self.columns['ts']
+            order = self.columns['ts_order'][:self.meta['timed_count']]
+            start = bisect_left(order, to_seconds(since), key=ts.__getitem__) if since else 0
+            end = bisect_left(order, to_seconds(until), key=ts.__getitem__) if until else len(order)
+            indices = order[start:end]
+
+        if users is not None:
+            users = set(users)
+            user_ids = {i for i, name in enumerate(self.users) if name in users}
+            user_column = self.columns['user']
+            indices = [i for i in indices if user_column[i] in user_ids]
+        if channels is not None:
+            channels = set(channels)
+            channel_ids = {i for i, name in enumerate(self.channels) if name in channels}
+            channel_column = self.columns['channel']
+            indices = [i for i in indices if channel_column[i] in channel_ids]
+        return indices
+
+    def iter_messages(self, indices=None):
+        """メッセージを SlackMessage として順に生成"""
+        for index in range(len(self)) if indices is None else indices:
+            yield self.message(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """メモリマップを解放"""
+        for column in self.columns.values():
+            column.release()
+        self.text.release()
+        self.reactions.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+
+def is_message_store(path):
+    """パスがメッセージストアのディレクトリかどうか"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def iter_store_messages(store_dir, since=None, until=None, users=None, channels=None):
+    """ストアを開いて絞り込んだメッセージを順に生成し、読み終えた（または中断した）時点でストアを閉じる"""
+    store = MessageStore(store_dir)
+    try:
+        yield from store.iter_messages(store.select(since, until, users, channels))
+    finally:
+        store.close()
+
+
+def import_exports(markdown_files, store_dir, channel=None):
+    """fetcher のエクスポートをストアに取り込み、取り込んだ件数を返す
+
+    Slack の公式エクスポートの ZIP は、フォルダ名をチャンネル名としてチャンネルごとに取り込む。
+    """
+    writer = MessageStoreWriter(store_dir)
+    total = 0
+    for markdown_file in markdown_files:
+        archive = split_archive_path(markdown_file)
+        if archive is not None:
+            total += import_archive(writer, *archive, channel)
+            continue
+        total += writer.add_messages(iter_markdown_messages(markdown_file),
+                                     channel or channel_from_filename(markdown_file))
+    writer.close()
+    return total
+
+
+def import_archive(writer, archive_path, archive_channel=None, channel=None):
+    """Slack の公式エクスポートの ZIP のチャンネルを取り込み、取り込んだ件数を返す"""
+    archive = SlackArchive(archive_path)
+    total = 0
+    try:
+        for name in [archive_channel] if archive_channel else archive.channels:
+            total += writer.add_messages(archive.iter_messages([name]), channel or name)
+    finally:
+        archive.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Slack履歴のエクスポートを列指向のメッセージストアに取り込む')
+    parser.add_argument('store_dir', help='メッセージストアのディレクトリ（既存の場合は追記）')
+    parser.add_argument('input_files', nargs='+', help='入力マークダウンファイルまたは Slack のエクスポートの ZIP のパス')
+    parser.add_argument('--channel', help='チャンネル名（省略時はファイル名・ZIP のフォルダ名から推定）')
+    args = parser.parse_args()
+
+    total = import_exports(args.input_files, args.store_dir, args.channel)
+    print(f'{total}件のメッセージを取り込みました: {args.store_dir}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+import re
+from array import array
+
+# 文字 n-gram の長さ
+SHINGLE_SIZE = 3
+
+# MinHash の署名の長さと、LSH で1つのバンドにまとめる行数
+NUM_PERM = 64
+BAND_ROWS = 8
+
+# 署名の一致率がこの値以上のメッセージを同じクラスタとみなす（Jaccard 係数の推定値）
+DEFAULT_THRESHOLD = 0.8
+
+# 署名をまとめて計算するメッセージ数・文字数の上限
+BATCH_SIZE = 256
+BATCH_CHARS = 32768
+
+# n-gram の多項式ハッシュの基数と、ハッシュを64ビット全体に散らす乗数（MurmurHash3 の fmix64）
+SHINGLE_BASE = 0x100000001B3
+MIX_MULTIPLIERS = (0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53)
+
+# クラスタの例として残す本文の長さ
+PREVIEW_LENGTH = 80
+
+# 数字の並び（アラートのIDや時刻などの違いを同一視する）
+DIGITS = re.compile(r'\d+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """比較用に、空白をまとめて数字を同一視した本文"""
+    return DIGITS.sub('0', WHITESPACE.sub(' ', text.strip().lower()))
+
+
+class NearDuplicateFilter:
+    """MinHash の署名と LSH のバンド分割で、ほぼ同じ内容のメッセージを1つの代表にまとめる
+
+    メッセージは到着順に処理し、既存の代表とバンドが一致し、署名の一致率が
+    threshold 以上のものはその代表のクラスタに加えて読み飛ばす。候補はバンドの
+    ハッシュ表から引くため、メッセージ数に対してほぼ線形時間で動作する。
+    クラスタの大きさ（代表が表すメッセージ数）は代表ごとの重みとして保持する。
+    分析の件数は重みを掛けず、クラスタごとに代表の1件として数える（重みは write_report で報告する）。
+    本文が空のメッセージはまとめずにそのまま通す。
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, band_rows=BAND_ROWS,
+                 shingle_size=SHINGLE_SIZE, seed=1):
+        import numpy as np
+        if num_perm % band_rows:
+            raise ValueError('署名の長さはバンドの行数で割り切れる必要があります')
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.band_rows = band_rows
+        self.shingle_size = shingle_size
+        self.seed = seed
+        # 置換に使うハッシュ (a * x + b) mod 2^64 の上位32ビットの係数（a は奇数）
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(0, 1 << 64, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = generator.randint(0, 1 << 64, size=(num_perm, 1), dtype=np.uint64)
+        # 代表の署名（代表の番号順に num_perm 個ずつ）とバンドごとの {バンドの値: 代表の番号}
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self._bands = [{} for _ in range(num_perm // band_rows)]
+        # 代表ごとのクラスタの大きさ（重み）と、代表の本文の冒頭
+        self.weights = array('I')
+        self.previews = []
+        self.messages = 0
+
+    def signatures(self, texts):
+        """本文のリストの MinHash の署名を (件数, num_perm) の配列で返す
+
+        全本文の文字 n-gram のハッシュを1つの配列でまとめて計算し、各置換での
+        最小値を本文ごとに reduceat で求める。本文の後ろには n-1 文字の詰め物を置き、
+        n-gram が次の本文にまたがらないようにする（短い本文も1つ以上の n-gram を持つ）。
+        """
+        import numpy as np
+        size = self.shingle_size
+        padding = '\0' * (size - 1)
+        codes = np.frombuffer(''.join(text + padding for text in texts).encode('utf-32-le'), dtype=np.uint32)
+        codes = codes.astype(np.uint64)
+
+        # 各位置から始まる n-gram の多項式ハッシュ（64ビットで溢れた分は捨てる）
+        hashes = np.zeros(len(codes) - size + 1, dtype=np.uint64)
+        for offset in range(size):
+            hashes = hashes * np.uint64(SHINGLE_BASE) + codes[offset:len(codes) - size + 1 + offset]
+        # 似た n-gram のハッシュが近い値にならないよう、全ビットに散らす
+        shift = np.uint64(33)
+        for multiplier in MIX_MULTIPLIERS:
+            hashes ^= hashes >> shift
+            hashes *= np.uint64(multiplier)
+        hashes ^= hashes >> shift
+
+        # 本文の文字の位置から始まる n-gram だけを選ぶ（本文ごとに文字数個）
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(lengths + size - 1)[:-1]))
+        firsts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        positions = np.arange(lengths.sum()) + np.repeat(starts - firsts, lengths)
+        shingles = hashes[positions]
+
+        permuted = (self._a * shingles + self._b) >> np.uint64(32)
+        return np.minimum.reduceat(permuted, firsts, axis=1).T.astype(np.uint32)
+
+    def empty_copy(self):
+        """同じ設定で、まだ何も読んでいないフィルター（同じメッセージを読み直す場合に使う）"""
+        return type(self)(self.threshold, self.num_perm, self.band_rows, self.shingle_size, self.seed)
+
+    def _find(self, signature, keys):
+        """バンドが一致する代表のうち、署名の一致率が閾値以上のものの番号（なければ None）"""
+        import numpy as np
+        checked = set()
+        for band, key in zip(self._bands, keys):
+            representative = band.get(key)
+            if representative is None or representative in checked:
+                continue
+            checked.add(representative)
+            agreement = np.count_nonzero(self._signatures[representative] == signature) / self.num_perm
+            if agreement >= self.threshold:
+                return representative
+        return None
+
+    def _add(self, signature, keys, text):
+        """新しい代表を登録し、その番号を返す（text は代表の本文）"""
+        import numpy as np
+        representative = len(self.weights)
+        if representative >= len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.zeros_like(self._signatures)])
+        self._signatures[representative] = signature
+        for band, key in zip(self._bands, keys):
+            band.setdefault(key, representative)
+        self.weights.append(1)
+        self.previews.append(text[:PREVIEW_LENGTH])
+        return representative
+
+    def _process(self, batch):
+        """バッチのメッセージのうち、代表になったものを順に返す"""
+        texts = [normalize(message.text) for message in batch]
+        indices = [index for index, text in enumerate(texts) if text]
+        signatures = self.signatures([texts[index] for index in indices]) if indices else None
+        rows = dict(zip(indices, range(len(indices))))
+        rows_per_band = self.band_rows
+        for index, message in enumerate(batch):
+            self.messages += 1
+            row = rows.get(index)
+            if row is None:
+                # 空の本文はまとめずにそのまま分析する
+                yield message
+                continue
+            signature = signatures[row]
+            data = signature.tobytes()
+            keys = [data[start:start + rows_per_band * 4]
+                    for start in range(0, len(data), rows_per_band * 4)]
+            representative = self._find(signature, keys)
+            if representative is None:
+                self._add(signature, keys, message.text)
+                yield message
+            else:
+                self.weights[representative] += 1
+
+    def filter(self, messages):
+        """メッセージを順に読み、クラスタの代表だけを返す"""
+        batch = []
+        chars = 0
+        for message in messages:
+            batch.append(message)
+            chars += len(message.text)
+            if len(batch) >= BATCH_SIZE or chars >= BATCH_CHARS:
+                yield from self._process(batch)
+                batch = []
+                chars = 0
+        if batch:
+            yield from self._process(batch)
+
+    @property
+    def representatives(self):
+        """代表（分析したメッセージ）の数（空の本文を除く）"""
+        return len(self.weights)
+
+    @property
+    def collapsed(self):
+        """代表にまとめて読み飛ばしたメッセージの数"""
+        return sum(self.weights) - len(self.weights)
+
+    @property
+    def cluster_count(self):
+        """2件以上をまとめたクラスタの数"""
+        return sum(1 for weight in self.weights if weight > 1)
+
+    def clusters(self, limit=None):
+        """2件以上をまとめたクラスタの (大きさ, 代表の本文の冒頭) を大きい順に返す"""
+        clusters = sorted(((weight, preview) for weight, preview in zip(self.weights, self.previews) if weight > 1),
+                          key=lambda cluster: cluster[0], reverse=True)
+        return clusters[:limit] if limit is not None else clusters
+
+    def summary(self):
+        """まとめた件数の1行の説明"""
+        rate = self.collapsed * 100 / self.messages if self.messages else 0
+        return (f'{self.messages}件中 {self.collapsed}件（{rate:.1f}%）をほぼ同じ内容のメッセージとして'
+                f'{self.cluster_count}個のクラスタにまとめました（分析の件数はクラスタごとに1件）')
+
+    def write_report(self, output_file, limit=20):
+        """まとめた件数と大きいクラスタの一覧をマークダウンで書き出す"""
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write('# ほぼ同じ内容のメッセージの集約\n\n')
+            f.write('## 概要\n')
+            f.write(f'- メッセージ数: {self.messages}件\n')
+            f.write(f'- 分析したメッセージ数: {self.messages - self.collapsed}件\n')
+            f.write(f'- まとめたメッセージ数: {self.collapsed}件\n')
+            f.write(f'- クラスタ数: {self.cluster_count}\n')
+            f.write(f'- 署名の一致率の閾値: {self.threshold}\n\n')
+            f.write('各レポートの件数（ヒット数・カテゴリ別件数・推移など）は、クラスタごとに代表の1件として数えています。'
+                    'クラスタの大きさ（代表がまとめたメッセージ数）は以下を参照してください。\n\n')
+
+            f.write('## 大きいクラスタ\n')
+            for size, preview in self.clusters(limit):
+                preview = preview.replace('\n', ' ')
+                f.write(f'- {size}件: {preview}\n')
+            f.write('\n')
+
+
+def add_near_duplicate_arguments(parser):
+    """ほぼ同じ内容のメッセージをまとめるオプションを追加"""
+    parser.add_argument('--collapse-near-duplicates', action='store_true',
+                        help='ほぼ同じ内容のメッセージ（定型のアラート・転載など）を1件にまとめてから分析する'
+                             '（件数はクラスタごとに代表の1件として数える）')
+    parser.add_argument('--near-duplicate-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='同じ内容とみなす類似度（文字 3-gram の Jaccard 係数の推定値）')
+
+
+def create_near_duplicate_filter(args):
+    """コマンドライン引数からフィルターを生成（--collapse-near-duplicates の指定がなければ None）"""
+    if not args.collapse_near_duplicates:
+        return None
+    return NearDuplicateFilter(args.near_duplicate_threshold)
@@ -1,16 +1,56 @@
-import re
-import MeCab
 from collections import defaultdict
-import japanize_matplotlib
-import matplotlib.pyplot as plt
-from datetime import datetime
 import argparse
+from pattern_matcher import LexiconMatcher
+from slack_export_reader import add_filter_arguments, open_messages
+from checkpoint import Checkpoint
+from profiler import NULL_PROFILER, add_profile_arguments, create_profiler, write_profile
+from trend_aggregator import TrendCounter
+from report_stream import RecordStream, SpooledSections, add_record_arguments, open_records
+
+
+class NegativeReportWriter:
+    """ネガティブ発言分析レポートのマークダウンを、ネガティブな発言から順に書き出す
+
+    パターンごとの件数だけをメモリに保持し、詳細は一時ファイルに書き溜める。
+    推移の表は書き出し時点の trends から作る。
+    """
+
+    def __init__(self, output_file, trends):
+        self.output_file = output_file
+        self.trends = trends
+        self.pattern_counts = defaultdict(int)
+        self.details = SpooledSections()
+
+    def write(self, comment):
+        self.pattern_counts[comment['pattern']] += 1
+        self.details.write(None, f'### {comment["pattern"]} ({comment["timestamp"]})\n{comment["context"]}\n\n')
+
+    def close(self):
+        # 傾向分析（出現回数の多い順）
+        negative_trends = dict(sorted(self.pattern_counts.items(), key=lambda x: x[1], reverse=True))
+        
+        # レポートの生成
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            f.write('# ネガティブ発言分析レポート\n\n')
+            
+            # 傾向分析結果
+            f.write('## ネガティブ表現の傾向\n')
+            for pattern, count in negative_trends.items():
+                f.write(f'- {pattern}: {count}回\n')
+            f.write('\n')
+            
+            # 日別・週別・ユーザー別の推移
+            f.write('## ネガティブ表現の推移\n')
+            self.trends.write_tables(f)
+            
+            # 詳細な発言内容
+            f.write('## ネガティブ発言の詳細\n')
+            self.details.copy_to(None, f)
+        self.details.close()
+
 
 class NegativeAnalyzer:
     def __init__(self):
-        # MeCabの初期化
-        self.mecab = MeCab.Tagger('-d /opt/homebrew/lib/mecab/dic/ipadic -r /opt/homebrew/etc/mecabrc')
-        
         # ネガティブな表現のパターン
         self.negative_patterns = [
             r'問題', r'課題', r'難しい', r'不便', r'時間がかかる',
@@ -19,34 +59,42 @@ class NegativeAnalyzer:
             r'申し訳', r'すみません', r'ごめん', r'すいません',
             r'できない', r'難しい', r'困る', r'大変', r'厳しい'
         ]
+        self.matcher = LexiconMatcher(self.negative_patterns)
+        # 推移の集計に使うパターン（重複を除く）
+        self.trend_labels = list(dict.fromkeys(self.negative_patterns))
 
-    def extract_text_from_markdown(self, markdown_file):
-        """マークダウンファイルからテキストを抽出"""
-        with open(markdown_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # コードブロック内のテキストを抽出
-        text_blocks = re.findall(r'```\n(.*?)\n```', content, re.DOTALL)
-        return '\n'.join(text_blocks)
-
-    def extract_negative_comments(self, text):
+    def extract_negative_comments(self, messages):
         """ネガティブな発言を抽出"""
-        negative_comments = []
-        
-        for pattern in self.negative_patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                # マッチした部分の前後の文脈を取得
-                start = max(0, match.start() - 100)
-                end = min(len(text), match.end() + 100)
-                context = text[start:end]
-                negative_comments.append({
-                    'pattern': pattern,
-                    'context': context,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                })
-        
-        return negative_comments
+        state = self.create_state()
+        for message, hits in self.matcher.scan_messages(messages):
+            self.update_state(state, message, hits)
+        return state['negative_comments']
+
+    def create_state(self, keep_comments=True):
+        """集計用の状態を生成（keep_comments が False の場合は発言を保持しない）"""
+        return {'negative_comments': [] if keep_comments else None, 'trends': TrendCounter(self.trend_labels)}
+
+    def update_state(self, state, message, hits):
+        """1メッセージ分のマッチ結果を集計に加え、このメッセージのネガティブな発言を返す"""
+        text = message.text
+        # 発言の時刻（時刻のないメッセージは空欄）
+        timestamp = message.ts.strftime('%Y-%m-%d %H:%M:%S') if message.ts else ''
+        comments = []
+        for match in hits:
+            # マッチした部分の前後の文脈を取得（メッセージ内に限定）
+            start = max(0, match.start - 100)
+            end = min(len(text), match.end + 100)
+            context = text[start:end]
+            comments.append({
+                'pattern': match.pattern,
+                'context': context,
+                'timestamp': timestamp,
+                'user': message.user
+            })
+        if state['negative_comments'] is not None:
+            state['negative_comments'].extend(comments)
+        state['trends'].add(message, [match.pattern for match in hits])
+        return comments
 
     def analyze_negative_trends(self, negative_comments):
         """ネガティブな発言の傾向を分析"""
@@ -56,42 +104,84 @@ class NegativeAnalyzer:
         
         return dict(sorted(pattern_counts.items(), key=lambda x: x[1], reverse=True))
 
-    def generate_report(self, markdown_file, output_file):
-        """分析レポートを生成"""
-        # テキストの抽出
-        text = self.extract_text_from_markdown(markdown_file)
-        
-        # ネガティブな発言の抽出
-        negative_comments = self.extract_negative_comments(text)
+    def merge_state(self, state, other):
+        """別の集計状態（他のチャンネルなど）を state に加える（発言を保持しない state には推移だけを加える）"""
+        if state['negative_comments'] is not None:
+            state['negative_comments'].extend(other['negative_comments'])
+        state['trends'].merge(other['trends'])
+
+    def state_to_dict(self, state):
+        """集計状態をチェックポイント保存用の辞書に変換"""
+        return {'negative_comments': state['negative_comments'], 'trends': state['trends'].to_dict()}
+
+    def state_from_dict(self, data):
+        """チェックポイントの辞書から集計状態を復元"""
+        return {
+            'negative_comments': list(data['negative_comments']),
+            'trends': TrendCounter.from_dict(data['trends'])
+        }
+
+    def open_stream(self, state, output_file, records=None):
+        """レポートのマークダウンとレコードの出力先にヒットを渡すストリームを生成"""
+        return RecordStream('negative', NegativeReportWriter(output_file, state['trends']), records)
+
+    def generate_report(self, markdown_file, output_file, checkpoint=None, profiler=NULL_PROFILER, records=None,
+                        since=None, until=None, users=None):
+        """分析レポートを生成（チェックポイントを使わない場合は発言を保持せず順に書き出す）"""
+        messages = profiler.iterate('read', open_messages(markdown_file, since, until, users))
+        stream = None
+        if checkpoint is not None:
+            # 前回までの集計を引き継ぎ、新しいメッセージだけを処理する
+            state = checkpoint.restore('negative', self.state_from_dict, self.create_state())
+            messages = profiler.iterate('checkpoint', checkpoint.new_messages(messages))
+        else:
+            state = self.create_state(keep_comments=False)
+            stream = self.open_stream(state, output_file, records)
         
-        # 傾向分析
-        negative_trends = self.analyze_negative_trends(negative_comments)
+        # メッセージを1件ずつ読み出しながらネガティブな発言を抽出
+        update_state = profiler.wrap('aggregate', self.update_state)
+        for message, hits in profiler.iterate('scan', self.matcher.scan_messages(messages)):
+            comments = update_state(state, message, hits)
+            if stream is not None:
+                stream.write_entries(comments)
+        if checkpoint is not None:
+            with profiler.stage('checkpoint'):
+                checkpoint.store('negative', self.state_to_dict(state))
+                checkpoint.save()
         
-        # レポートの生成
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('# ネガティブ発言分析レポート\n\n')
-            
-            # 傾向分析結果
-            f.write('## ネガティブ表現の傾向\n')
-            for pattern, count in negative_trends.items():
-                f.write(f'- {pattern}: {count}回\n')
-            f.write('\n')
-            
-            # 詳細な発言内容
-            f.write('## ネガティブ発言の詳細\n')
-            for comment in negative_comments:
-                f.write(f'### {comment["pattern"]} ({comment["timestamp"]})\n')
-                f.write(f'{comment["context"]}\n\n')
+        with profiler.stage('write'):
+            if stream is not None:
+                stream.close()
+            else:
+                self.write_report(state, output_file, records)
+
+    def write_report(self, state, output_file, records=None):
+        """集計結果からレポートを書き出す（ストリームと同じ書き出し処理に集計済みの発言を渡す）"""
+        stream = self.open_stream(state, output_file, records)
+        stream.write_entries(state['negative_comments'])
+        stream.close()
 
 def main():
     parser = argparse.ArgumentParser(description='Slack履歴からネガティブ発言を分析')
     parser.add_argument('input_file', help='入力マークダウンファイルのパス')
     parser.add_argument('--output', '-o', default='negative_report.md', help='出力ファイルのパス')
+    parser.add_argument('--checkpoint', help='集計状態を保存するチェックポイントファイルのパス（前回以降のメッセージのみ処理）')
+    add_filter_arguments(parser)
+    add_profile_arguments(parser)
+    add_record_arguments(parser)
     args = parser.parse_args()
     
     analyzer = NegativeAnalyzer()
-    analyzer.generate_report(args.input_file, args.output)
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    profiler = create_profiler(args)
+    records = open_records(args)
+    analyzer.generate_report(args.input_file, args.output, checkpoint, profiler, records,
+                             since=args.since, until=args.until, users=args.users)
     print(f'ネガティブ発言分析レポートを生成しました: {args.output}')
+    if records is not None:
+        records.close()
+        print(f'レコードを保存しました: {args.records}')
+    write_profile(profiler, args)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -1,9 +1,69 @@
-import re
 from collections import defaultdict
-from datetime import datetime
+from pattern_matcher import LexiconMatcher
+from context_dedup import ContextDeduplicator
+from slack_export_reader import add_filter_arguments, open_messages
+from checkpoint import Checkpoint
+from profiler import NULL_PROFILER, add_profile_arguments, create_profiler, write_profile
+from report_stream import RecordStream, add_record_arguments, open_records
+from near_duplicates import add_near_duplicate_arguments, create_near_duplicate_filter
+
+class SummaryWriter:
+    """ネガティブ発言の要約のマークダウンを、文脈エントリから書き出す
+
+    カテゴリごとの件数・先頭の発言・パターンの出現回数だけを保持する。
+    """
+
+    def __init__(self, output_file, categories, examples=5, top_patterns=3):
+        self.output_file = output_file
+        self.categories = list(categories)
+        self.examples = examples
+        self.top_patterns = top_patterns
+        self.counts = defaultdict(int)
+        self.first_comments = defaultdict(list)
+        self.pattern_counts = defaultdict(lambda: defaultdict(int))
+
+    def write(self, entry):
+        category = entry['category']
+        self.counts[category] += 1
+        if len(self.first_comments[category]) < self.examples:
+            self.first_comments[category].append(entry)
+        for pattern in entry['patterns']:
+            self.pattern_counts[category][pattern] += 1
+
+    def close(self):
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            f.write('# ネガティブ発言の要約\n\n')
+            
+            # 全体の概要
+            total_comments = sum(self.counts.values())
+            f.write(f'## 全体の概要\n')
+            f.write(f'総ネガティブ発言数: {total_comments}件\n\n')
+            
+            # カテゴリ別の要約
+            for category in self.categories:
+                if self.counts[category]:  # コメントが存在する場合のみ出力
+                    f.write(f'## {category}\n')
+                    f.write(f'発言数: {self.counts[category]}件\n\n')
+                    
+                    # 主要な発言の抽出（各カテゴリ最大5件）
+                    f.write('### 主要な発言\n')
+                    for i, comment in enumerate(self.first_comments[category], 1):
+                        f.write(f'{i}. {comment["context"]}\n')
+                        f.write(f'    - パターン: {", ".join(comment["patterns"])}\n')
+                    f.write('\n')
+                    
+                    # パターンの出現頻度
+                    pattern_counts = self.pattern_counts[category]
+                    f.write('### 頻出パターン\n')
+                    for pattern, count in sorted(pattern_counts.items(), key=lambda x: x[1], reverse=True)[:self.top_patterns]:
+                        f.write(f'- {pattern}: {count}回\n')
+                    f.write('\n')
 
 class NegativeSummaryGenerator:
-    def __init__(self):
+    def __init__(self, merge_contexts=True):
+        # 重なり合う文脈をまとめるかどうか（Falseの場合は同一文脈のみ除外）
+        self.merge_contexts = merge_contexts
+
         # ネガティブな表現のパターン
         self.negative_patterns = {
             '技術的な問題': [
@@ -27,88 +87,117 @@ class NegativeSummaryGenerator:
                 r'注意', r'警告'
             ]
         }
+        self.matcher = LexiconMatcher(self.negative_patterns)
 
-    def extract_text_from_markdown(self, markdown_file):
-        """マークダウンファイルからテキストを抽出"""
-        with open(markdown_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # コードブロック内のテキストを抽出
-        text_blocks = re.findall(r'```\n(.*?)\n```', content, re.DOTALL)
-        return '\n'.join(text_blocks)
-
-    def extract_negative_comments(self, text):
+    def extract_negative_comments(self, messages):
         """ネガティブな発言を抽出"""
-        negative_comments = defaultdict(list)
-        
-        for category, patterns in self.negative_patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, text)
-                for match in matches:
-                    # マッチした部分の前後の文脈を取得
-                    start = max(0, match.start() - 100)
-                    end = min(len(text), match.end() + 100)
-                    context = text[start:end].strip()
-                    
-                    # 重複を避けるため、既存のコメントと比較
-                    if not any(existing['context'] == context for existing in negative_comments[category]):
-                        negative_comments[category].append({
-                            'pattern': pattern,
-                            'context': context,
-                            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        })
-        
-        return negative_comments
+        state = self.create_state()
+        for message, hits in self.matcher.scan_messages(messages):
+            self.update_state(state, message, hits)
+        return state.entries
+
+    def create_state(self, keep_entries=True):
+        """集計用の状態を生成"""
+        # 文脈の重複をまとめて除外（ヒット数に対して線形時間）
+        return ContextDeduplicator(window=100, merge=self.merge_contexts, keep_entries=keep_entries)
+
+    def update_state(self, state, message, hits):
+        """1メッセージ分のマッチ結果を集計に加え、新たに加わった文脈エントリを返す"""
+        added = state.add(message.text, hits)
+        timestamp = message.ts.strftime('%Y-%m-%d %H:%M:%S') if message.ts else ''
+        for entry in added:
+            entry['timestamp'] = timestamp
+            entry['user'] = message.user
+        return added
+
+    def merge_state(self, state, other):
+        """別の集計状態（他のチャンネルなど）を state に加える（既出の文脈は除く）"""
+        state.extend(other)
+
+    def state_to_dict(self, state):
+        """集計状態をチェックポイント保存用の辞書に変換"""
+        return state.to_dict()
+
+    def state_from_dict(self, data):
+        """チェックポイントの辞書から集計状態を復元"""
+        state = ContextDeduplicator.from_dict(data)
+        if state.merge != self.merge_contexts:
+            raise ValueError('チェックポイントと文脈のまとめ方の設定が異なります')
+        return state
+
+    def open_stream(self, output_file, records=None):
+        """要約のマークダウンとレコードの出力先にヒットを渡すストリームを生成"""
+        return RecordStream('negative_summary', SummaryWriter(output_file, self.negative_patterns), records)
 
-    def generate_summary(self, markdown_file, output_file):
-        """ネガティブ発言の要約を生成"""
-        # テキストの抽出
-        text = self.extract_text_from_markdown(markdown_file)
+    def generate_summary(self, markdown_file, output_file, checkpoint=None, profiler=NULL_PROFILER, records=None,
+                         near_duplicates=None, since=None, until=None, users=None):
+        """ネガティブ発言の要約を生成（チェックポイントを使わない場合は文脈を保持せず順に書き出す）
+
+        near_duplicates（NearDuplicateFilter）を指定すると、ほぼ同じ内容のメッセージは代表の1件だけを集計する。
+        """
+        messages = profiler.iterate('read', open_messages(markdown_file, since, until, users))
+        if near_duplicates is not None:
+            messages = profiler.iterate('near_duplicates', near_duplicates.filter(messages))
+        stream = None
+        if checkpoint is not None:
+            # 前回までの集計を引き継ぎ、新しいメッセージだけを処理する
+            state = checkpoint.restore('negative_summary', self.state_from_dict, self.create_state())
+            messages = profiler.iterate('checkpoint', checkpoint.new_messages(messages))
+        else:
+            state = self.create_state(keep_entries=False)
+            stream = self.open_stream(output_file, records)
         
-        # ネガティブな発言の抽出
-        negative_comments = self.extract_negative_comments(text)
+        # メッセージを1件ずつ読み出しながらネガティブな発言を抽出
+        update_state = profiler.wrap('dedup', self.update_state)
+        for message, hits in profiler.iterate('scan', self.matcher.scan_messages(messages)):
+            added = update_state(state, message, hits)
+            if stream is not None:
+                stream.write_entries(added)
+        if checkpoint is not None:
+            with profiler.stage('checkpoint'):
+                checkpoint.store('negative_summary', self.state_to_dict(state))
+                checkpoint.save()
         
-        # 要約の生成
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('# ネガティブ発言の要約\n\n')
-            
-            # 全体の概要
-            total_comments = sum(len(comments) for comments in negative_comments.values())
-            f.write(f'## 全体の概要\n')
-            f.write(f'総ネガティブ発言数: {total_comments}件\n\n')
-            
-            # カテゴリ別の要約
-            for category, comments in negative_comments.items():
-                if comments:  # コメントが存在する場合のみ出力
-                    f.write(f'## {category}\n')
-                    f.write(f'発言数: {len(comments)}件\n\n')
-                    
-                    # 主要な発言の抽出（各カテゴリ最大5件）
-                    f.write('### 主要な発言\n')
-                    for i, comment in enumerate(comments[:5], 1):
-                        f.write(f'{i}. {comment["context"]}\n')
-                    f.write('\n')
-                    
-                    # パターンの出現頻度
-                    pattern_counts = defaultdict(int)
-                    for comment in comments:
-                        pattern_counts[comment['pattern']] += 1
-                    
-                    f.write('### 頻出パターン\n')
-                    for pattern, count in sorted(pattern_counts.items(), key=lambda x: x[1], reverse=True)[:3]:
-                        f.write(f'- {pattern}: {count}回\n')
-                    f.write('\n')
+        with profiler.stage('write'):
+            if stream is not None:
+                stream.close()
+            else:
+                self.write_summary(state, output_file, records)
+
+    def write_summary(self, state, output_file, records=None):
+        """集計結果から要約を書き出す（ストリームと同じ書き出し処理に集計済みの文脈を渡す）"""
+        stream = self.open_stream(output_file, records)
+        for category in self.negative_patterns:
+            stream.write_entries(state.entries.get(category, []))
+        stream.close()
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(description='Slack履歴からネガティブ発言を要約')
     parser.add_argument('input_file', help='入力マークダウンファイルのパス')
     parser.add_argument('--output', '-o', default='negative_summary.md', help='出力ファイルのパス')
+    parser.add_argument('--no-merge', action='store_true', help='重なり合う文脈をまとめず、同一の文脈のみを除外する')
+    parser.add_argument('--checkpoint', help='集計状態を保存するチェックポイントファイルのパス（前回以降のメッセージのみ処理）')
+    add_filter_arguments(parser)
+    add_profile_arguments(parser)
+    add_record_arguments(parser)
+    add_near_duplicate_arguments(parser)
     args = parser.parse_args()
     
-    generator = NegativeSummaryGenerator()
-    generator.generate_summary(args.input_file, args.output)
+    generator = NegativeSummaryGenerator(merge_contexts=not args.no_merge)
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    profiler = create_profiler(args)
+    records = open_records(args)
+    near_duplicates = create_near_duplicate_filter(args)
+    generator.generate_summary(args.input_file, args.output, checkpoint, profiler, records, near_duplicates,
+                               since=args.since, until=args.until, users=args.users)
     print(f'ネガティブ発言の要約を生成しました: {args.output}')
+    if near_duplicates is not None:
+        print(near_duplicates.summary())
+    if records is not None:
+        records.close()
+        print(f'レコードを保存しました: {args.records}')
+    write_profile(profiler, args)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
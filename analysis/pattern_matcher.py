@@ -0,0 +1,165 @@
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+# 1件のマッチ結果（カテゴリ、パターン、開始位置、終了位置、辞書内の通し番号）
+Hit = namedtuple('Hit', ['category', 'pattern', 'start', 'end', 'index'])
+
+# まとめて走査するときにメッセージの間に挟む区切り文字（パターンには含められない）
+SEPARATOR = '\x00'
+
+# scan_messages で1回の走査にまとめるメッセージ数
+DEFAULT_BATCH_SIZE = 256
+
+
+class LexiconMatcher:
+    """複数のキーワードパターンを1回の走査でまとめて検出するマッチャー
+
+    パターンはすべてリテラル文字列として扱う。全パターンを1つの選択肢付き
+    正規表現にまとめ、マッチ位置の次の文字から検索を再開することで
+    パターンが始まる全位置の最長一致を求める。その接頭辞になっている
+    パターンも同じ位置のマッチとして列挙する（Aho-Corasick と同じ出力）。
+    パターンごとの結果は `re.finditer` と同じく重なりのないマッチになる。
+    """
+
+    def __init__(self, patterns):
+        # {カテゴリ: [パターン, ...]} または [パターン, ...] を受け付ける
+        if isinstance(patterns, dict):
+            items = [(category, pattern)
+                     for category, category_patterns in patterns.items()
+                     for pattern in category_patterns]
+        else:
+            items = [(None, pattern) for pattern in patterns]
+        self._build(items)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """(カテゴリ, パターン) の組のリストからマッチャーを生成"""
+        matcher = cls.__new__(cls)
+        matcher._build(list(entries))
+        return matcher
+
+    def _build(self, items):
+        """パターンの索引と検索用の正規表現を構築"""
+        self.entries = items
+        indices_by_pattern = {}
+        for index, (_, pattern) in enumerate(items):
+            if not pattern:
+                raise ValueError('空のパターンは登録できません')
+            if SEPARATOR in pattern:
+                raise ValueError(f'区切り文字を含むパターンは登録できません: {pattern!r}')
+            indices_by_pattern.setdefault(pattern, []).append(index)
+
+        # ある位置で最長一致したパターンに対し、同じ位置から始まる全パターン
+        # （最長一致の接頭辞になっているもの）を短い順に引けるようにしておく
+        self._outputs = {}
+        for pattern in indices_by_pattern:
+            self._outputs[pattern] = [
+                (index, len(prefix))
+                for prefix in sorted(indices_by_pattern, key=len)
+                if pattern.startswith(prefix)
+                for index in indices_by_pattern[prefix]
+            ]
+
+        # 自身と重なり得るパターン（接頭辞と接尾辞が一致する）だけ重なりを検査する
+        self._self_overlapping = {
+            index for index, (_, pattern) in enumerate(items)
+            if any(pattern[:size] == pattern[-size:] for size in range(1, len(pattern)))
+        }
+
+        # 長いパターンを優先した選択肢で、各位置の最長一致パターンを取得する
+        alternatives = sorted(indices_by_pattern, key=len, reverse=True)
+        self._candidates = re.compile('|'.join(map(re.escape, alternatives))) if alternatives else None
+
+    def scan(self, text):
+        """テキストを1回走査し、全パターンのマッチを出現位置順に返す"""
+        return self.scan_texts([text])[0]
+
+    def scan_texts(self, texts):
+        """複数のテキストを区切り文字でつないで1回で走査し、テキストごとのマッチのリストを返す
+
+        各テキストの開始位置の表を作り、マッチの開始位置から元のテキストを二分探索で求めて
+        テキスト内の位置に直す。パターンは区切り文字を含まないため、マッチがテキストの境界を
+        またぐことはない。
+        """
+        results = [[] for _ in texts]
+        if self._candidates is None or not texts:
+            return results
+
+        # テキストごとの開始位置（昇順）と、つないだテキスト全体の長さ
+        offsets = []
+        length = 0
+        for text in texts:
+            offsets.append(length)
+            length += len(text) + 1
+        joined = SEPARATOR.join(texts)
+
+        entries = self.entries
+        outputs = self._outputs
+        self_overlapping = self._self_overlapping
+        # パターンごとの直前のマッチ終了位置（重なり防止用）
+        last_end = {}
+        search = self._candidates.search
+        # 現在のテキストの番号・開始位置・次のテキストの開始位置
+        current = 0
+        base = 0
+        limit = offsets[1] if len(offsets) > 1 else length
+        hits = results[0]
+        candidate = search(joined)
+        while candidate:
+            start = candidate.start()
+            if start >= limit:
+                # マッチは出現位置順に見つかるため、現在のテキスト以降だけを探す
+                current = bisect_right(offsets, start, current) - 1
+                base = offsets[current]
+                limit = offsets[current + 1] if current + 1 < len(offsets) else length
+                hits = results[current]
+            for index, size in outputs[candidate.group()]:
+                end = start + size
+                if index in self_overlapping:
+                    if start < last_end.get(index, 0):
+                        continue
+                    last_end[index] = end
+                category, pattern = entries[index]
+                hits.append(Hit(category, pattern, start - base, end - base, index))
+            # 他のパターンがマッチ範囲の途中から始まる場合に備え、1文字先から再検索する
+            candidate = search(joined, start + 1)
+        return results
+
+    def scan_messages(self, messages, batch_size=DEFAULT_BATCH_SIZE):
+        """メッセージを順に走査し、(メッセージ, マッチ結果) の組を生成
+
+        batch_size 件ずつまとめて走査する（マッチの位置と文脈はメッセージごとのまま）。
+        """
+        batch = []
+        for message in messages:
+            batch.append(message)
+            if len(batch) >= batch_size:
+                yield from zip(batch, self.scan_texts([message.text for message in batch]))
+                batch = []
+        if batch:
+            yield from zip(batch, self.scan_texts([message.text for message in batch]))
+
+
+class CombinedMatcher:
+    """複数のマッチャーの辞書をまとめ、1回の走査で各マッチャーのマッチ結果に振り分ける"""
+
+    def __init__(self, matchers):
+        # {名前: LexiconMatcher} を受け付ける
+        entries = []
+        self._origins = []
+        for name, matcher in matchers.items():
+            for index, entry in enumerate(matcher.entries):
+                entries.append(entry)
+                self._origins.append((name, index))
+        self.names = list(matchers)
+        self._matcher = LexiconMatcher.from_entries(entries)
+
+    def scan(self, text):
+        """テキストを1回走査し、{名前: 元のマッチャーでのマッチ結果} を返す"""
+        results = {name: [] for name in self.names}
+        origins = self._origins
+        for hit in self._matcher.scan(text):
+            name, index = origins[hit.index]
+            results[name].append(hit._replace(index=index))
+        return results
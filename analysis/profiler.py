@@ -0,0 +1,222 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Chrome トレースに記録するイベント数の上限（超えた分は集計のみ行う）
+DEFAULT_MAX_EVENTS = 100000
+
+PROFILE_FORMATS = ['json', 'chrome']
+
+
+class NullProfiler:
+    """計測を行わないプロファイラー（既定値）"""
+
+    enabled = False
+
+    def stage(self, name, items_in=0):
+        return nullcontext()
+
+    def iterate(self, name, iterable):
+        return iterable
+
+    def wrap(self, name, func, count=None):
+        return func
+
+    def write(self, path, format='json'):
+        pass
+
+    def dump_hottest(self, path):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """処理の段階（読み込み・形態素解析・走査・集計・出力など）ごとの計測を行う
+
+    段階は入れ子にでき、時間は実行中の最も内側の段階に加算する（排他時間）。
+    ジェネレーターを iterate で包むと、要素を1件取り出すたびにその段階として計測するため、
+    メッセージ単位で交互に進むストリーミング処理でも段階ごとの時間を分けて求められる。
+    memory を指定すると tracemalloc で段階ごとの最大メモリを、cprofile を指定すると
+    段階ごとに cProfile を取り、最も時間のかかった段階の統計を書き出せる。
+    """
+
+    enabled = True
+
+    def __init__(self, memory=False, cprofile=False, trace=False, max_events=DEFAULT_MAX_EVENTS):
+        self.memory = memory
+        self.trace = trace
+        self.max_events = max_events
+        self.stages = {}
+        self.stack = []
+        self.events = []
+        self.dropped_events = 0
+        self._profiles = {} if cprofile else None
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started_wall = self._last_wall = time.perf_counter()
+        self.started_cpu = self._last_cpu = time.process_time()
+
+    def _stats(self, name):
+        """段階の集計値（初回は登録）"""
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = {
+                'calls': 0, 'items_in': 0, 'items_out': 0,
+                'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_memory_bytes': None
+            }
+        return stats
+
+    def _switch(self, name):
+        """直前の切り替えからの経過を実行中の段階に加算し、name の段階に切り替える"""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if self.stack:
+            current = self.stages[self.stack[-1]]
+            current['wall_seconds'] += wall - self._last_wall
+            current['cpu_seconds'] += cpu - self._last_cpu
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                current['peak_memory_bytes'] = max(current['peak_memory_bytes'] or 0, peak)
+                tracemalloc.reset_peak()
+            if self._profiles is not None:
+                self._profiles[self.stack[-1]].disable()
+        if self._profiles is not None and name is not None:
+            self._profiles.setdefault(name, cProfile.Profile()).enable()
+        self._last_wall = time.perf_counter()
+        self._last_cpu = time.process_time()
+        return wall
+
+    def _enter(self, name):
+        """段階に入る（開始時刻を返す）"""
+        self._stats(name)['calls'] += 1
+        started = self._switch(name)
+        self.stack.append(name)
+        return started
+
+    def _exit(self, name, started):
+        """段階を抜けて、外側の段階に戻る"""
+        finished = self._switch(self.stack[-2] if len(self.stack) > 1 else None)
+        self.stack.pop()
+        if self.trace:
+            if len(self.events) < self.max_events:
+                self.events.append({
+                    'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                    'ts': (started - self.started_wall) * 1e6,
+                    'dur': (finished - started) * 1e6
+                })
+            else:
+                self.dropped_events += 1
+
+    @contextmanager
+    def stage(self, name, items_in=0):
+        """with ブロックを1つの段階として計測"""
+        self._stats(name)['items_in'] += items_in
+        started = self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit(name, started)
+
+    def iterate(self, name, iterable):
+        """イテラブルから要素を取り出す処理を段階として計測（取り出した件数を出力件数とする）"""
+        stats = self._stats(name)
+        iterator = iter(iterable)
+        while True:
+            started = self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit(name, started)
+            stats['items_out'] += 1
+            yield item
+
+    def wrap(self, name, func, count=None):
+        """関数の呼び出しを段階として計測（呼び出し回数を入力件数、count(戻り値) の合計を出力件数とする）"""
+        stats = self._stats(name)
+
+        def wrapper(*args, **kwargs):
+            started = self._enter(name)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self._exit(name, started)
+            stats['items_in'] += 1
+            if count is not None:
+                stats['items_out'] += count(result)
+            return result
+        return wrapper
+
+    def hottest_stage(self):
+        """最も時間のかかった段階の名前"""
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda name: self.stages[name]['wall_seconds'])
+
+    def summary(self):
+        """計測結果の辞書"""
+        return {
+            'total_wall_seconds': time.perf_counter() - self.started_wall,
+            'total_cpu_seconds': time.process_time() - self.started_cpu,
+            'memory_traced': self.memory,
+            'hottest_stage': self.hottest_stage(),
+            'stages': [dict(name=name, **stats) for name, stats in self.stages.items()]
+        }
+
+    def write(self, path, format='json'):
+        """計測結果を JSON または Chrome トレース形式（chrome://tracing, Perfetto）で書き出す"""
+        summary = self.summary()
+        if format == 'chrome':
+            data = {
+                'traceEvents': self.events,
+                'displayTimeUnit': 'ms',
+                'otherData': dict(summary, dropped_events=self.dropped_events)
+            }
+        else:
+            data = summary
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def dump_hottest(self, path):
+        """最も時間のかかった段階の cProfile 統計を書き出す（pstats で読み込める形式）"""
+        name = self.hottest_stage()
+        if self._profiles is None or name not in self._profiles:
+            return None
+        self._profiles[name].dump_stats(path)
+        return name
+
+
+def add_profile_arguments(parser):
+    """プロファイル用のオプションを追加"""
+    parser.add_argument('--profile', help='段階ごとの処理時間・メモリ・件数の計測結果の出力先')
+    parser.add_argument('--profile-format', choices=PROFILE_FORMATS, default='json',
+                        help='計測結果の形式（json または Chrome トレース）')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='段階ごとの最大メモリも計測する（tracemalloc を使うため処理は遅くなる）')
+    parser.add_argument('--profile-cprofile', help='最も時間のかかった段階の cProfile 統計の出力先')
+
+
+def create_profiler(args):
+    """コマンドライン引数からプロファイラーを生成（--profile の指定がなければ何もしない）"""
+    if not args.profile and not args.profile_cprofile:
+        return NULL_PROFILER
+    return Profiler(memory=args.profile_memory, cprofile=bool(args.profile_cprofile),
+                    trace=args.profile_format == 'chrome')
+
+
+def write_profile(profiler, args):
+    """コマンドライン引数で指定された出力先に計測結果を書き出す"""
+    if not profiler.enabled:
+        return
+    if args.profile:
+        profiler.write(args.profile, args.profile_format)
+        print(f'プロファイルを保存しました: {args.profile}')
+    if args.profile_cprofile:
+        name = profiler.dump_hottest(args.profile_cprofile)
+        print(f'{name} の cProfile 統計を保存しました: {args.profile_cprofile}')
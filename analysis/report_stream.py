@@ -0,0 +1,188 @@
+import csv
+import json
+import os
+import tempfile
+from collections import Counter
+
+RECORD_FORMATS = ['jsonl', 'csv']
+
+# レコードの項目（CSV の列順）。patterns は CSV では | 区切りにする
+RECORD_FIELDS = ['type', 'analysis', 'category', 'pattern', 'patterns', 'timestamp', 'user', 'context', 'count']
+
+
+def hit_record(analysis, entry):
+    """文脈エントリ（またはネガティブ発言）を1件のヒットのレコードに変換"""
+    return {
+        'type': 'hit',
+        'analysis': analysis,
+        'category': entry.get('category'),
+        'pattern': entry['pattern'],
+        'patterns': entry.get('patterns', [entry['pattern']]),
+        'timestamp': entry.get('timestamp', ''),
+        'user': entry.get('user'),
+        'context': entry['context']
+    }
+
+
+class JsonlSink:
+    """レコードを1行1件の JSON で書き出す"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink:
+    """レコードを RECORD_FIELDS の列の CSV で書き出す"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, RECORD_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record):
+        row = dict(record)
+        if 'patterns' in row:
+            row['patterns'] = '|'.join(row['patterns'])
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+def open_record_sink(path, format=None):
+    """レコードの出力先を開く（形式の指定がなければ拡張子から判定し、既定は JSONL）"""
+    if format is None:
+        format = 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'jsonl'
+    return CsvSink(path) if format == 'csv' else JsonlSink(path)
+
+
+def add_record_arguments(parser):
+    """レコード出力用のオプションを追加"""
+    parser.add_argument('--records', help='ヒットと集計のレコードの出力先（走査しながら書き出す）')
+    parser.add_argument('--records-format', choices=RECORD_FORMATS,
+                        help='レコードの形式（省略時は拡張子から判定し、.csv 以外は JSONL）')
+
+
+def open_records(args):
+    """コマンドライン引数からレコードの出力先を開く（--records の指定がなければ None）"""
+    return open_record_sink(args.records, args.records_format) if args.records else None
+
+
+class SpooledSections:
+    """カテゴリごとの本文を一時ファイルに書き溜め、最後にカテゴリの順に取り出す
+
+    件数が多くても、メモリには各カテゴリの件数と buffer_size 件までの未書き出しの本文だけを保持する。
+    """
+
+    def __init__(self, buffer_size=1000):
+        self.buffer_size = buffer_size
+        self._files = {}
+        self._buffers = {}
+        self.counts = Counter()
+
+    def write(self, category, text):
+        buffer = self._buffers.get(category)
+        if buffer is None:
+            buffer = self._buffers[category] = []
+        buffer.append(text)
+        self.counts[category] += 1
+        if len(buffer) >= self.buffer_size:
+            self._flush(category)
+
+    def _flush(self, category):
+        """カテゴリの未書き出しの本文を一時ファイルにまとめて書き出す"""
+        spool = self._files.get(category)
+        if spool is None:
+            spool = self._files[category] = tempfile.TemporaryFile('w+', encoding='utf-8')
+        spool.write(''.join(self._buffers[category]))
+        self._buffers[category] = []
+
+    def copy_to(self, category, f):
+        """カテゴリの本文を f に書き写す"""
+        if category not in self._buffers:
+            return
+        self._flush(category)
+        spool = self._files[category]
+        spool.seek(0)
+        while True:
+            chunk = spool.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+
+    def close(self):
+        for spool in self._files.values():
+            spool.close()
+        self._files = {}
+        self._buffers = {}
+
+
+class CategoryListWriter:
+    """カテゴリ別の発言リストのマークダウンを、文脈エントリから書き出す"""
+
+    def __init__(self, output_file, title, categories):
+        self.output_file = output_file
+        self.title = title
+        self.categories = list(categories)
+        self.sections = SpooledSections()
+
+    def write(self, entry):
+        category = entry['category']
+        number = self.sections.counts[category] + 1
+        self.sections.write(category, f'{number}. {entry["context"]}\n'
+                                      f'    - パターン: {", ".join(entry["patterns"])}\n')
+
+    def close(self):
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            f.write(f'{self.title}\n\n')
+            for category in self.categories:
+                if self.sections.counts[category]:  # コメントが存在する場合のみ出力
+                    f.write(f'## {category}\n\n')
+                    self.sections.copy_to(category, f)
+                    f.write('\n')
+        self.sections.close()
+
+
+class RecordStream:
+    """1つの分析のヒット（文脈エントリ）を、マークダウンの書き出しとレコードの出力先に順に渡す
+
+    マークダウンの書き出しにはエントリをそのまま、レコードの出力先には hit_record で
+    変換したレコードを渡す。close でマークダウンを完成させ、レコードの出力先には
+    (カテゴリ, パターン) ごとの件数を集計レコードとして書き出す。
+    レコードの出力先は複数の分析で共有できるよう、ここでは閉じない。
+    """
+
+    def __init__(self, analysis, markdown=None, records=None):
+        self.analysis = analysis
+        self.markdown = markdown
+        self.records = records
+        self.counts = Counter()
+
+    def write_entries(self, entries):
+        """文脈エントリのリストをヒットのレコードとして渡す"""
+        markdown = self.markdown
+        records = self.records
+        for entry in entries:
+            if markdown is not None:
+                markdown.write(entry)
+            if records is not None:
+                record = hit_record(self.analysis, entry)
+                records.write(record)
+                for pattern in record['patterns']:
+                    self.counts[(record['category'], pattern)] += 1
+
+    def close(self):
+        if self.markdown is not None:
+            self.markdown.close()
+        if self.records is not None:
+            for (category, pattern), count in self.counts.items():
+                self.records.write({
+                    'type': 'aggregate', 'analysis': self.analysis,
+                    'category': category, 'pattern': pattern, 'count': count
+                })
@@ -0,0 +1,190 @@
+from array import array
+from datetime import date
+from trend_aggregator import NO_DAY, decode_array, encode_array, week_start
+
+# 集計の単位と（表の見出し, 区間の列名）
+SENTIMENT_UNITS = {
+    'day': ('日別の感情スコア', '日付'),
+    'week': ('週別の感情スコア', '週の開始日（月曜日）'),
+    'user': ('ユーザー別の感情スコア', 'ユーザー')
+}
+
+
+class SentimentMatrix:
+    """メッセージ × 感情語の出現回数を疎行列（CSR）として蓄積し、重み付きの感情スコアを求める
+
+    感情語は {感情: [語, ...]} の順に列番号を振り、各メッセージの出現回数を1行として
+    indptr / indices / data の array に追記する（出現しない語は保持しない）。
+    スコアは行列と感情ごとの重みのベクトルの積1回で全メッセージ分を求め、日付・週・
+    ユーザーごとの合計は bincount でまとめる（NumPy / SciPy は集計時に読み込む）。
+    """
+
+    def __init__(self, lexicon, weights):
+        self.lexicon = {sentiment: list(words) for sentiment, words in lexicon.items()}
+        self.weights = dict(weights)
+        # 列（感情語）ごとの感情
+        self.term_sentiments = [sentiment for sentiment, words in self.lexicon.items() for _ in words]
+        self.users = []
+        self.user_ids = {}
+        # 行（メッセージ）ごとの列
+        self.days = array('i')
+        self.message_users = array('I')
+        # CSR の配列（indptr は行数 + 1 個）
+        self.indptr = array('Q', [0])
+        self.indices = array('I')
+        self.data = array('I')
+
+    def __len__(self):
+        return len(self.days)
+
+    def add(self, message, hits):
+        """1メッセージ分の感情語のマッチ結果（LexiconMatcher で列番号を index に持つ）を1行として追加"""
+        user = message.user or ''
+        user_id = self.user_ids.get(user)
+        if user_id is None:
+            user_id = self.user_ids[user] = len(self.users)
+            self.users.append(user)
+        self.days.append(message.ts.toordinal() if message.ts else NO_DAY)
+        self.message_users.append(user_id)
+
+        if hits:
+            counts = {}
+            for hit in hits:
+                counts[hit.index] = counts.get(hit.index, 0) + 1
+            for term in sorted(counts):
+                self.indices.append(term)
+                self.data.append(counts[term])
+        self.indptr.append(len(self.indices))
+
+    def matrix(self):
+        """メッセージ × 感情語の出現回数の CSR 行列"""
+        import numpy as np
+        from scipy.sparse import csr_matrix
+        return csr_matrix((np.frombuffer(self.data, dtype=np.uint32).astype(np.int64),
+                           np.frombuffer(self.indices, dtype=np.uint32),
+                           np.frombuffer(self.indptr, dtype=np.uint64).astype(np.int64)),
+                          shape=(len(self), len(self.term_sentiments)))
+
+    def sentiment_matrix(self):
+        """感情語 × 感情の対応（0/1）の行列と、感情の一覧"""
+        import numpy as np
+        sentiments = list(self.lexicon)
+        membership = np.zeros((len(self.term_sentiments), len(sentiments)), dtype=np.int64)
+        for term, sentiment in enumerate(self.term_sentiments):
+            membership[term, sentiments.index(sentiment)] = 1
+        return membership, sentiments
+
+    def totals(self):
+        """感情ごとの感情語の出現回数の合計"""
+        import numpy as np
+        term_totals = np.bincount(np.frombuffer(self.indices, dtype=np.uint32),
+                                  weights=np.frombuffer(self.data, dtype=np.uint32),
+                                  minlength=len(self.term_sentiments))
+        totals = dict.fromkeys(self.lexicon, 0)
+        for sentiment, count in zip(self.term_sentiments, term_totals.tolist()):
+            totals[sentiment] += int(count)
+        return totals
+
+    def scores(self):
+        """メッセージごとの感情スコア（出現回数と重みの積和）"""
+        import numpy as np
+        weights = np.array([self.weights.get(sentiment, 0) for sentiment in self.term_sentiments], dtype=np.float64)
+        return self.matrix() @ weights
+
+    def scores_by(self, unit):
+        """集計単位（day / week / user）ごとの (区間名, メッセージ数, 感情ごとの出現回数, スコアの合計) を返す
+
+        日付・週の集計では時刻のないメッセージを除く。区間は日付順、ユーザーはメッセージ数の多い順。
+        """
+        import numpy as np
+        matrix = self.matrix()
+        membership, _ = self.sentiment_matrix()
+        per_sentiment = np.asarray((matrix @ membership))
+        scores = self.scores()
+
+        if unit == 'user':
+            buckets = np.frombuffer(self.message_users, dtype=np.uint32).astype(np.int64)
+            selected = np.ones(len(buckets), dtype=bool)
+        else:
+            buckets = np.frombuffer(self.days, dtype=np.int32).astype(np.int64)
+            selected = buckets != NO_DAY
+            buckets = buckets[selected]
+            if unit == 'week':
+                buckets = week_start(buckets)
+        values, inverse = np.unique(buckets, return_inverse=True)
+        inverse = inverse.ravel()
+        messages = np.bincount(inverse, minlength=len(values))
+        sentiment_sums = np.stack([np.bincount(inverse, weights=per_sentiment[selected, column], minlength=len(values))
+                                   for column in range(per_sentiment.shape[1])], axis=1).astype(np.int64)
+        score_sums = np.bincount(inverse, weights=scores[selected], minlength=len(values))
+
+        if unit == 'user':
+            order = np.argsort(-messages, kind='stable')
+            names = [self.users[value] or '不明' for value in values[order]]
+            return names, messages[order], sentiment_sums[order], score_sums[order]
+        names = [date.fromordinal(int(value)).isoformat() for value in values]
+        return names, messages, sentiment_sums, score_sums
+
+    def write_tables(self, f, heading='###'):
+        """日別・週別・ユーザー別の感情スコアの表をマークダウンで書き出す"""
+        sentiments = list(self.lexicon)
+        for unit, (title, column) in SENTIMENT_UNITS.items():
+            f.write(f'{heading} {title}\n')
+            if not len(self):
+                f.write('該当なし\n\n')
+                continue
+            names, messages, sentiment_sums, score_sums = self.scores_by(unit)
+            if not names:
+                f.write('該当なし\n\n')
+                continue
+            f.write(f'| {column} | メッセージ数 | ' + ' | '.join(sentiments) + ' | スコア | 100件あたり |\n')
+            f.write('|---|---:|' + '---:|' * len(sentiments) + '---:|---:|\n')
+            for name, count, sums, score in zip(names, messages.tolist(), sentiment_sums.tolist(), score_sums.tolist()):
+                rate = score * 100 / count if count else 0
+                f.write(f'| {name} | {count} | ' + ' | '.join(map(str, sums)) + f' | {score:+g} | {rate:+.1f} |\n')
+            f.write('\n')
+
+    def merge(self, other):
+        """別の行列の行を後ろに加える（チャンネルごとの集計結果の統合用）"""
+        if other.lexicon != self.lexicon or other.weights != self.weights:
+            raise ValueError('感情語または重みが異なる行列はまとめられません')
+        user_ids = []
+        for user in other.users:
+            user_id = self.user_ids.get(user)
+            if user_id is None:
+                user_id = self.user_ids[user] = len(self.users)
+                self.users.append(user)
+            user_ids.append(user_id)
+
+        offset = len(self.indices)
+        self.days.extend(other.days)
+        self.message_users.extend(user_ids[user_id] for user_id in other.message_users)
+        self.indptr.extend(position + offset for position in other.indptr[1:])
+        self.indices.extend(other.indices)
+        self.data.extend(other.data)
+
+    def to_dict(self):
+        """チェックポイント保存用の辞書に変換"""
+        return {
+            'lexicon': self.lexicon,
+            'weights': self.weights,
+            'users': self.users,
+            'days': encode_array(self.days),
+            'message_users': encode_array(self.message_users),
+            'indptr': encode_array(self.indptr),
+            'indices': encode_array(self.indices),
+            'data': encode_array(self.data)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict の辞書から復元"""
+        matrix = cls(data['lexicon'], data['weights'])
+        matrix.users = list(data['users'])
+        matrix.user_ids = {user: i for i, user in enumerate(matrix.users)}
+        matrix.days = decode_array('i', data['days'])
+        matrix.message_users = decode_array('I', data['message_users'])
+        matrix.indptr = decode_array('Q', data['indptr'])
+        matrix.indices = decode_array('I', data['indices'])
+        matrix.data = decode_array('I', data['data'])
+        return matrix
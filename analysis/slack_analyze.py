@@ -0,0 +1,53 @@
+import argparse
+import importlib
+import sys
+
+# サブコマンドと (モジュール名, 説明)。モジュールはサブコマンドを実行するときに初めて読み込む
+COMMANDS = {
+    'all': ('analyze_all', '全分析を1回の読み込みでまとめて実行'),
+    'batch': ('batch_analyzer', 'チャンネルごとのエクスポートを並列に分析し、チャンネル横断のサマリーを作成'),
+    'kpt': ('kpt_analyzer', 'KPT分析'),
+    'negative': ('negative_analyzer', 'ネガティブ発言分析'),
+    'negative-list': ('negative_list_generator', 'ネガティブ発言リストの生成'),
+    'negative-summary': ('negative_summary', 'ネガティブ発言の要約'),
+    'positive-list': ('positive_list_generator', 'ポジティブ発言リストの生成'),
+    'wordcloud': ('wordcloud_generator', 'ワードクラウドの生成'),
+    'cooccurrence': ('cooccurrence', '名詞の共起グラフの作成'),
+    'store': ('message_store', 'エクスポートをメッセージストアに取り込む'),
+    'index': ('message_index', 'メッセージの転置索引の作成・更新と検索'),
+    'synthetic': ('synthetic_export', 'ベンチマーク用の合成エクスポートを生成'),
+    'benchmark': ('benchmark', '処理速度・メモリ使用量・起動時間の計測')
+}
+
+
+def run_command(command, arguments, prog='slack-analyze'):
+    """サブコマンドのモジュールを読み込み、その main() を引数付きで実行"""
+    module_name, _ = COMMANDS[command]
+    module = importlib.import_module(module_name)
+    saved_argv = sys.argv
+    sys.argv = [f'{prog} {command}'] + list(arguments)
+    try:
+        module.main()
+    finally:
+        sys.argv = saved_argv
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='slack-analyze',
+        description='Slack履歴の分析ツール（各サブコマンドのオプションは slack-analyze <サブコマンド> --help で確認）')
+    parser.add_argument('--dicdir', help='MeCabの辞書ディレクトリ（環境変数 SLACK_ANALYSIS_MECAB_DICDIR でも指定可能）')
+    parser.add_argument('--mecabrc', help='MeCabの設定ファイル（環境変数 SLACK_ANALYSIS_MECABRC でも指定可能）')
+    subparsers = parser.add_subparsers(dest='command', metavar='<サブコマンド>', required=True)
+    for command, (_, description) in COMMANDS.items():
+        # オプションの解析はサブコマンドのモジュールに任せる
+        subparsers.add_parser(command, help=description, add_help=False, prefix_chars='\0')
+    args, arguments = parser.parse_known_args()
+
+    if args.dicdir or args.mecabrc:
+        from tokenizer import configure_mecab
+        configure_mecab(args.dicdir, args.mecabrc)
+    run_command(args.command, arguments, parser.prog)
+
+if __name__ == '__main__':
+    main()
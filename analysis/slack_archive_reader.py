@@ -0,0 +1,190 @@
+import codecs
+import json
+import os
+import zipfile
+from datetime import datetime
+from slack_export_reader import SlackMessage
+
+ARCHIVE_SUFFIX = '.zip'
+USERS_FILE = 'users.json'
+
+# ZIP のメンバーから1回に読み出すバイト数
+CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+def split_archive_path(path):
+    """`export.zip` または `export.zip/<チャンネル>` を (ZIP のパス, チャンネル) に分ける
+
+    Slack のエクスポートの ZIP でなければ None を返す（チャンネルの指定がなければ None）。
+    """
+    path = path.rstrip('/')
+    if path.lower().endswith(ARCHIVE_SUFFIX) and os.path.isfile(path):
+        return path, None
+    parent, channel = os.path.split(path)
+    if parent.lower().endswith(ARCHIVE_SUFFIX) and os.path.isfile(parent):
+        return parent, channel
+    return None
+
+
+def is_slack_archive(path):
+    """パスが Slack のエクスポートの ZIP（またはその中のチャンネル）かどうか"""
+    return split_archive_path(path) is not None
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """バイト列のストリームから JSON 配列の要素を1件ずつ読み出す
+
+    chunk_size ずつ読み進め、読み終えた要素は捨てるため、配列全体を読み込まない
+    （メモリには読みかけの要素と1チャンク分だけを保持する）。
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    raw_decode = json.JSONDecoder().raw_decode
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        """読み終えた部分を捨て、次のチャンクを読み足す"""
+        nonlocal buffer, position, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + decoder.decode(chunk, final=eof)
+        position = 0
+
+    def next_char():
+        """空白を読み飛ばし、次の文字を返す（終端なら空文字列）"""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position:position + 1]
+            fill()
+
+    if next_char() != '[':
+        raise ValueError('JSON の配列ではありません')
+    position += 1
+    # 直前の要素の後の区切り（,）をまだ読んでいないか
+    after_value = False
+    while True:
+        char = next_char()
+        if char == ']':
+            return
+        if after_value:
+            if char != ',':
+                raise ValueError(f'JSON の配列の区切りが不正です: {char!r}')
+            position += 1
+            after_value = False
+            continue
+        try:
+            value, end = raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # 要素が読み込んだ範囲で終わっていない
+            if eof:
+                raise
+            fill()
+            continue
+        if not eof and isinstance(value, (int, float)):
+            # 数値はチャンクの境界で途切れている可能性があるため、直後の区切りまで読めていなければやり直す
+            rest = buffer[end:end + 64].lstrip(_WHITESPACE)
+            if not rest or rest[0] not in ',]':
+                fill()
+                continue
+        after_value = True
+        position = end
+        yield value
+
+
+def user_names(users):
+    """users.json の要素から {ユーザーID: 表示名} を作る（fetcher と同じく実名を優先）"""
+    names = {}
+    for user in users:
+        profile = user.get('profile') or {}
+        names[user['id']] = user.get('real_name') or profile.get('real_name') or user.get('name') or user['id']
+    return names
+
+
+def message_from_json(data, users):
+    """エクスポートの JSON の1メッセージを SlackMessage に変換（fetcher が除外するものは None）"""
+    if data.get('type', 'message') != 'message' or data.get('subtype') == 'bot_message':
+        return None
+    ts = data.get('ts')
+    user_id = data.get('user') or 'unknown'
+    profile = data.get('user_profile') or {}
+    return SlackMessage(
+        # fetcher と同じく、ローカル時刻の秒単位にそろえる
+        ts=datetime.fromtimestamp(float(ts)).replace(microsecond=0) if ts else None,
+        user=users.get(user_id) or profile.get('real_name') or user_id,
+        text=(data.get('text') or '').replace('\r\n', '\n'),
+        reactions=tuple((reaction['name'], reaction.get('count', len(reaction.get('users', []))))
+                        for reaction in data.get('reactions') or []),
+        is_thread=bool(data.get('thread_ts'))
+    )
+
+
+class SlackArchive:
+    """Slack の公式エクスポートの ZIP（チャンネルごとのフォルダに日別の JSON）からメッセージを読み出す
+
+    ZIP は展開せず、各メンバーを圧縮されたまま順に読みながら JSON を少しずつ解析する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        # {チャンネル: [日別の JSON のメンバー名, ...]}（日付順）
+        self.members = {}
+        for name in sorted(self.zip.namelist()):
+            channel, separator, filename = name.partition('/')
+            if separator and filename.endswith('.json') and '/' not in filename and not filename.startswith('.'):
+                self.members.setdefault(channel, []).append(name)
+        self._users = None
+
+    @property
+    def channels(self):
+        """チャンネル（フォルダ名）の一覧（名前順）"""
+        return list(self.members)
+
+    @property
+    def users(self):
+        """{ユーザーID: 表示名}（users.json がなければ空）"""
+        if self._users is None:
+            self._users = {}
+            if USERS_FILE in self.zip.NameToInfo:
+                with self.zip.open(USERS_FILE) as f:
+                    self._users = user_names(iter_json_array(f))
+        return self._users
+
+    def iter_channel_messages(self, channels=None):
+        """(チャンネル, メッセージ) をチャンネルごとに日付順で読み出す"""
+        if channels is None:
+            channels = self.channels
+        users = self.users
+        for channel in channels:
+            if channel not in self.members:
+                raise ValueError(f'エクスポートにチャンネルがありません: {channel}')
+            for name in self.members[channel]:
+                with self.zip.open(name) as f:
+                    for data in iter_json_array(f):
+                        message = message_from_json(data, users)
+                        if message is not None:
+                            yield channel, message
+
+    def iter_messages(self, channels=None):
+        """メッセージをチャンネルごとに日付順で読み出す"""
+        for _, message in self.iter_channel_messages(channels):
+            yield message
+
+    def close(self):
+        self.zip.close()
+
+
+def iter_archive_messages(path):
+    """`export.zip`（全チャンネル）または `export.zip/<チャンネル>` からメッセージを読み出す"""
+    archive_path, channel = split_archive_path(path)
+    archive = SlackArchive(archive_path)
+    try:
+        yield from archive.iter_messages([channel] if channel else None)
+    finally:
+        archive.close()
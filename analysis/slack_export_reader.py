@@ -0,0 +1,139 @@
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+# slack_history_fetcher の export_to_markdown が出力する1メッセージ分の情報
+SlackMessage = namedtuple('SlackMessage', ['ts', 'user', 'text', 'reactions', 'is_thread'])
+
+HEADER_PREFIX = '### '
+CODE_FENCE = '```'
+REACTIONS_HEADER = '**リアクション:**'
+THREAD_MARKER = '**スレッド返信**'
+MESSAGE_SEPARATOR = '---'
+
+REACTION_PATTERN = re.compile(r'^- :(.+): \((\d+)\)$')
+
+
+def parse_header(line):
+    """`### YYYY-MM-DD HH:MM:SS - ユーザー名` 形式のヘッダーを解析"""
+    header = line[len(HEADER_PREFIX):]
+    timestamp, separator, user = header.partition(' - ')
+    try:
+        ts = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None, header
+    return ts, user if separator else None
+
+
+def unescape_text(text):
+    """clean_text でエスケープされた改行を元に戻す"""
+    return text.replace('\\n', '\n')
+
+
+def iter_messages(markdown_file):
+    """fetcherが出力したマークダウンからメッセージを1件ずつ読み出す
+
+    ファイルは1行ずつ読み進めるため、ファイルサイズによらず使用メモリは一定。
+    ヘッダーのないコードブロックも ts / user を None としたメッセージとして返す。
+    メッセージストアのディレクトリを指定した場合は、ストアから順に読み出す。
+    Slack の公式エクスポートの ZIP（`export.zip` または `export.zip/<チャンネル>`）は、
+    展開せずにチャンネルごと・日付順に読み出す。
+    """
+    from slack_archive_reader import is_slack_archive, iter_archive_messages
+    if is_slack_archive(markdown_file):
+        yield from iter_archive_messages(markdown_file)
+        return
+
+    if os.path.isdir(markdown_file):
+        from message_store import iter_store_messages
+        yield from iter_store_messages(markdown_file)
+        return
+
+    with open(markdown_file, 'r', encoding='utf-8') as f:
+        yield from parse_lines(f)
+
+
+def open_messages(path, since=None, until=None, users=None):
+    """エクスポートまたはメッセージストアから、期間・ユーザーで絞り込んだメッセージを読み出す"""
+    if os.path.isdir(path):
+        from message_store import iter_store_messages
+        return iter_store_messages(path, since=since, until=until, users=users)
+
+    messages = iter_messages(path)
+    if since is None and until is None and users is None:
+        return messages
+    users = set(users) if users is not None else None
+    return (message for message in messages
+            if (since is None or (message.ts is not None and message.ts >= since))
+            and (until is None or (message.ts is not None and message.ts < until))
+            and (users is None or message.user in users))
+
+
+def add_filter_arguments(parser):
+    """期間・ユーザーでメッセージを絞り込むオプションを追加（open_messages の since / until / users）"""
+    parser.add_argument('--since', type=datetime.fromisoformat, help='この日時以降のメッセージのみ分析（例: 2024-01-01）')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='この日時より前のメッセージのみ分析')
+    parser.add_argument('--user', action='append', dest='users', help='指定したユーザーのメッセージのみ分析（複数指定可）')
+
+
+def parse_lines(lines):
+    """マークダウンの行のイテラブルからメッセージを順に生成"""
+    current = None
+    in_code_block = False
+    in_reactions = False
+    text_lines = []
+
+    def build():
+        return SlackMessage(
+            ts=current['ts'],
+            user=current['user'],
+            text=unescape_text('\n'.join(current['text'])),
+            reactions=tuple(current['reactions']),
+            is_thread=current['is_thread']
+        )
+
+    for line in lines:
+        line = line.rstrip('\n')
+
+        if in_code_block:
+            if line == CODE_FENCE:
+                in_code_block = False
+                if current is None:
+                    current = {'ts': None, 'user': None, 'text': [], 'reactions': [], 'is_thread': False}
+                current['text'].extend(text_lines)
+            else:
+                text_lines.append(line)
+            continue
+
+        if line == CODE_FENCE:
+            in_code_block = True
+            in_reactions = False
+            text_lines = []
+        elif line.startswith(HEADER_PREFIX):
+            if current is not None:
+                yield build()
+            ts, user = parse_header(line)
+            current = {'ts': ts, 'user': user, 'text': [], 'reactions': [], 'is_thread': False}
+            in_reactions = False
+        elif line == MESSAGE_SEPARATOR:
+            if current is not None:
+                yield build()
+            current = None
+            in_reactions = False
+        elif current is None:
+            continue
+        elif line == REACTIONS_HEADER:
+            in_reactions = True
+        elif line == THREAD_MARKER:
+            current['is_thread'] = True
+            in_reactions = False
+        elif in_reactions:
+            match = REACTION_PATTERN.match(line)
+            if match:
+                current['reactions'].append((match.group(1), int(match.group(2))))
+            elif line:
+                in_reactions = False
+
+    if current is not None:
+        yield build()
@@ -0,0 +1,112 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+
+# 文の主語になる話題
+SUBJECTS = [
+    '本番環境', 'ステージング環境', 'CI', 'デプロイ', '新機能', 'ログイン画面', 'API', 'バッチ処理',
+    'ダッシュボード', '結合テスト', '設計資料', '定例会議', '次回のリリース', 'データベース', '検索機能',
+    '管理画面', '通知機能', '監視設定', '見積もり', '議事録'
+]
+
+# 分析のキーワードを含まない文末
+NEUTRAL_PHRASES = [
+    'を共有します', 'について相談させてください', 'は明日までに進めておきます', 'のレビューをお願いします',
+    'の資料をアップしました', 'について会議室を押さえました', 'の本日の状況です', 'は午後から作業します',
+    'の手順書を更新しました', 'の担当を決めましょう', 'はこのままで大丈夫そうですね', 'の件、承知しました'
+]
+
+# 分析のキーワードを含む文末（KPT・ネガティブ・ポジティブの各辞書にヒットする）
+LEXICON_PHRASES = [
+    # Keep・成果
+    'がとても良いです', 'が便利になりました', 'のおかげで助かった', 'の移行に成功しました',
+    'が改善されたと思います', 'が効率的になりました', 'が快適です', 'が使いやすいです',
+    'の対応が完了しました', 'の目標を達成できた', 'の不具合は修正済みです', 'がうまくいった',
+    # Problem・懸念
+    'で問題が発生しています', 'の課題が残っています', 'でエラーが出ています', 'が難しいです',
+    'が不便です', 'に時間がかかる', 'が複雑すぎます', 'が分かりにくい', 'の対応が遅れています',
+    'が失敗しました', 'の影響が懸念です', 'が起動できない状態です', 'の設定が反映されない',
+    'でタイムアウトが多発しています', 'のスケジュールが心配です', 'の認識違いがありました',
+    # Try
+    'の改善案を提案します', 'の導入を検討しています', 'を試してみるのはどうでしょう',
+    'を実装してみます', 'の最適化を進めたいです', 'を新しい仕組みに変更したいです',
+    # 感謝・謝罪
+    'の件、ありがとうございます', 'の件、すみません', 'の件、申し訳ありません', 'お疲れ様でした'
+]
+
+MENTIONS = ['<@U01ABCDEF>', '<@U02GHIJKL>', '<@U03MNOPQR>']
+URLS = ['https://example.com/wiki/spec', 'https://github.com/example/app/pull/123', 'https://docs.example.com/guide']
+EMOJI = [':+1:', ':pray:', ':eyes:', ':tada:', ':white_check_mark:']
+REACTION_NAMES = ['+1', 'pray', 'eyes', 'tada', 'white_check_mark', 'ok_hand']
+
+# 既定の開始日時
+DEFAULT_START = datetime(2023, 1, 1, 9, 0, 0)
+
+
+def generate_text(rng, hit_rate):
+    """1メッセージ分の本文（1〜4文）を生成"""
+    sentences = []
+    for _ in range(rng.randint(1, 4)):
+        phrases = LEXICON_PHRASES if rng.random() < hit_rate else NEUTRAL_PHRASES
+        sentences.append(rng.choice(SUBJECTS) + rng.choice(phrases) + '。')
+    if rng.random() < 0.15:
+        sentences.insert(0, rng.choice(MENTIONS) + ' ')
+    if rng.random() < 0.1:
+        sentences.append(' ' + rng.choice(URLS))
+    if rng.random() < 0.1:
+        sentences.append(rng.choice(EMOJI))
+    # 複数行のメッセージ
+    separator = '\n' if rng.random() < 0.1 else ''
+    return separator.join(sentences)
+
+
+def generate_messages(count, seed=0, users=20, start=DEFAULT_START, hit_rate=0.35):
+    """(時刻, ユーザー名, 本文, リアクション, スレッド返信か) を時刻順に count 件生成
+
+    同じ seed からは常に同じメッセージ列を生成する。hit_rate は各文が
+    分析のキーワードを含む確率。
+    """
+    rng = random.Random(seed)
+    user_names = [f'user{i:02d}' for i in range(1, users + 1)]
+    ts = start
+    for _ in range(count):
+        # 数秒〜数分間隔で投稿（同じ秒の投稿も一定数含む）
+        ts += timedelta(seconds=int(rng.expovariate(1 / 90)))
+        reactions = []
+        if rng.random() < 0.3:
+            for name in rng.sample(REACTION_NAMES, rng.randint(1, 3)):
+                reactions.append((name, rng.randint(1, 8)))
+        yield ts, rng.choice(user_names), generate_text(rng, hit_rate), reactions, rng.random() < 0.2
+
+
+def write_export(output_file, count, seed=0, users=20, hit_rate=0.35):
+    """slack_history_fetcher の export_to_markdown と同じ形式でエクスポートを書き出す"""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('# Slackチャンネル履歴\n\n## メッセージ一覧\n\n')
+        for ts, user, text, reactions, is_thread in generate_messages(count, seed, users, hit_rate=hit_rate):
+            lines = [f'### {ts.strftime("%Y-%m-%d %H:%M:%S")} - {user}', '', '```',
+                     text.replace('\n', '\\n'), '```', '']
+            if reactions:
+                lines.append('**リアクション:**')
+                lines.extend(f'- :{name}: ({count})' for name, count in reactions)
+                lines.append('')
+            if is_thread:
+                lines.extend(['**スレッド返信**', ''])
+            lines.extend(['---', ''])
+            f.write('\n'.join(lines) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ベンチマーク用の合成Slackエクスポートを生成')
+    parser.add_argument('output_file', help='出力マークダウンファイルのパス')
+    parser.add_argument('--messages', '-n', type=int, default=10000, help='メッセージ数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    parser.add_argument('--users', type=int, default=20, help='ユーザー数')
+    parser.add_argument('--hit-rate', type=float, default=0.35, help='各文が分析のキーワードを含む確率')
+    args = parser.parse_args()
+
+    write_export(args.output_file, args.messages, args.seed, args.users, args.hit_rate)
+    print(f'{args.messages}件のメッセージを生成しました: {args.output_file}')
+
+if __name__ == '__main__':
+    main()
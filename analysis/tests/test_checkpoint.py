@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpoint import Checkpoint
+from slack_export_reader import SlackMessage
+
+
+def message(minute, text, user='alice'):
+    """2024-01-01 00:00 から minute 分後のメッセージ"""
+    return SlackMessage(datetime(2024, 1, 1) + timedelta(minutes=minute), user, text, (), False)
+
+
+class CheckpointBoundaryTest(unittest.TestCase):
+    """処理済みの記録が時間幅の分だけに限られ、遅れて届いたメッセージも一度だけ処理されることを確かめる"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_once(self, messages):
+        """チェックポイントを開いて新しいメッセージを処理し、保存して処理したメッセージを返す"""
+        checkpoint = Checkpoint(self.path, overlap=timedelta(minutes=30))
+        processed = list(checkpoint.new_messages(messages))
+        checkpoint.save()
+        return processed, checkpoint
+
+    def test_boundary_is_pruned_to_overlap(self):
+        history = [message(minute, f'発言{minute}') for minute in range(24 * 60)]
+        processed, checkpoint = self.run_once(history)
+        self.assertEqual(len(processed), len(history))
+        # 最後の時刻から30分以内の31件だけを記録する
+        self.assertEqual(len(checkpoint.boundary), 31)
+        self.assertEqual(len(Checkpoint(self.path).boundary), 31)
+
+    def test_overlapping_export(self):
+        self.run_once([message(minute, f'発言{minute}') for minute in range(100)])
+        # 前回と重なるエクスポートに、遅れて届いた発言と新しい発言が含まれる
+        late = message(90, '遅れて届いた発言', 'bob')
+        export = [message(minute, f'発言{minute}') for minute in range(50, 120)] + [late]
+        processed, _ = self.run_once(export)
+        self.assertEqual(processed, export[50:70] + [late])
+        # 同じエクスポートをもう一度読んでも処理しない
+        processed, _ = self.run_once(export)
+        self.assertEqual(processed, [])
+
+    def test_same_second_messages(self):
+        self.run_once([message(0, '同時刻1')])
+        processed, _ = self.run_once([message(0, '同時刻1'), message(0, '同時刻2')])
+        self.assertEqual([item.text for item in processed], ['同時刻2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chunked_analysis
+from analyze_all import REPORT_FILES, UnifiedAnalyzer
+from chunked_analysis import ChunkedAnalyzer, current_memory
+from synthetic_export import write_export
+
+# 比較するテキストのレポート（ワードクラウドは描画に渡す出現回数で比較する）
+TEXT_REPORTS = [name for name, filename in REPORT_FILES.items() if filename.endswith('.md')]
+
+
+@unittest.skipUnless(importlib.util.find_spec('MeCab'), 'MeCab がない環境')
+class ChunkedAnalyzerTest(unittest.TestCase):
+    """メモリの上限を指定した分割実行が、一括の実行と同じレポートを出力することを確かめる"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.input_file = os.path.join(cls.directory.name, 'slack_history.md')
+        write_export(cls.input_file, 1500, seed=7)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def run_both(self, keyword_capacity):
+        """一括と分割で全レポートを出力し、(一括, 分割) の (出力パス, ワードクラウドの出現回数) を返す"""
+        results = []
+        for chunked in (False, True):
+            output_dir = os.path.join(self.directory.name, f'{keyword_capacity}_{chunked}')
+            analyzer = UnifiedAnalyzer(keyword_capacity=keyword_capacity)
+            with mock.patch('wordcloud_generator.generate_wordcloud_from_frequencies') as render:
+                if chunked:
+                    # 最小のチャンクを小さくし、上限を現在の使用量の直上にして多数のチャンクに分ける
+                    with mock.patch.object(chunked_analysis, 'MIN_CHUNK_BYTES', 20000):
+                        runner = ChunkedAnalyzer(analyzer, current_memory() + 1024 * 1024)
+                        paths = runner.run(self.input_file, output_dir)
+                    self.assertGreater(runner.chunks, 3)
+                else:
+                    paths = analyzer.run(self.input_file, output_dir)
+            results.append((paths, render.call_args.args[0]))
+        return results
+
+    def assert_same_reports(self, expected_paths, actual_paths):
+        for name in TEXT_REPORTS:
+            with self.subTest(report=name):
+                with open(expected_paths[name], encoding='utf-8') as expected, \
+                        open(actual_paths[name], encoding='utf-8') as actual:
+                    self.assertEqual(actual.read(), expected.read())
+
+    def test_same_reports(self):
+        (expected_paths, expected_counts), (actual_paths, actual_counts) = self.run_both(keyword_capacity=50000)
+        self.assert_same_reports(expected_paths, actual_paths)
+        self.assertEqual(dict(actual_counts), dict(expected_counts))
+
+    def test_same_reports_with_keyword_overflow(self):
+        # 語彙が追跡する語数を超え、チャンクごとのカウンターをまとめてから数え直す場合
+        (expected_paths, _), (actual_paths, _) = self.run_both(keyword_capacity=50)
+        self.assert_same_reports(expected_paths, actual_paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_store import MessageStore, MessageStoreWriter
+from slack_export_reader import SlackMessage, open_messages
+
+
+def set_timezone(name):
+    """プロセスのタイムゾーンを切り替える（None で元に戻す）"""
+    if name is None:
+        os.environ.pop('TZ', None)
+    else:
+        os.environ['TZ'] = name
+    time.tzset()
+
+
+@unittest.skipUnless(hasattr(time, 'tzset'), 'タイムゾーンを切り替えられない環境')
+class MessageStoreTimezoneTest(unittest.TestCase):
+    """ストアの時刻が、書き込み時と読み出し時のタイムゾーンによらず同じになることを確かめる"""
+
+    def setUp(self):
+        self.saved_timezone = os.environ.get('TZ')
+        self.directory = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.directory.name, 'store')
+        self.messages = [
+            SlackMessage(datetime(2024, 3, 10, 1, 30), 'alice', '朝の連絡', (), False),
+            # 米国の夏時間の切り替え（2024-03-10 02:00）をまたぐ時刻
+            SlackMessage(datetime(2024, 3, 10, 2, 30), 'bob', '切り替え直後', (('eyes', 1),), False),
+            SlackMessage(datetime(2024, 3, 10, 23, 59, 59), 'alice', '日付が変わる直前', (), True),
+            SlackMessage(None, None, '時刻なし', (), False)
+        ]
+
+    def tearDown(self):
+        set_timezone(self.saved_timezone)
+        self.directory.cleanup()
+
+    def write_store(self):
+        writer = MessageStoreWriter(self.store_dir)
+        writer.add_messages(self.messages, 'general')
+        writer.close()
+
+    def test_round_trip_under_another_timezone(self):
+        set_timezone('Asia/Tokyo')
+        self.write_store()
+        set_timezone('America/New_York')
+        with MessageStore(self.store_dir) as store:
+            self.assertEqual(list(store.iter_messages()), self.messages)
+
+    def test_period_selection_under_another_timezone(self):
+        set_timezone('UTC')
+        self.write_store()
+        set_timezone('Asia/Kolkata')
+        selected = list(open_messages(self.store_dir, since=datetime(2024, 3, 10, 2), until=datetime(2024, 3, 11)))
+        self.assertEqual([message.text for message in selected], ['切り替え直後', '日付が変わる直前'])
+
+
+if __name__ == '__main__':
+    unittest.main()
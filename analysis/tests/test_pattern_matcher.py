@@ -0,0 +1,65 @@
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pattern_matcher import LexiconMatcher
+
+
+def finditer_hits(entries, text):
+    """パターンごとに re.finditer で求めた (辞書内の通し番号, 開始位置, 終了位置) の一覧"""
+    return sorted((index, match.start(), match.end())
+                  for index, (_, pattern) in enumerate(entries)
+                  for match in re.finditer(re.escape(pattern), text))
+
+
+def scan_hits(hits):
+    """LexiconMatcher のマッチ結果を finditer_hits と同じ形にする"""
+    return sorted((hit.index, hit.start, hit.end) for hit in hits)
+
+
+def random_texts(patterns, count, seed):
+    """パターンと紛らわしい文字を混ぜた本文を生成"""
+    generator = random.Random(seed)
+    pieces = list(patterns) + [pattern[:-1] for pattern in patterns if len(pattern) > 1] + list('あいうabc 、。\n')
+    return [''.join(generator.choice(pieces) for _ in range(generator.randint(0, 30))) for _ in range(count)]
+
+
+class LexiconMatcherTest(unittest.TestCase):
+    """1回の走査で、パターンごとの re.finditer と同じマッチが求まることを確かめる"""
+
+    def assert_same_hits(self, matcher, texts):
+        for text, hits in zip(texts, matcher.scan_texts(texts)):
+            self.assertEqual(scan_hits(hits), finditer_hits(matcher.entries, text), text)
+
+    def test_overlapping_patterns(self):
+        # 接頭辞・接尾辞の重なり、自身との重なり、同じパターンの別カテゴリを含む
+        patterns = {
+            'a': ['ab', 'abc', 'bc', 'aa', 'aaa'],
+            'b': ['ab', 'ca', 'ああ', 'あいあ'],
+            'c': ['c', 'いあい']
+        }
+        matcher = LexiconMatcher(patterns)
+        self.assert_same_hits(matcher, ['aaaa', 'abcabc', 'ああああ', 'あいあいあいあ', ''])
+        self.assert_same_hits(matcher, random_texts([p for ps in patterns.values() for p in ps], 300, 1))
+
+    def test_analyzer_lexicons(self):
+        # 各分析の辞書全体で比較する（メッセージをまとめて走査する場合も同じ結果になる）
+        from analyze_all import UnifiedAnalyzer
+        analyzer = UnifiedAnalyzer()
+        for name, component in analyzer.analyzers.items():
+            with self.subTest(analyzer=name):
+                matcher = component.matcher
+                patterns = [pattern for _, pattern in matcher.entries]
+                self.assert_same_hits(matcher, random_texts(patterns, 200, name))
+
+    def test_separator_is_rejected(self):
+        with self.assertRaises(ValueError):
+            LexiconMatcher(['a\x00b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
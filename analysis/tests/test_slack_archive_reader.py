@@ -0,0 +1,87 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slack_archive_reader import SlackArchive, iter_json_array
+
+# チャンクの境界がマルチバイト文字・エスケープ・数値の途中に来るよう、要素に各種の値を含める
+ELEMENTS = [
+    {'type': 'message', 'user': 'U1', 'text': '改善が必要です。"引用" と \\ バックスラッシュ', 'ts': '1704067200.000100'},
+    {'text': 'エスケープ あ\n改行\t絵文字 \U0001F600', 'reactions': [{'name': 'eyes', 'count': 12}]},
+    1234567890.125,
+    -42,
+    'ABC',
+    [],
+    {},
+    None,
+    True,
+    {'nested': {'list': [1, 2.5e10, {'deep': 'ネスト'}], 'empty': ''}}
+]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    """JSON 配列をチャンクに分けて読んでも、json.loads と同じ要素が順に得られることを確かめる"""
+
+    def assert_streams(self, data, expected):
+        for chunk_size in (1, 2, 3, 5, 7, 64, 1 << 20):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_json_array(io.BytesIO(data), chunk_size)), expected)
+
+    def test_split_elements(self):
+        data = json.dumps(ELEMENTS, ensure_ascii=False).encode('utf-8')
+        self.assert_streams(data, ELEMENTS)
+
+    def test_escaped_elements(self):
+        # \\uXXXX（サロゲートペアを含む）でエスケープされた本文
+        data = json.dumps(ELEMENTS, ensure_ascii=True, indent=2).encode('utf-8')
+        self.assert_streams(data, ELEMENTS)
+
+    def test_bom_and_whitespace(self):
+        data = '\ufeff \n[ 1 ,\n "a" ,\t{"b": 2} ]\n'.encode('utf-8')
+        self.assert_streams(data, [1, 'a', {'b': 2}])
+
+    def test_empty_array(self):
+        self.assert_streams(b'[]', [])
+        self.assert_streams(b'  [ \n ]  ', [])
+
+    def test_invalid_input(self):
+        for data in (b'{"a": 1}', b'[1 2]', b'[{"a": '):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                list(iter_json_array(io.BytesIO(data), 2))
+
+
+class SlackArchiveTest(unittest.TestCase):
+    """ZIP のチャンネルのフォルダから、日付順にメッセージを読み出せることを確かめる"""
+
+    def test_iter_messages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.zip')
+            with zipfile.ZipFile(path, 'w') as archive:
+                archive.writestr('users.json', json.dumps([{'id': 'U1', 'real_name': '山田'}]))
+                archive.writestr('general/2024-01-02.json', json.dumps([
+                    {'type': 'message', 'user': 'U1', 'text': '二日目', 'ts': '1704153600.000000'}
+                ]))
+                archive.writestr('general/2024-01-01.json', json.dumps([
+                    {'type': 'message', 'user': 'U2', 'text': '初日\r\nです', 'ts': '1704067200.000000',
+                     'thread_ts': '1704067100.000000', 'reactions': [{'name': 'eyes', 'users': ['U1', 'U3']}]},
+                    {'type': 'message', 'subtype': 'bot_message', 'text': 'ボット', 'ts': '1704067300.000000'}
+                ], ensure_ascii=False))
+            archive = SlackArchive(path)
+            try:
+                messages = list(archive.iter_messages())
+            finally:
+                archive.close()
+        self.assertEqual([message.text for message in messages], ['初日\nです', '二日目'])
+        self.assertEqual([message.user for message in messages], ['U2', '山田'])
+        self.assertEqual(messages[0].reactions, (('eyes', 2),))
+        self.assertTrue(messages[0].is_thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
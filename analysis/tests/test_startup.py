@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ANALYSIS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ANALYSIS_DIR)
+
+from slack_analyze import COMMANDS
+
+# 起動時に読み込まれてはいけない重いモジュール（分析の実行時に初めて読み込む）
+HEAVY_MODULES = ('MeCab', 'matplotlib', 'scipy', 'numpy', 'wordcloud')
+
+# slack-analyze <サブコマンド> --help を実行し、読み込まれた重いモジュールを出力するスクリプト
+HELP_SCRIPT = '''
+import json, runpy, sys
+sys.argv = ['slack_analyze.py', sys.argv[1], '--help']
+try:
+    runpy.run_path('slack_analyze.py', run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps([name for name in sys.argv[2:] if name in sys.modules]))
+'''
+
+
+class StartupImportTest(unittest.TestCase):
+    """各サブコマンドの --help が、重いモジュールを読み込まずに返ることを確かめる"""
+
+    def test_help_does_not_import_heavy_modules(self):
+        for command in COMMANDS:
+            with self.subTest(command=command):
+                completed = subprocess.run([sys.executable, '-c', HELP_SCRIPT, command, *HEAVY_MODULES],
+                                           cwd=ANALYSIS_DIR, capture_output=True, text=True)
+                self.assertIn('usage:', completed.stdout)
+                self.assertEqual(json.loads(completed.stderr.strip().splitlines()[-1]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
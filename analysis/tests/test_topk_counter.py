@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topk_counter import SpaceSavingCounter, recount
+
+
+def exact_top(counter, tokens, k):
+    """candidates と recount で求めた上位 k 語の回数"""
+    counts = recount(counter.candidates(k), [tokens])
+    return sorted(counts.values(), reverse=True)[:k]
+
+
+class SpaceSavingCandidatesTest(unittest.TestCase):
+    """数え直しの候補から、真の上位 k 語の回数が求まることを確かめる"""
+
+    def test_evicted_words_in_top(self):
+        # 上位の語が早くに現れ、1回ずつの語の置き換えで追い出されるストリーム
+        tokens = ['a'] * 3 + ['b'] * 3 + [f'x{i}' for i in range(20)] + ['c'] * 2
+        counter = SpaceSavingCounter(capacity=3)
+        counter.update(tokens)
+        self.assertNotIn('a', counter.counts)
+        self.assertIsNone(counter.candidates(2))
+        self.assertEqual(exact_top(counter, tokens, 2), [3, 3])
+
+    def test_tracked_candidates(self):
+        # 上位の語の回数が最小回数を十分に上回る場合は、追跡中の語だけを候補にする
+        tokens = (['a'] * 50 + ['b'] * 40 + [f'x{i}' for i in range(30)]) * 2
+        counter = SpaceSavingCounter(capacity=5)
+        counter.update(tokens)
+        candidates = counter.candidates(2)
+        self.assertIsNotNone(candidates)
+        self.assertLessEqual({'a', 'b'}, candidates)
+        self.assertEqual(exact_top(counter, tokens, 2), [100, 80])
+
+    def test_overflowing_streams(self):
+        # 語彙が capacity を超える様々なストリームで、真の上位 k 語の回数と一致する
+        for seed in range(50):
+            tokens = [f'w{(i * 7919 + seed) % (seed + 11) ** 2 % (seed + 13)}' for i in range(400)]
+            tokens += [f'u{i}' for i in range(seed * 3)]
+            counter = SpaceSavingCounter(capacity=8)
+            counter.update(tokens)
+            expected = sorted(Counter(tokens).values(), reverse=True)[:5]
+            self.assertEqual(exact_top(counter, tokens, 5), expected, seed)
+
+
+if __name__ == '__main__':
+    unittest.main()
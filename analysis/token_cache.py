@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sqlite3
+import zlib
+
+# キャッシュの既定の上限サイズ（バイト）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 値の先頭1バイトで圧縮の有無を表す
+RAW = b'\x00'
+COMPRESSED = b'\x01'
+
+# この長さを超えるトークン列は zlib で圧縮して保存する
+COMPRESS_THRESHOLD = 256
+
+TOKEN_SEPARATOR = '\x1f'
+
+
+def encode_tokens(tokens):
+    """トークン列をコンパクトなバイト列に変換"""
+    data = TOKEN_SEPARATOR.join(tokens).encode('utf-8')
+    if len(data) > COMPRESS_THRESHOLD:
+        return COMPRESSED + zlib.compress(data, 1)
+    return RAW + data
+
+
+def decode_tokens(value):
+    """encode_tokens で変換したバイト列をトークン列に戻す"""
+    data = bytes(value)
+    flag, body = data[:1], data[1:]
+    if flag == COMPRESSED:
+        body = zlib.decompress(body)
+    text = body.decode('utf-8')
+    return text.split(TOKEN_SEPARATOR) if text else []
+
+
+class TokenCache:
+    """メッセージ本文のハッシュと辞書の識別子をキーにした形態素解析結果のキャッシュ
+
+    SQLite ファイルに保存し、合計サイズが上限を超えた場合は
+    最後に使われた実行が古いものから削除する。
+    """
+
+    def __init__(self, path, dictionary_id, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.dictionary_id = dictionary_id.encode('utf-8')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tokens ('
+            'key BLOB PRIMARY KEY, value BLOB NOT NULL, '
+            'size INTEGER NOT NULL, last_used INTEGER NOT NULL) WITHOUT ROWID'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+        # 実行ごとに世代番号を進め、LRU の判定に使う
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        self.generation = (row[0] if row else 0) + 1
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('generation', ?)", (self.generation,)
+        )
+        self._used_keys = []
+
+    def key(self, text):
+        """辞書の識別子と本文から内容アドレスのキーを計算"""
+        digest = hashlib.blake2b(self.dictionary_id, digest_size=16)
+        digest.update(b'\x00')
+        digest.update(text.encode('utf-8'))
+        return digest.digest()
+
+    def get(self, text):
+        """キャッシュ済みのトークン列を返す（未登録の場合は None）"""
+        key = self.key(text)
+        row = self.connection.execute('SELECT value FROM tokens WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used_keys.append((self.generation, key))
+        return decode_tokens(row[0])
+
+    def put(self, text, tokens):
+        """トークン列をキャッシュに登録"""
+        value = encode_tokens(tokens)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO tokens (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+            (self.key(text), value, len(value) + 16, self.generation)
+        )
+
+    def total_size(self):
+        """キャッシュに保存されている値の合計サイズ"""
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM tokens').fetchone()[0]
+
+    def evict(self):
+        """上限サイズを超えた分を、最後に使われた世代が古いものから削除"""
+        excess = self.total_size() - self.max_bytes
+        if excess <= 0:
+            return 0
+
+        removed = 0
+        stale_keys = []
+        for key, size in self.connection.execute('SELECT key, size FROM tokens ORDER BY last_used'):
+            if removed >= excess:
+                break
+            stale_keys.append((key,))
+            removed += size
+        self.connection.executemany('DELETE FROM tokens WHERE key = ?', stale_keys)
+        return len(stale_keys)
+
+    def flush(self):
+        """使用履歴を反映し、上限を超えた分を削除して保存"""
+        self.connection.executemany('UPDATE tokens SET last_used = ? WHERE key = ?', self._used_keys)
+        self._used_keys = []
+        self.evict()
+        self.connection.commit()
+
+    def close(self):
+        """保存してキャッシュファイルを閉じる"""
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,205 @@
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from token_cache import TokenCache, DEFAULT_MAX_BYTES
+
+# MeCabの辞書と設定ファイルの既定のパス（Homebrew）
+DEFAULT_DICDIR = '/opt/homebrew/lib/mecab/dic/ipadic'
+DEFAULT_MECABRC = '/opt/homebrew/etc/mecabrc'
+
+# 既定のパスを上書きする環境変数
+DICDIR_ENV = 'SLACK_ANALYSIS_MECAB_DICDIR'
+MECABRC_ENV = 'SLACK_ANALYSIS_MECABRC'
+
+# configure_mecab で指定されたパス
+_mecab_paths = {'dicdir': None, 'rcfile': None}
+
+
+def configure_mecab(dicdir=None, rcfile=None):
+    """以降に生成するTaggerの辞書・設定ファイルのパスを指定"""
+    _mecab_paths['dicdir'] = dicdir
+    _mecab_paths['rcfile'] = rcfile
+
+
+def mecab_paths():
+    """configure_mecab で指定された (辞書ディレクトリ, 設定ファイル)（ワーカープロセスに引き継ぐ用途）"""
+    return _mecab_paths['dicdir'], _mecab_paths['rcfile']
+
+
+def add_mecab_arguments(parser):
+    """MeCabの辞書・設定ファイルのパスのオプションを追加"""
+    parser.add_argument('--dicdir', help=f'MeCabの辞書ディレクトリ（環境変数 {DICDIR_ENV} でも指定可能）')
+    parser.add_argument('--mecabrc', help=f'MeCabの設定ファイル（環境変数 {MECABRC_ENV} でも指定可能）')
+
+
+def apply_mecab_arguments(args):
+    """コマンドライン引数で指定された辞書・設定ファイルを、以降に生成するTaggerに使う（指定がなければ何もしない）"""
+    if args.dicdir or args.mecabrc:
+        configure_mecab(args.dicdir, args.mecabrc)
+
+
+def mecab_args():
+    """Taggerに渡す引数（configure_mecab の指定、環境変数、既定のパスの順に優先）"""
+    dicdir = _mecab_paths['dicdir'] or os.environ.get(DICDIR_ENV) or DEFAULT_DICDIR
+    rcfile = _mecab_paths['rcfile'] or os.environ.get(MECABRC_ENV) or DEFAULT_MECABRC
+    return f'-d {dicdir} -r {rcfile}'
+
+
+def create_tagger(args=None):
+    """MeCabで形態素解析（設定ファイルと辞書のパスを明示的に指定）"""
+    import MeCab
+    return MeCab.Tagger(args or mecab_args())
+
+
+def dictionary_identity(tagger):
+    """辞書の種類・版・更新日時から辞書を識別する文字列を作る"""
+    identities = []
+    info = tagger.dictionary_info()
+    while info:
+        try:
+            modified = int(os.path.getmtime(info.filename))
+        except OSError:
+            modified = 0
+        identities.append(f'{info.filename}:{info.version}:{info.size}:{info.charset}:{modified}')
+        info = info.next
+    return '|'.join(identities)
+
+
+def clean_text(text):
+    """メンション、URL、絵文字などを削除"""
+    text = re.sub(r'<@[A-Z0-9]+>', '', text)  # メンション
+    text = re.sub(r'https?://\S+', '', text)  # URL
+    text = re.sub(r':[a-z_]+:', '', text)     # 絵文字
+    return text
+
+
+def parse_nouns(tagger, text):
+    """名詞のみを抽出"""
+    node = tagger.parseToNode(text)
+    words = []
+    while node:
+        if node.feature.split(',')[0] == '名詞':
+            words.append(node.surface)
+        node = node.next
+    return words
+
+
+# ワーカープロセスごとに1つだけ生成するTagger
+_worker_tagger = None
+
+
+def _init_worker(args):
+    """ワーカープロセスの初期化時にTaggerを生成"""
+    global _worker_tagger
+    _worker_tagger = create_tagger(args)
+
+
+def _parse_chunk(texts):
+    """ワーカープロセスでチャンク内の各本文から名詞を抽出"""
+    return [parse_nouns(_worker_tagger, text) for text in texts]
+
+
+def iter_chunks(iterable, size):
+    """イテラブルを size 件ずつのリストに区切る"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class NounTokenizer:
+    """メッセージ単位で名詞を抽出するトークナイザー
+
+    cache_path を指定すると、解析結果をディスク上のキャッシュに保存し、
+    同じ辞書・同じ本文のメッセージは再解析しない。
+    workers に2以上を指定すると、tokenize_messages はメッセージをチャンクに分けて
+    プロセスプールで解析する（ワーカーごとにTaggerを1つ生成）。結果の順序は逐次実行と同じ。
+    Taggerとキャッシュは最初に解析するときに生成する。
+    """
+
+    def __init__(self, cache_path=None, cache_max_bytes=DEFAULT_MAX_BYTES, workers=1, chunk_size=1000):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.cache_path = cache_path
+        self.cache_max_bytes = cache_max_bytes
+        # ワーカープロセスにも同じ辞書を使わせるため、生成時点の引数を保持する
+        self.mecab_args = mecab_args()
+        self._mecab = None
+        self._cache = None
+
+    @property
+    def mecab(self):
+        """形態素解析に使うTagger"""
+        if self._mecab is None:
+            self._mecab = create_tagger(self.mecab_args)
+        return self._mecab
+
+    @property
+    def cache(self):
+        """解析結果のキャッシュ（cache_path の指定がなければ None）"""
+        if self._cache is None and self.cache_path:
+            self._cache = TokenCache(self.cache_path, dictionary_identity(self.mecab), self.cache_max_bytes)
+        return self._cache
+
+    def nouns(self, text):
+        """本文から名詞のリストを返す"""
+        if self.cache is None:
+            return parse_nouns(self.mecab, text)
+
+        words = self.cache.get(text)
+        if words is None:
+            words = parse_nouns(self.mecab, text)
+            self.cache.put(text, words)
+        return words
+
+    def tokenize_messages(self, messages, preprocess=None):
+        """メッセージごとに (メッセージ, 名詞のリスト) を入力順に生成"""
+        if self.workers <= 1:
+            for message in messages:
+                text = preprocess(message.text) if preprocess else message.text
+                yield message, self.nouns(text)
+            return
+
+        # 先読みするチャンク数を制限し、メモリ使用量を一定に保つ
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.mecab_args,)) as executor:
+            for chunk in iter_chunks(messages, self.chunk_size):
+                pending.append(self._submit_chunk(executor, chunk, preprocess))
+                if len(pending) >= self.workers * 2:
+                    yield from self._collect_chunk(*pending.popleft())
+            while pending:
+                yield from self._collect_chunk(*pending.popleft())
+
+    def _submit_chunk(self, executor, chunk, preprocess):
+        """キャッシュにない本文だけをワーカーに送る"""
+        texts = [preprocess(message.text) if preprocess else message.text for message in chunk]
+        results = [self.cache.get(text) if self.cache is not None else None for text in texts]
+        missing = [i for i, words in enumerate(results) if words is None]
+        future = executor.submit(_parse_chunk, [texts[i] for i in missing]) if missing else None
+        return chunk, texts, results, missing, future
+
+    def _collect_chunk(self, chunk, texts, results, missing, future):
+        """ワーカーの解析結果をキャッシュ済みの結果と入力順に組み合わせる"""
+        if future is not None:
+            for i, words in zip(missing, future.result()):
+                results[i] = words
+                if self.cache is not None:
+                    self.cache.put(texts[i], words)
+        return zip(chunk, results)
+
+    def flush(self):
+        """キャッシュをディスクに保存"""
+        if self._cache is not None:
+            self._cache.flush()
+
+    def close(self):
+        """キャッシュを保存して閉じる"""
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+        self.cache_path = None
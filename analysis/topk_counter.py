@@ -0,0 +1,155 @@
+import heapq
+from collections import Counter
+from itertools import chain
+
+# 既定で追跡する語の数
+DEFAULT_CAPACITY = 50000
+
+
+class SpaceSavingCounter:
+    """一定のメモリで出現回数の多い語を数える Space-Saving カウンター
+
+    追跡する語は最大 capacity 語。追跡中の語の出現は正確に数え、枠が埋まった後に
+    新しい語が現れると、回数が最小の語を置き換えて「最小回数 + 1」から数え始める。
+    そのため各語の回数は真の回数以上の推定値で、過大評価は error 以下
+    （error は置き換え時の最小回数で、どの語についても 総数 / capacity 以下）。
+    真の回数が最小回数を超える語は必ず追跡されている。
+    語数が capacity 以下のうちは、すべての回数が正確（error は 0）。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # (追加時点の回数, 語) の最小ヒープ。各語につき1件で、回数は現在の回数以下
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, item, count=1):
+        """語の出現を加える"""
+        self.total += count
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+            return
+        if len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+
+        minimum, evicted = self._pop_minimum()
+        del counts[evicted]
+        del self.errors[evicted]
+        counts[item] = minimum + count
+        self.errors[item] = minimum
+        heapq.heappush(self._heap, (minimum + count, item))
+
+    def update(self, items):
+        """語のイテラブルの出現をまとめて加える"""
+        for item in items:
+            self.add(item)
+
+    def _pop_minimum(self):
+        """回数が最小の語をヒープから取り出す（古い回数のままの要素は積み直す）"""
+        heap = self._heap
+        counts = self.counts
+        while True:
+            count, item = heap[0]
+            current = counts[item]
+            if current == count:
+                heapq.heappop(heap)
+                return count, item
+            heapq.heapreplace(heap, (current, item))
+
+    def minimum(self):
+        """追跡中の語の最小回数（追跡されていない語の真の回数の上限）"""
+        if len(self.counts) < self.capacity:
+            return 0
+        count, item = self._pop_minimum()
+        heapq.heappush(self._heap, (count, item))
+        return count
+
+    def top(self, k):
+        """推定回数の多い順に (語, 推定回数, 誤差の上限) を k 件返す"""
+        items = heapq.nlargest(k, self.counts.items(), key=lambda item: item[1])
+        return [(item, count, self.errors[item]) for item, count in items]
+
+    def candidates(self, k):
+        """真の上位 k 語になり得る語の集合（追跡されていない語も候補になり得る場合は None）
+
+        推定回数が、k 番目に大きい下限（推定回数 - 誤差）以上の語をすべて含む。
+        追跡されていない語の真の回数は最小回数以下のため、k 番目に大きい下限が最小回数以下の場合は
+        置き換えられた語も上位に入り得るとして None を返す（全語を数え直す必要がある）。
+        """
+        minimum = self.minimum()
+        if len(self.counts) < k:
+            return set(self.counts) if minimum == 0 else None
+        lower_bounds = heapq.nlargest(k, (count - self.errors[item] for item, count in self.counts.items()))
+        threshold = lower_bounds[-1]
+        if threshold <= minimum:
+            return None
+        return {item for item, count in self.counts.items() if count >= threshold}
+
+    def is_exact(self):
+        """すべての回数が正確かどうか（一度も置き換えが起きていない）"""
+        return not any(self.errors.values())
+
+    def merge(self, other):
+        """別のカウンターの集計を加える（並列・分割処理の結果の統合用）
+
+        片方にしかない語は、もう片方の最小回数を誤差として加えたうえで、
+        推定回数の多い capacity 語を残す。
+        """
+        own_minimum = self.minimum()
+        other_minimum = other.minimum()
+        counts = {}
+        errors = {}
+        # 同じ回数の語の順序が実行ごとに変わらないよう、自分の語、相手にだけある語の順に並べる
+        items = chain(self.counts, (item for item in other.counts if item not in self.counts))
+        for item in items:
+            count = self.counts.get(item, own_minimum) + other.counts.get(item, other_minimum)
+            error = self.errors.get(item, own_minimum) + other.errors.get(item, other_minimum)
+            counts[item] = count
+            errors[item] = error
+
+        kept = heapq.nlargest(self.capacity, counts.items(), key=lambda item: item[1])
+        self.total += other.total
+        self.counts = dict(kept)
+        self.errors = {item: errors[item] for item in self.counts}
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def to_dict(self):
+        """チェックポイント保存用の辞書に変換"""
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'counts': self.counts,
+            'errors': {item: error for item, error in self.errors.items() if error}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict の辞書から復元"""
+        counter = cls(data['capacity'])
+        counter.total = data['total']
+        counter.counts = dict(data['counts'])
+        counter.errors = {item: data['errors'].get(item, 0) for item in counter.counts}
+        counter._heap = [(count, item) for item, count in counter.counts.items()]
+        heapq.heapify(counter._heap)
+        return counter
+
+
+def recount(candidates, token_lists):
+    """候補の語だけを正確に数え直す（candidates が None の場合はすべての語を数える）"""
+    counts = Counter()
+    for tokens in token_lists:
+        if candidates is None:
+            counts.update(tokens)
+        else:
+            counts.update(token for token in tokens if token in candidates)
+    return counts
@@ -0,0 +1,171 @@
+import base64
+from array import array
+from datetime import date
+
+# 時刻のないメッセージの日付番号
+NO_DAY = -1
+
+# 集計の単位と（表の見出し, 区間の列名）
+TREND_UNITS = {
+    'day': ('日別の推移', '日付'),
+    'week': ('週別の推移', '週の開始日（月曜日）'),
+    'user': ('ユーザー別の件数', 'ユーザー')
+}
+
+
+def encode_array(values):
+    """array をチェックポイント保存用の文字列に変換"""
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+
+def decode_array(typecode, data):
+    """encode_array で変換した文字列を array に戻す"""
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    return values
+
+
+def week_start(days):
+    """日付番号（date.toordinal()）の配列を、その週の月曜日の日付番号に変換"""
+    # 日付番号 1（西暦1年1月1日）は月曜日
+    return days - (days - 1) % 7
+
+
+def bucket_counts(buckets, keys, key_count):
+    """ヒットごとの区間とキーから、区間 × キーの件数表を求める"""
+    import numpy as np
+    values, inverse = np.unique(buckets, return_inverse=True)
+    counts = np.bincount(inverse.ravel() * key_count + keys, minlength=len(values) * key_count)
+    return values, counts.reshape(len(values), key_count)
+
+
+class TrendCounter:
+    """パターン・カテゴリのヒットを、メッセージの日付・週・ユーザーごとに集計する
+
+    ヒットは (メッセージ番号, キー番号) の列として array に蓄積し、
+    集計時に NumPy の bincount で件数表をまとめて求める（NumPy は起動を速くするため集計時に読み込む）。
+    メッセージはヒットがあったものだけを日付番号・ユーザー番号の列に記録する。
+    """
+
+    def __init__(self, labels):
+        self.labels = list(labels)
+        self.key_ids = {label: i for i, label in enumerate(self.labels)}
+        self.users = []
+        self.user_ids = {}
+        # メッセージごとの列
+        self.days = array('i')
+        self.message_users = array('I')
+        # ヒットごとの列
+        self.hit_messages = array('I')
+        self.hit_keys = array('I')
+
+    def add(self, message, keys):
+        """1メッセージ分のヒットのキー（パターンまたはカテゴリ）のリストを追加"""
+        if not keys:
+            return
+        user = message.user or ''
+        user_id = self.user_ids.get(user)
+        if user_id is None:
+            user_id = self.user_ids[user] = len(self.users)
+            self.users.append(user)
+
+        message_id = len(self.days)
+        self.days.append(message.ts.toordinal() if message.ts else NO_DAY)
+        self.message_users.append(user_id)
+        key_ids = self.key_ids
+        self.hit_keys.extend(key_ids[key] for key in keys)
+        self.hit_messages.extend([message_id] * len(keys))
+
+    def totals(self):
+        """キーごとのヒット件数"""
+        import numpy as np
+        keys = np.frombuffer(self.hit_keys, dtype=np.uint32)
+        return np.bincount(keys, minlength=len(self.labels))
+
+    def counts(self, unit):
+        """集計単位（day / week / user）ごとの (区間名のリスト, 区間 × キーの件数表) を返す
+
+        日付・週の集計では時刻のないメッセージを除く。区間は日付順、ユーザーは件数の多い順。
+        """
+        import numpy as np
+        messages = np.frombuffer(self.hit_messages, dtype=np.uint32)
+        keys = np.frombuffer(self.hit_keys, dtype=np.uint32).astype(np.int64)
+
+        if unit == 'user':
+            buckets = np.frombuffer(self.message_users, dtype=np.uint32)[messages]
+            values, counts = bucket_counts(buckets, keys, len(self.labels))
+            order = np.argsort(-counts.sum(axis=1), kind='stable')
+            return [self.users[value] or '不明' for value in values[order]], counts[order]
+
+        days = np.frombuffer(self.days, dtype=np.int32)[messages].astype(np.int64)
+        timed = days != NO_DAY
+        buckets = days[timed]
+        if unit == 'week':
+            buckets = week_start(buckets)
+        values, counts = bucket_counts(buckets, keys[timed], len(self.labels))
+        return [date.fromordinal(int(value)).isoformat() for value in values], counts
+
+    def write_tables(self, f, heading='###', max_columns=10):
+        """日別・週別・ユーザー別の件数表をマークダウンで書き出す
+
+        列はヒット件数の多いキーから max_columns 個まで（合計列は全キーの件数）。
+        """
+        import numpy as np
+        totals = self.totals()
+        columns = [i for i in np.argsort(-totals, kind='stable')[:max_columns] if totals[i] > 0]
+        labels = [self.labels[i] for i in columns]
+
+        for unit, (title, column) in TREND_UNITS.items():
+            names, counts = self.counts(unit)
+            f.write(f'{heading} {title}\n')
+            if not names:
+                f.write('該当なし\n\n')
+                continue
+            f.write(f'| {column} | 合計 | ' + ' | '.join(labels) + ' |\n')
+            f.write('|---|---:|' + '---:|' * len(labels) + '\n')
+            row_totals = counts.sum(axis=1)
+            selected = counts[:, columns]
+            for name, total, row in zip(names, row_totals.tolist(), selected.tolist()):
+                f.write(f'| {name} | {total} | ' + ' | '.join(map(str, row)) + ' |\n')
+            f.write('\n')
+
+    def merge(self, other):
+        """別のカウンターのヒットを加える（チャンネルごとの集計結果の統合用）"""
+        if other.labels != self.labels:
+            raise ValueError('集計するキーが異なるカウンターはまとめられません')
+        user_ids = []
+        for user in other.users:
+            user_id = self.user_ids.get(user)
+            if user_id is None:
+                user_id = self.user_ids[user] = len(self.users)
+                self.users.append(user)
+            user_ids.append(user_id)
+
+        offset = len(self.days)
+        self.days.extend(other.days)
+        self.message_users.extend(user_ids[user_id] for user_id in other.message_users)
+        self.hit_messages.extend(message_id + offset for message_id in other.hit_messages)
+        self.hit_keys.extend(other.hit_keys)
+
+    def to_dict(self):
+        """チェックポイント保存用の辞書に変換"""
+        return {
+            'labels': self.labels,
+            'users': self.users,
+            'days': encode_array(self.days),
+            'message_users': encode_array(self.message_users),
+            'hit_messages': encode_array(self.hit_messages),
+            'hit_keys': encode_array(self.hit_keys)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict の辞書から復元"""
+        counter = cls(data['labels'])
+        counter.users = list(data['users'])
+        counter.user_ids = {user: i for i, user in enumerate(counter.users)}
+        counter.days = decode_array('i', data['days'])
+        counter.message_users = decode_array('I', data['message_users'])
+        counter.hit_messages = decode_array('I', data['hit_messages'])
+        counter.hit_keys = decode_array('I', data['hit_keys'])
+        return counter
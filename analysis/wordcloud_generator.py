@@ -1,82 +1,268 @@
-import re
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import japanize_matplotlib
 import argparse
-import MeCab
-
-def extract_text_from_markdown(markdown_file):
-    """マークダウンファイルからテキストを抽出"""
-    with open(markdown_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # コードブロック内のテキストを抽出
-    text_blocks = re.findall(r'```\n(.*?)\n```', content, re.DOTALL)
-    return '\n'.join(text_blocks)
-
-def preprocess_text(text):
-    """テキストの前処理"""
-    # メンション、URL、絵文字などを削除
-    text = re.sub(r'<@[A-Z0-9]+>', '', text)  # メンション
-    text = re.sub(r'https?://\S+', '', text)  # URL
-    text = re.sub(r':[a-z_]+:', '', text)     # 絵文字
-    
-    # MeCabで形態素解析（設定ファイルと辞書のパスを明示的に指定）
-    mecab = MeCab.Tagger('-d /opt/homebrew/lib/mecab/dic/ipadic -r /opt/homebrew/etc/mecabrc')
-    node = mecab.parseToNode(text)
-    
-    # 名詞のみを抽出
-    words = []
-    while node:
-        if node.feature.split(',')[0] == '名詞':
-            words.append(node.surface)
-        node = node.next
-    
-    return ' '.join(words)
-
-def generate_wordcloud(text, output_file):
-    """ワードクラウドを生成"""
-    # フォントパスの設定（Macの場合）
-    font_path = '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc'
-    
-    # ワードクラウドの生成
-    wordcloud = WordCloud(
-        font_path=font_path,
-        width=1200,
-        height=800,
-        background_color='white',
-        max_words=200,
-        min_font_size=10,
-        max_font_size=100,
-        random_state=42,
-        collocations=False  # 重複を許可
-    )
-    
-    # テキストからワードクラウドを生成
-    wordcloud.generate(text)
-    
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from slack_export_reader import add_filter_arguments, open_messages
+from tokenizer import NounTokenizer, add_mecab_arguments, apply_mecab_arguments, clean_text, dictionary_identity
+from token_cache import DEFAULT_MAX_BYTES
+from profiler import NULL_PROFILER, add_profile_arguments, create_profiler, write_profile
+
+# フォントパスの設定（Macの場合）
+FONT_PATH = '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc'
+
+# ワードクラウドの設定（プレビューは縮小して matplotlib を介さずに保存する）
+WORDCLOUD_OPTIONS = {
+    'width': 1200,
+    'height': 800,
+    'background_color': 'white',
+    'max_words': 200,
+    'min_font_size': 10,
+    'max_font_size': 100,
+    'random_state': 42,
+    'collocations': False  # 重複を許可
+}
+PREVIEW_OPTIONS = dict(WORDCLOUD_OPTIONS, width=600, height=400, min_font_size=5, max_font_size=50)
+
+FREQUENCY_TABLE_VERSION = 1
+
+# 一括生成でまとめる単位
+BATCH_UNITS = ['channel', 'month']
+
+def month_of(message):
+    """メッセージの投稿月（YYYY-MM、時刻のないメッセージは unknown）"""
+    return message.ts.strftime('%Y-%m') if message.ts else 'unknown'
+
+def count_frequencies(messages, tokenizer, group, profiler=NULL_PROFILER):
+    """メッセージの名詞の出現回数表を group(メッセージ) の値ごとに作る
+
+    表は名詞が最初に現れた順に並ぶ（同じ回数の語の並びを本文から生成した場合と揃えるため）。
+    """
+    tables = defaultdict(Counter)
+    tokenized = tokenizer.tokenize_messages(messages, preprocess=clean_text)
+    for message, nouns in profiler.iterate('tokenize', tokenized):
+        tables[group(message)].update(nouns)
+    with profiler.stage('tokenize'):
+        tokenizer.flush()
+    return dict(tables)
+
+def normalize_frequencies(frequencies, wordcloud):
+    """出現回数表に WordCloud.process_text と同じ語の分割・除外・表記の統一を適用
+
+    空白区切りの本文を generate() に渡した場合と同じ出現回数を、本文を作らずに求める。
+    """
+    pattern = r"\w[\w']*" if wordcloud.min_word_length <= 1 else r"\w[\w']+"
+    regexp = re.compile(wordcloud.regexp if wordcloud.regexp is not None else pattern)
+    stopwords = {word.lower() for word in wordcloud.stopwords}
+
+    # 小文字の表記ごとに、各表記の出現回数を数える
+    cases = defaultdict(dict)
+    for word, count in frequencies.items():
+        for token in regexp.findall(word):
+            if token.lower().endswith("'s"):
+                token = token[:-2]
+            if not wordcloud.include_numbers and token.isdigit():
+                continue
+            if wordcloud.min_word_length and len(token) < wordcloud.min_word_length:
+                continue
+            if token.lower() in stopwords:
+                continue
+            case_counts = cases[token.lower()]
+            case_counts[token] = case_counts.get(token, 0) + count
+
+    # 末尾に s の付いた語を単数形にまとめる
+    if wordcloud.normalize_plurals:
+        for key in list(cases):
+            if key.endswith('s') and not key.endswith('ss') and key[:-1] in cases:
+                singular = cases[key[:-1]]
+                for token, count in cases.pop(key).items():
+                    singular[token[:-1]] = singular.get(token[:-1], 0) + count
+
+    # 最も多い表記に統一
+    return {max(case_counts.items(), key=lambda item: item[1])[0]: sum(case_counts.values())
+            for case_counts in cases.values()}
+
+def generate_wordcloud_from_frequencies(frequencies, output_file, preview=False, profiler=NULL_PROFILER):
+    """名詞の出現回数表からワードクラウドを生成
+
+    preview を指定すると低解像度で描画し、matplotlib を介さずに直接保存する。
+    """
+    # 描画用のライブラリは読み込みに時間がかかるため、描画するときに読み込む
+    from wordcloud import WordCloud
+    wordcloud = WordCloud(font_path=FONT_PATH, **(PREVIEW_OPTIONS if preview else WORDCLOUD_OPTIONS))
+
+    # 出現回数からワードクラウドを生成
+    with profiler.stage('layout'):
+        wordcloud.generate_from_frequencies(normalize_frequencies(frequencies, wordcloud))
+
+    if preview:
+        with profiler.stage('savefig'):
+            wordcloud.to_file(output_file)
+        return
+
     # プロットの設定
-    plt.figure(figsize=(15, 10))
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis('off')
-    
+    import matplotlib.pyplot as plt
+    import japanize_matplotlib
+    with profiler.stage('render'):
+        plt.figure(figsize=(15, 10))
+        plt.imshow(wordcloud, interpolation='bilinear')
+        plt.axis('off')
+
     # 保存
-    plt.savefig(output_file, bbox_inches='tight', dpi=300)
-    plt.close()
+    with profiler.stage('savefig'):
+        plt.savefig(output_file, bbox_inches='tight', dpi=300)
+        plt.close()
+
+def save_frequencies(path, tables, source=None):
+    """出現回数表（{グループ: {語: 回数}}）を JSON で保存"""
+    data = {'version': FREQUENCY_TABLE_VERSION, 'source': source,
+            'tables': {str(name): dict(table) for name, table in tables.items()}}
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temporary_path, path)
+
+def load_frequencies(path):
+    """save_frequencies で保存した (出現回数表, 元データの情報) を読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != FREQUENCY_TABLE_VERSION:
+        raise ValueError(f'未対応の出現回数表の形式です: {path}')
+    return {name: Counter(table) for name, table in data['tables'].items()}, data['source']
+
+def source_signature(path, batch, tokenizer, since=None, until=None, users=None):
+    """入力の更新を検出するための情報（パス・サイズ・更新日時・まとめ方・絞り込み・辞書）"""
+    # メッセージストアは追記時に更新されるメタ情報で判定する
+    target = os.path.join(path, 'meta.json') if os.path.isdir(path) else path
+    stat = os.stat(target)
+    return {
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'batch': batch,
+        'filters': [since.isoformat() if since else None, until.isoformat() if until else None, users],
+        'dictionary': dictionary_identity(tokenizer.mecab)
+    }
+
+def build_tables(input_file, batch, tokenizer, profiler=NULL_PROFILER, since=None, until=None, users=None):
+    """1つの入力から出現回数表を作る（batch が channel / month の場合はその単位ごと。期間・ユーザーで絞り込み可能）"""
+    if batch == 'channel' and os.path.isdir(input_file):
+        # メッセージストアはチャンネルごとに読み出す
+        from message_store import MessageStore, iter_store_messages
+        with MessageStore(input_file) as store:
+            channels = list(store.channels)
+        tables = {}
+        for channel in channels:
+            messages = profiler.iterate('read', iter_store_messages(input_file, since, until, users, [channel]))
+            tables.update(count_frequencies(messages, tokenizer, lambda message: channel, profiler))
+        return tables
+
+    if batch == 'month':
+        group = month_of
+    elif batch == 'channel':
+        # エクスポートは1ファイル1チャンネル
+        from message_store import channel_from_filename
+        channel = channel_from_filename(input_file)
+        group = lambda message: channel
+    else:
+        group = lambda message: 'all'
+    messages = profiler.iterate('read', open_messages(input_file, since, until, users))
+    return count_frequencies(messages, tokenizer, group, profiler)
+
+def load_tables(input_file, batch, tokenizer, cache_dir=None, profiler=NULL_PROFILER,
+                since=None, until=None, users=None):
+    """入力の出現回数表を返す（cache_dir に入力・絞り込みが変わっていない表があれば再利用）"""
+    if input_file.endswith('.json'):
+        tables, _ = load_frequencies(input_file)
+        return tables
+    if not cache_dir:
+        return build_tables(input_file, batch, tokenizer, profiler, since, until, users)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.basename(os.path.normpath(input_file))
+    cache_path = os.path.join(cache_dir, f'{name}.{batch or "all"}.json')
+    signature = source_signature(input_file, batch, tokenizer, since, until, users)
+    if os.path.exists(cache_path):
+        tables, source = load_frequencies(cache_path)
+        if source == signature:
+            return tables
+    tables = build_tables(input_file, batch, tokenizer, profiler, since, until, users)
+    save_frequencies(cache_path, tables, signature)
+    return tables
+
+def merge_tables(tables_list):
+    """複数の入力の出現回数表をグループごとに合算"""
+    merged = defaultdict(Counter)
+    for tables in tables_list:
+        for name, table in tables.items():
+            merged[name].update(table)
+    return dict(merged)
+
+def _render(args):
+    """プロセスプールで1つのワードクラウドを生成"""
+    frequencies, output_file, preview = args
+    generate_wordcloud_from_frequencies(frequencies, output_file, preview)
+    return output_file
+
+def render_batch(tables, output_dir, preview=False, workers=1):
+    """グループごとのワードクラウドを生成し、出力ファイルのパスを返す（workers 個のプロセスで並列生成）"""
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(table, os.path.join(output_dir, f'wordcloud_{name}.png'), preview)
+             for name, table in sorted(tables.items()) if table]
+    if workers <= 1:
+        return [_render(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render, tasks))
 
 def main():
     parser = argparse.ArgumentParser(description='Slack履歴からワードクラウドを生成')
-    parser.add_argument('input_file', help='入力マークダウンファイルのパス')
+    parser.add_argument('input_files', nargs='+',
+                        help='入力マークダウンファイル・メッセージストア、または保存済みの出現回数表（.json）のパス')
     parser.add_argument('--output', '-o', default='wordcloud.png', help='出力ファイルのパス')
+    parser.add_argument('--token-cache', help='形態素解析結果のキャッシュファイルのパス')
+    parser.add_argument('--token-cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='キャッシュの上限サイズ（MB）')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析を並列実行するプロセス数')
+    parser.add_argument('--save-frequencies', help='名詞の出現回数表を保存する JSON ファイルのパス')
+    parser.add_argument('--frequency-cache', help='入力ごとの出現回数表を保存・再利用するディレクトリ')
+    parser.add_argument('--preview', action='store_true', help='低解像度で素早く生成する')
+    parser.add_argument('--batch', choices=BATCH_UNITS, help='チャンネルごと・月ごとにワードクラウドを生成する')
+    parser.add_argument('--output-dir', default='wordclouds', help='--batch 指定時の出力ディレクトリ')
+    parser.add_argument('--render-workers', type=int, default=1, help='--batch 指定時に並列で描画するプロセス数')
+    add_filter_arguments(parser)
+    add_profile_arguments(parser)
+    add_mecab_arguments(parser)
     args = parser.parse_args()
-    
-    # テキストの抽出と前処理
-    text = extract_text_from_markdown(args.input_file)
-    processed_text = preprocess_text(text)
-    
+    apply_mecab_arguments(args)
+    filtered = args.since or args.until or args.users
+    if filtered and any(input_file.endswith('.json') for input_file in args.input_files):
+        parser.error('保存済みの出現回数表（.json）は --since / --until / --user で絞り込めません')
+
+    # 入力ごとの名詞の出現回数表を用意（キャッシュがあれば再利用）
+    profiler = create_profiler(args)
+    tokenizer = NounTokenizer(args.token_cache, args.token_cache_size * 1024 * 1024, workers=args.workers)
+    tables = merge_tables(load_tables(input_file, args.batch, tokenizer, args.frequency_cache, profiler,
+                                      args.since, args.until, args.users)
+                          for input_file in args.input_files)
+    tokenizer.close()
+    if args.save_frequencies:
+        save_frequencies(args.save_frequencies, tables)
+        print(f'出現回数表を保存しました: {args.save_frequencies}')
+
     # ワードクラウドの生成
-    generate_wordcloud(processed_text, args.output)
-    print(f'ワードクラウドを生成しました: {args.output}')
+    if args.batch:
+        with profiler.stage('render_batch', items_in=len(tables)):
+            paths = render_batch(tables, args.output_dir, args.preview, args.render_workers)
+        for path in paths:
+            print(f'ワードクラウドを生成しました: {path}')
+    else:
+        frequencies = Counter()
+        for table in tables.values():
+            frequencies.update(table)
+        generate_wordcloud_from_frequencies(frequencies, args.output, args.preview, profiler)
+        print(f'ワードクラウドを生成しました: {args.output}')
+    write_profile(profiler, args)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()